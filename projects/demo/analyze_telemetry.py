@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+遥测日志离线分析
+
+流式读取 log/telemetry.log 以及轮转后的压缩分段，按 request_id 关联
+api.request.* 和 llm.call.* 事件，统计：
+- 每个路由的请求耗时 p50/p90/p99 和错误率（流式接口按请求的最后一个事件计算总耗时）
+- 每个模型/阶段的 LLM 调用耗时、首字时间分位数和错误率
+- 最慢的请求（以及其中 LLM 调用的次数和耗时）
+
+各分段（以及较大的未压缩文件按字节范围切分出的分块）由进程池并行处理；
+分位数用对数分桶直方图计算（相对误差约 1%），未结束的请求只保留最近
+--window 秒内活跃的部分，内存占用与日志大小无关。
+
+使用方法：
+    python analyze_telemetry.py [--since 1d] [--until 1h] [--top 10] [--json] [--workers 8] [文件 ...]
+"""
+
+import argparse
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from telemetry import LOG_FILE
+from telemetry_segments import SegmentStore, parse_time
+
+# 未压缩文件超过该大小时按字节范围切分给多个进程
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# 只解析这两类事件，其余行用子串预筛跳过
+_RELEVANT = (b'"api.request.', b'"llm.call.')
+
+_DECODE = json.JSONDecoder().decode
+
+# 旧日志没有 rule 字段时，把路径中的 id 参数替换掉，避免每个 id 单独成组
+_ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F-]{16,})$")
+
+
+def normalize_route(path: Optional[str]) -> Optional[str]:
+    """把 /history/550e8400-... 这类路径归并为 /history/<id>"""
+    if not path:
+        return path
+    return "/".join(
+        "<id>" if _ID_SEGMENT.match(part) else part for part in path.split("/")
+    )
+
+
+class LogHistogram:
+    """对数分桶直方图（可合并），分位数的相对误差约为 (GAMMA - 1) / 2"""
+
+    GAMMA = 1.02
+    _LOG_GAMMA = math.log(GAMMA)
+
+    __slots__ = ("buckets", "count", "max")
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value: float):
+        value = max(float(value), 0.0)
+        key = math.ceil(math.log(value) / self._LOG_GAMMA) if value > 1 else 0
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "LogHistogram"):
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q 取 0~1；没有数据时返回None"""
+        if not self.count:
+            return None
+        rank = max(math.ceil(q * self.count), 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen >= rank:
+                # 取桶 (GAMMA^(k-1), GAMMA^k] 的中点
+                value = self.GAMMA**key * 2 / (1 + self.GAMMA)
+                return round(min(value, self.max), 1)
+        return round(self.max, 1)
+
+
+class _Stats:
+    """一组调用的次数、错误数和耗时分布"""
+
+    __slots__ = ("count", "errors", "latency", "ttft")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.latency = LogHistogram()
+        self.ttft = LogHistogram()
+
+    def add(self, latency_ms, error: bool, ttft_ms=None):
+        self.count += 1
+        self.errors += bool(error)
+        if latency_ms is not None:
+            self.latency.add(latency_ms)
+        if ttft_ms is not None:
+            self.ttft.add(ttft_ms)
+
+    def merge(self, other: "_Stats"):
+        self.count += other.count
+        self.errors += other.errors
+        self.latency.merge(other.latency)
+        self.ttft.merge(other.ttft)
+
+    def report(self) -> Dict:
+        result = {
+            "count": self.count,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.count, 4) if self.count else 0,
+            "p50_ms": self.latency.percentile(0.5),
+            "p90_ms": self.latency.percentile(0.9),
+            "p99_ms": self.latency.percentile(0.99),
+            "max_ms": round(self.latency.max, 1) if self.latency.count else None,
+        }
+        if self.ttft.count:
+            result["ttft_p50_ms"] = self.ttft.percentile(0.5)
+            result["ttft_p90_ms"] = self.ttft.percentile(0.9)
+            result["ttft_p99_ms"] = self.ttft.percentile(0.99)
+        return result
+
+
+def _new_request(ts: float) -> Dict:
+    return {
+        "first_ts": ts,
+        "last_ts": ts,
+        "route": None,
+        "method": None,
+        "status": None,
+        "duration_ms": None,
+        "error": False,
+        "llm_calls": 0,
+        "llm_ms": 0,
+    }
+
+
+def _merge_request(target: Dict, other: Dict):
+    """合并同一请求在不同分块中的部分"""
+    target["first_ts"] = min(target["first_ts"], other["first_ts"])
+    target["last_ts"] = max(target["last_ts"], other["last_ts"])
+    for key in ("route", "method", "status", "duration_ms"):
+        if other[key] is not None:
+            target[key] = other[key]
+    target["error"] = target["error"] or other["error"]
+    target["llm_calls"] += other["llm_calls"]
+    target["llm_ms"] += other["llm_ms"]
+
+
+class Partial:
+    """一个分块（或合并后全部日志）的统计结果"""
+
+    def __init__(self, top: int = 10):
+        self.top = top
+        self.lines = 0
+        self.events = 0
+        self.bad_lines = 0
+        self.requests = 0
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self.routes: Dict[str, _Stats] = {}
+        self.llm: Dict[Tuple[str, str], _Stats] = {}
+        self.slowest: List[Tuple[float, str, Dict]] = []  # 最小堆
+        # 开头或结尾处可能跨分块的请求，由合并时补全后再统计
+        self.edges: Dict[str, Dict] = {}
+
+    def finish_request(self, request_id: str, state: Dict):
+        self.requests += 1
+        total_ms = max(
+            state["duration_ms"] or 0, (state["last_ts"] - state["first_ts"]) * 1000
+        )
+        if state["route"] is not None:
+            route = f"{state['method'] or '-'} {state['route']}"
+            self.routes.setdefault(route, _Stats()).add(total_ms, state["error"])
+        self._keep_slowest((total_ms, request_id, state))
+
+    def _keep_slowest(self, entry):
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        elif entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def merge(self, other: "Partial"):
+        self.lines += other.lines
+        self.events += other.events
+        self.bad_lines += other.bad_lines
+        self.requests += other.requests
+        for name in ("first_ts", "last_ts"):
+            values = [v for v in (getattr(self, name), getattr(other, name)) if v]
+            if values:
+                setattr(self, name, (min if name == "first_ts" else max)(values))
+        for target, source in ((self.routes, other.routes), (self.llm, other.llm)):
+            for key, stats in source.items():
+                target.setdefault(key, _Stats()).merge(stats)
+        for entry in other.slowest:
+            self._keep_slowest(entry)
+        for request_id, state in other.edges.items():
+            if request_id in self.edges:
+                _merge_request(self.edges[request_id], state)
+            else:
+                self.edges[request_id] = state
+
+    def finish(self):
+        """所有分块合并后，统计跨分块的请求"""
+        for request_id, state in self.edges.items():
+            self.finish_request(request_id, state)
+        self.edges = {}
+
+    def report(self) -> Dict:
+        def rows(mapping, names):
+            result = []
+            for key, stats in mapping.items():
+                key = key if isinstance(key, tuple) else (key,)
+                result.append({**dict(zip(names, key)), **stats.report()})
+            return sorted(result, key=lambda r: -r["count"])
+
+        return {
+            "lines": self.lines,
+            "events": self.events,
+            "bad_lines": self.bad_lines,
+            "requests": self.requests,
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+            "routes": rows(self.routes, ("route",)),
+            "llm": rows(self.llm, ("model", "stage")),
+            "slowest": [
+                {
+                    "request_id": request_id,
+                    "route": state["route"],
+                    "method": state["method"],
+                    "status": state["status"],
+                    "total_ms": round(total_ms, 1),
+                    "duration_ms": state["duration_ms"],
+                    "llm_calls": state["llm_calls"],
+                    "llm_ms": state["llm_ms"],
+                    "error": state["error"],
+                    "ts": state["first_ts"],
+                }
+                for total_ms, request_id, state in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+
+def _iter_lines(path: str, start: int, end: Optional[int]):
+    """
+    逐行读取文件（二进制）；未压缩文件只读取从 [start, end) 内开始的行
+    """
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            yield from f
+        return
+    with open(path, "rb") as f:
+        if start:
+            # 从 start-1 读到行尾：上一分块负责跨越边界的那一行
+            f.seek(start - 1)
+            f.readline()
+        while end is None or f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield line
+
+
+def analyze_chunk(task: Tuple) -> Partial:
+    """处理一个分块（在进程池中执行）"""
+    path, start, end, since, until, window, top = task
+    partial = Partial(top)
+    # 按最后活跃时间排序（OrderedDict 反复移动和弹出队首都是 O(1)）
+    pending: "OrderedDict[str, Dict]" = OrderedDict()
+    chunk_start = None
+    now = swept = 0.0
+
+    def finish(request_id, state):
+        if state["first_ts"] < chunk_start + window:
+            partial.edges[request_id] = state  # 可能从上一个分块开始
+        else:
+            partial.finish_request(request_id, state)
+
+    try:
+        lines = _iter_lines(path, start, end)
+        for line in lines:
+            partial.lines += 1
+            if not line.endswith(b"\n"):
+                continue  # 写线程正在写入的最后一行
+            if _RELEVANT[0] not in line and _RELEVANT[1] not in line:
+                continue
+            try:
+                payload = _DECODE(line.decode("utf-8"))
+                ts = float(payload["ts"])
+                event = payload["event"]
+            except (ValueError, KeyError, TypeError):
+                partial.bad_lines += 1
+                continue
+            if (since and ts < since) or (until and ts > until):
+                continue
+            partial.events += 1
+            if chunk_start is None:
+                chunk_start = ts
+                partial.first_ts = ts
+            partial.last_ts = now = max(now, ts)
+
+            if event.startswith("llm.call.") and event != "llm.call.start":
+                error = event == "llm.call.error"
+                key = (payload.get("llm_model") or "-", payload.get("stage") or "-")
+                partial.llm.setdefault(key, _Stats()).add(
+                    payload.get("llm_latency_ms"), error, payload.get("ttft_ms")
+                )
+
+            request_id = payload.get("request_id")
+            if not request_id:
+                continue
+            state = pending.get(request_id)
+            if state is None:
+                state = pending[request_id] = _new_request(ts)
+            else:
+                pending.move_to_end(request_id)
+            state["first_ts"] = min(state["first_ts"], ts)
+            state["last_ts"] = max(state["last_ts"], ts)
+            if event.startswith("api.request."):
+                state["route"] = (
+                    payload.get("rule")
+                    or state["route"]
+                    or normalize_route(payload.get("route"))
+                )
+                state["method"] = payload.get("method") or state["method"]
+                if event == "api.request.done":
+                    state["status"] = payload.get("status")
+                    state["duration_ms"] = payload.get("duration_ms")
+                    if (state["status"] or 0) >= 500:
+                        state["error"] = True
+                elif event == "api.request.error":
+                    state["error"] = True
+            elif event == "llm.call.error":
+                state["error"] = True
+                state["llm_calls"] += 1
+                state["llm_ms"] += payload.get("llm_latency_ms") or 0
+            elif event == "llm.call.success":
+                state["llm_calls"] += 1
+                state["llm_ms"] += payload.get("llm_latency_ms") or 0
+
+            # 超过窗口未再出现的请求视为已结束（每秒日志时间检查一次）
+            if now - swept < 1:
+                continue
+            swept = now
+            while pending:
+                oldest_id, oldest = next(iter(pending.items()))
+                if oldest["last_ts"] >= now - window:
+                    break
+                pending.popitem(last=False)
+                finish(oldest_id, oldest)
+    except (OSError, EOFError) as e:
+        print(f"警告: 读取 {path} 失败 - {e}", file=sys.stderr)
+
+    # 结尾处仍在进行的请求可能延续到下一个分块
+    for request_id, state in pending.items():
+        if state["last_ts"] > now - window:
+            partial.edges[request_id] = state
+        else:
+            finish(request_id, state)
+    return partial
+
+
+def build_tasks(paths, since=None, until=None, window=600, top=10, chunk_bytes=CHUNK_BYTES):
+    """把文件切分为任务：压缩文件整体处理，较大的未压缩文件按字节范围切分"""
+    tasks = []
+    for path in paths:
+        path = str(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        if path.endswith(".gz") or size <= chunk_bytes:
+            tasks.append((path, 0, None, since, until, window, top))
+            continue
+        for start in range(0, size, chunk_bytes):
+            end = min(start + chunk_bytes, size)
+            tasks.append((path, start, end, since, until, window, top))
+    return tasks
+
+
+def analyze(
+    paths=None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    top: int = 10,
+    window: float = 600,
+    workers: Optional[int] = None,
+    chunk_bytes: int = CHUNK_BYTES,
+) -> Dict:
+    """
+    分析遥测日志
+
+    Args:
+        paths: 日志文件列表（.log 或 .log.gz）；为空时读取 log/telemetry.log 及其分段
+        since/until: 时间范围（Unix时间戳），同时用于跳过清单中不相关的分段
+        top: 最慢请求的数量
+        window: 请求超过该秒数没有新事件时视为结束
+        workers: 进程数，默认CPU核数；1 表示在当前进程中处理
+
+    Returns:
+        dict: 统计报告（见 Partial.report）
+    """
+    if not paths:
+        paths = SegmentStore(LOG_FILE).paths(since, until)
+    tasks = build_tasks(paths, since, until, window, top, chunk_bytes)
+    workers = min(workers or os.cpu_count() or 1, len(tasks)) or 1
+
+    total = Partial(top)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for partial in pool.map(analyze_chunk, tasks):
+                total.merge(partial)
+    else:
+        for task in tasks:
+            total.merge(analyze_chunk(task))
+    total.finish()
+
+    report = total.report()
+    report["files"] = len({task[0] for task in tasks})
+    report["chunks"] = len(tasks)
+    return report
+
+
+def _format_ms(value) -> str:
+    return "-" if value is None else f"{value:.0f}"
+
+
+def _print_table(headers, rows):
+    widths = [
+        max([len(str(h))] + [len(str(row[i])) for row in rows])
+        for i, h in enumerate(headers)
+    ]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(v).ljust(w) for v, w in zip(row, widths)))
+
+
+def print_report(report):
+    """以表格形式打印报告"""
+    print(
+        f"文件 {report['files']} 个（{report['chunks']} 个分块），"
+        f"事件 {report['events']} 条，请求 {report['requests']} 个"
+        + (f"，无法解析 {report['bad_lines']} 行" if report["bad_lines"] else "")
+    )
+
+    def stats_row(entry):
+        return [
+            entry["count"],
+            f"{entry['error_rate'] * 100:.1f}%",
+            _format_ms(entry["p50_ms"]),
+            _format_ms(entry["p90_ms"]),
+            _format_ms(entry["p99_ms"]),
+            _format_ms(entry["max_ms"]),
+        ]
+
+    columns = ["count", "err", "p50_ms", "p90_ms", "p99_ms", "max_ms"]
+    print("\n按路由:")
+    _print_table(
+        ["route"] + columns, [[e["route"]] + stats_row(e) for e in report["routes"]]
+    )
+    print("\n按模型/阶段:")
+    _print_table(
+        ["model", "stage"] + columns + ["ttft_p50", "ttft_p99"],
+        [
+            [e["model"], e["stage"]]
+            + stats_row(e)
+            + [_format_ms(e.get("ttft_p50_ms")), _format_ms(e.get("ttft_p99_ms"))]
+            for e in report["llm"]
+        ],
+    )
+    print("\n最慢的请求:")
+    _print_table(
+        ["request_id", "route", "status", "total_ms", "llm_calls", "llm_ms"],
+        [
+            [
+                e["request_id"],
+                f"{e['method'] or '-'} {e['route'] or '-'}",
+                e["status"] if e["status"] is not None else "-",
+                _format_ms(e["total_ms"]),
+                e["llm_calls"],
+                e["llm_ms"],
+            ]
+            for e in report["slowest"]
+        ],
+    )
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="遥测日志离线分析")
+    parser.add_argument(
+        "files", nargs="*", help="日志文件（默认 log/telemetry.log 及其压缩分段）"
+    )
+    parser.add_argument("--since", default=None, help="开始时间（时间戳、ISO 8601 或 1h/2d）")
+    parser.add_argument("--until", default=None, help="结束时间")
+    parser.add_argument("--top", type=int, default=10, help="最慢请求的数量")
+    parser.add_argument("--window", type=float, default=600, help="请求结束判定的空闲秒数")
+    parser.add_argument("--workers", type=int, default=None, help="进程数（默认CPU核数）")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    try:
+        since, until = parse_time(args.since), parse_time(args.until)
+    except ValueError as e:
+        print(f"错误: 时间参数无效 - {e}")
+        sys.exit(2)
+
+    report = analyze(
+        args.files or None,
+        since=since,
+        until=until,
+        top=args.top,
+        window=args.window,
+        workers=args.workers,
+    )
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,21 @@
 import os
 import json
-import time
 import re
-from flask import Flask, request, jsonify, Response, stream_with_context, g, send_file
+import time
+import uuid
+from datetime import date
+from functools import wraps
+from flask import (
+    Flask,
+    request,
+    jsonify,
+    Response,
+    stream_with_context,
+    g,
+    has_request_context,
+    send_file,
+    make_response,
+)
 from flask_cors import CORS
 from flask_jwt_extended import (
     JWTManager,
@@ -13,17 +26,52 @@ from flask_jwt_extended import (
 )
 from dotenv import load_dotenv
 
-from model import Evaluator, Polisher, CommentParser
-from telemetry import log_event, new_request_id, LOG_FILE
+from model import Evaluator, Polisher, CommentParser, add_usage_listener
+from telemetry import (
+    log_event,
+    new_request_id,
+    get_telemetry_policy,
+    get_telemetry_writer,
+    LOG_FILE,
+)
+from telemetry_segments import parse_time
+from tracing import (
+    KIND_SERVER,
+    STATUS_ERROR,
+    get_tracer,
+    load_trace,
+    render_waterfall,
+    start_span,
+)
+from profiling import DEBUG_HEADER, RequestProfiler, profile_reason
+from memory_diagnostics import get_memory_diagnostics, live_objects, rss_bytes
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    PROCESS_RESIDENT_MEMORY,
+    QUEUE_DEPTH,
+    REQUEST_DURATION,
+    STREAMS_IN_FLIGHT,
+    get_metrics_registry,
+)
 from user_models import db, User
-from auth import register_user, authenticate_user, create_tokens, get_current_user
+from auth import (
+    register_user,
+    authenticate_user,
+    create_tokens,
+    get_current_user,
+    admin_required,
+)
 from history_service import (
     save_history,
     get_user_histories,
     get_history_by_id,
     delete_history,
+    search_histories,
 )
-from question_bank import get_question_bank
+from history_writer import HistoryWriter
+from stats_service import get_user_stats
+from usage_service import USAGE_GROUP_FIELDS, get_usage_summary, record_usage
+from question_bank import get_question_registry, QUESTION_RECORD_FIELDS
 
 load_dotenv()
 
@@ -50,6 +98,135 @@ app.config["JWT_REFRESH_TOKEN_EXPIRES"] = False  # 由create_refresh_token控制
 db.init_app(app)
 jwt = JWTManager(app)
 
+# 历史记录后台写入器：流式接口的数据库提交不阻塞SSE输出
+history_writer = HistoryWriter(app)
+# 发送history_saved前等待持久化确认的最长时间（秒）
+HISTORY_ACK_TIMEOUT = float(os.getenv("HISTORY_WRITER_ACK_TIMEOUT", "10"))
+# 重新连接时记录尚未写入（创建仍在写线程队列中）的最长等待时间（秒）
+HISTORY_RECONNECT_WAIT = float(os.getenv("HISTORY_RECONNECT_WAIT", "5"))
+
+QUEUE_DEPTH.set_function(history_writer.qsize, queue="history_writer")
+QUEUE_DEPTH.set_function(get_telemetry_writer().qsize, queue="telemetry")
+PROCESS_RESIDENT_MEMORY.set_function(rss_bytes)
+
+
+def _log_history_write_error(event, **fields):
+    """返回Future回调：后台写入失败时记录遥测（回调在写线程中执行，无请求上下文）"""
+
+    def _callback(future):
+        error = future.exception()
+        if error is not None:
+            log_event(event, error=str(error), error_type=type(error).__name__, **fields)
+
+    return _callback
+
+
+def _record_llm_usage(model_name, stage, prompt_tokens, completion_tokens):
+    """LLM用量监听器：按用户/题目累加到用量汇总表（由历史记录写线程提交）"""
+    if not has_request_context():
+        return
+    user_id = getattr(g, "user_id", None)
+    try:
+        future = history_writer.submit(
+            record_usage,
+            user_id,
+            getattr(g, "question", None),
+            model_name,
+            stage,
+            prompt_tokens,
+            completion_tokens,
+        )
+        future.add_done_callback(
+            _log_history_write_error(
+                "llm.usage.record_error",
+                request_id=getattr(g, "request_id", None),
+                user_id=user_id,
+            )
+        )
+    except RuntimeError as e:
+        log_event(
+            "llm.usage.record_error",
+            request_id=getattr(g, "request_id", None),
+            error=str(e),
+            user_id=user_id,
+        )
+
+
+add_usage_listener(_record_llm_usage)
+
+
+# 题目接口的HTTP缓存时间（秒），过期后客户端用If-None-Match重新验证
+QUESTION_CACHE_MAX_AGE = int(os.getenv("QUESTION_CACHE_MAX_AGE", "60"))
+
+
+def requested_question_ref():
+    """
+    解析请求中的题目：返回 (题库名, 题目id)
+    question参数可以带题库前缀（如 "ielts:12"），否则使用bank参数指定的题库（默认题库）
+    """
+    return get_question_registry().split_ref(
+        request.args.get("question", ""), request.args.get("bank") or None
+    )
+
+
+def current_question_snapshot():
+    """
+    获取本次请求使用的题库快照（每个请求只取一次，热更新不影响进行中的请求）
+    Raises: KeyError 题库不存在
+    """
+    snapshot = g.get("question_snapshot")
+    if snapshot is None:
+        bank_name, _ = requested_question_ref()
+        snapshot = question_snapshot_for(bank_name)
+        g.question_bank_name = bank_name
+        g.question_snapshot = snapshot
+    return snapshot
+
+
+def question_snapshot_for(bank_name):
+    """
+    本次请求使用的指定题库快照（每个请求每个题库只取一次）
+    Raises: KeyError 题库不存在
+    """
+    snapshots = g.setdefault("question_snapshots", {})
+    snapshot = snapshots.get(bank_name)
+    if snapshot is None:
+        snapshot = snapshots[bank_name] = get_question_registry().get(bank_name).snapshot()
+    return snapshot
+
+
+def question_cached(view=None, related_banks=None):
+    """
+    题目接口的条件缓存：ETag为题库名+内容版本，题库不变时响应不变
+    If-None-Match命中时直接返回304，不执行视图函数
+    related_banks: 返回本次请求还引用了哪些题库的函数，这些题库的版本也计入ETag
+    """
+    if view is None:
+        return lambda view: question_cached(view, related_banks)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            snapshot = current_question_snapshot()
+            etag = f"qb-{g.question_bank_name}-{snapshot.version}"
+            for name in sorted(set(related_banks() if related_banks else ())):
+                if name != g.question_bank_name:
+                    etag += f"-{name}-{question_snapshot_for(name).version}"
+        except KeyError as e:
+            return jsonify({"error": e.args[0]}), 404
+        cache_control = f"public, max-age={QUESTION_CACHE_MAX_AGE}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = cache_control
+        return response
+
+    return wrapper
+
 
 # JWT错误处理器
 @jwt.expired_token_loader
@@ -74,35 +251,91 @@ def token_not_fresh_callback(jwt_header, jwt_payload):
 
 @app.before_request
 def _start_request():
+    get_memory_diagnostics().ensure_sampler()
     g.request_id = new_request_id()
     g.start_time = time.perf_counter()
-    log_event(
-        "api.request.start",
-        request_id=g.request_id,
-        route=request.path,
-        method=request.method,
-    )
+    # 请求上下文只解析一次：路由中的get_json会复用Flask缓存的解析结果
+    question = request.args.get("question")
+    if question is None and request.is_json:
+        payload = request.get_json(silent=True)
+        if isinstance(payload, dict):
+            question = payload.get("question")
+    g.question = question if isinstance(question, (str, int)) else None
+    g.user_id = None  # 认证后由路由填写
+    g.log_request = get_telemetry_policy().route_enabled(request.path)
+    if g.log_request:
+        log_event(
+            "api.request.start",
+            request_id=g.request_id,
+            route=request.path,
+            method=request.method,
+        )
+        # 请求的根span；流式响应在输出结束（连接关闭）时才结束
+        g.trace_span = start_span(
+            "http.request",
+            parent=None,
+            kind=KIND_SERVER,
+            trace_id=g.request_id,
+            **{"http.method": request.method, "url.path": request.path},
+        )
+    # 按需性能分析放在最后，只覆盖视图函数和流式输出
+    reason = profile_reason(request.path, request.headers.get(DEBUG_HEADER))
+    if reason:
+        g.profiler = RequestProfiler(g.request_id, request.path, reason)
+        g.profiler.resume()
 
 
 @app.after_request
 def _after_request(response):
+    profiler = g.get("profiler")
+    if profiler is not None:
+        profiler.pause()
+        response.headers["X-Profile-Id"] = g.request_id
+        if response.is_streamed:
+            # 流式响应的生成器在视图返回后才运行，输出结束时再写入结果
+            response.response = profiler.wrap(response.response)
+            response.call_on_close(profiler.finish)
+        else:
+            profiler.finish()
     duration_ms = None
     if hasattr(g, "start_time"):
-        duration_ms = int((time.perf_counter() - g.start_time) * 1000)
-    question = None
-    if request.is_json:
-        payload = request.get_json(silent=True)
-        if isinstance(payload, dict):
-            question = payload.get("question")
-    log_event(
-        "api.request.done",
-        request_id=getattr(g, "request_id", None),
-        route=request.path,
-        method=request.method,
-        status=response.status_code,
-        duration_ms=duration_ms,
-        question=question,
-    )
+        elapsed = time.perf_counter() - g.start_time
+        duration_ms = int(elapsed * 1000)
+        # 按路由规则统计（不用实际路径，避免history_id等参数造成标签爆炸）
+        REQUEST_DURATION.observe(
+            elapsed,
+            route=request.url_rule.rule if request.url_rule else "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
+    if g.get("log_request", True):
+        log_event(
+            "api.request.done",
+            request_id=g.get("request_id"),
+            route=request.path,
+            rule=request.url_rule.rule if request.url_rule else None,
+            method=request.method,
+            status=response.status_code,
+            duration_ms=duration_ms,
+            question=g.get("question"),
+            user_id=g.get("user_id"),
+        )
+    root = g.get("trace_span")
+    if root is not None:
+        root.set_attributes(
+            **{
+                "http.route": request.url_rule.rule if request.url_rule else None,
+                "http.status_code": response.status_code,
+                "app.question": g.get("question"),
+                "app.user_id": g.get("user_id"),
+            }
+        )
+        if response.status_code >= 500:
+            root.status = STATUS_ERROR
+        if response.is_streamed:
+            response.call_on_close(root.end)
+        else:
+            root.end()
     return response
 
 
@@ -116,6 +349,9 @@ def _handle_error(e):
         error_type=type(e).__name__,
         error=str(e),
     )
+    root = g.get("trace_span")
+    if root is not None:
+        root.record_exception(e)
     return jsonify({"error": "internal error"}), 500
 
 
@@ -124,6 +360,23 @@ def health():
     return jsonify({"status": "ok"})
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus 文本格式的指标（多进程部署时合并所有worker）"""
+    return Response(
+        get_metrics_registry().render(), content_type=METRICS_CONTENT_TYPE
+    )
+
+
+def _track_stream(route, stream):
+    """包装SSE生成器，统计正在输出的流数量（客户端断开时同样减少）"""
+    STREAMS_IN_FLIGHT.inc(route=route)
+    try:
+        yield from stream
+    finally:
+        STREAMS_IN_FLIGHT.dec(route=route)
+
+
 # ==================== 用户认证相关路由 ====================
 
 
@@ -221,6 +474,289 @@ def get_history():
         return jsonify({"error": f"获取历史记录失败: {str(e)}"}), 500
 
 
+@app.route("/history/search", methods=["GET"])
+@jwt_required()
+def search_history():
+    """
+    全文检索用户历史记录（需要用户token）
+
+    Query参数:
+        q: 检索关键词，必填
+        page: 页码，默认1
+        per_page: 每页数量，默认20（最大100）
+    """
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({"error": "用户不存在"}), 404
+
+        query = request.args.get("q", "").strip()
+        if not query:
+            return jsonify({"error": "参数 'q' 是必需的"}), 400
+
+        page = request.args.get("page", 1, type=int)
+        per_page = request.args.get("per_page", 20, type=int)
+
+        result = search_histories(user.id, query, page=page, per_page=per_page)
+        return jsonify(result), 200
+    except Exception as e:
+        log_event(
+            "history.search.error",
+            request_id=getattr(g, "request_id", None),
+            error=str(e),
+            error_type=type(e).__name__,
+        )
+        return jsonify({"error": f"检索历史记录失败: {str(e)}"}), 500
+
+
+@app.route("/history/stats", methods=["GET"])
+@jwt_required()
+def get_history_stats():
+    """
+    获取用户评分统计（需要用户token）
+    数据来自增量维护的汇总表，耗时与历史记录数量无关
+
+    Query参数:
+        weeks: 返回最近多少周的趋势，默认12
+    """
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({"error": "用户不存在"}), 404
+
+        weeks = request.args.get("weeks", 12, type=int)
+        result = get_user_stats(user.id, weeks=max(1, min(weeks, 104)))
+        return jsonify(result), 200
+    except Exception as e:
+        log_event(
+            "history.stats.error",
+            request_id=getattr(g, "request_id", None),
+            error=str(e),
+            error_type=type(e).__name__,
+        )
+        return jsonify({"error": f"获取评分统计失败: {str(e)}"}), 500
+
+
+@app.route("/admin/usage", methods=["GET"])
+@admin_required
+def get_token_usage():
+    """
+    LLM token用量汇总（需要管理员token，管理员由ADMIN_USERNAMES配置）
+
+    Query参数:
+        group_by: 分组字段，逗号分隔，可选 day、user、question、model、stage，默认 model,stage
+        since/until: 日期范围（YYYY-MM-DD，含边界）
+        user_id: 只统计该用户（未登录调用记为0）
+        question: 只统计该题目
+        limit: 最多返回的分组数，默认100，最大1000
+
+    Returns:
+        JSON: { group_by, rows: [{..., calls, prompt_tokens, completion_tokens, total_tokens, cost}], totals }
+    """
+    group_by = tuple(
+        f.strip() for f in request.args.get("group_by", "model,stage").split(",") if f.strip()
+    )
+    unknown = [f for f in group_by if f not in USAGE_GROUP_FIELDS]
+    if not group_by or unknown:
+        return (
+            jsonify({"error": f"group_by 只支持: {', '.join(USAGE_GROUP_FIELDS)}"}),
+            400,
+        )
+    try:
+        since, until = (
+            date.fromisoformat(request.args[name]) if request.args.get(name) else None
+            for name in ("since", "until")
+        )
+    except ValueError:
+        return jsonify({"error": "since/until 需为 YYYY-MM-DD 格式"}), 400
+
+    try:
+        result = get_usage_summary(
+            group_by=group_by,
+            since=since,
+            until=until,
+            user_id=request.args.get("user_id", type=int),
+            question=request.args.get("question") or None,
+            limit=min(max(request.args.get("limit", 100, type=int), 1), 1000),
+        )
+        return jsonify(result), 200
+    except Exception as e:
+        log_event(
+            "admin.usage.error",
+            request_id=getattr(g, "request_id", None),
+            error=str(e),
+            error_type=type(e).__name__,
+        )
+        return jsonify({"error": f"获取用量统计失败: {str(e)}"}), 500
+
+
+@app.route("/admin/telemetry/config", methods=["GET", "PUT"])
+@admin_required
+def telemetry_config():
+    """
+    查看/修改遥测策略（需要管理员token，只影响当前进程，重启后恢复环境变量配置）
+
+    PUT请求体（字段均可选，未提供的保持不变）:
+    {
+        "min_level": "info",
+        "event_levels": {"api.request.start": "debug"},
+        "sample_rates": {"api.request.*": 0.1},
+        "route_allow": [],
+        "route_deny": ["/health", "/metrics"]
+    }
+    """
+    policy = get_telemetry_policy()
+    if request.method == "PUT":
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "请求体需为JSON对象"}), 400
+        fields = ("min_level", "event_levels", "sample_rates", "route_allow", "route_deny")
+        try:
+            policy.configure(**{k: data[k] for k in fields if k in data})
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({"error": f"配置无效: {str(e)}"}), 400
+        log_event(
+            "telemetry.config.updated",
+            request_id=g.get("request_id"),
+            user_id=g.get("user_id"),
+            config=policy.snapshot(),
+        )
+    return jsonify(policy.snapshot()), 200
+
+
+# 查看链路时默认只查找最近一天导出的trace，避免请求线程扫描全部压缩分段
+TRACE_DEFAULT_SINCE = "1d"
+
+
+@app.route("/admin/traces/<request_id>", methods=["GET"])
+@admin_required
+def get_trace(request_id):
+    """
+    查看单个请求的链路（需要管理员token）
+
+    Query参数:
+        since: 只查找该时间之后导出的trace（格式同 /telemetry/log，默认 1d）
+        until: 只查找该时间之前导出的trace
+        format: json（默认，返回span列表和瀑布图文本）或 text（只返回瀑布图）
+    """
+    if not re.fullmatch(r"[0-9a-f]{32}", request_id):
+        return jsonify({"error": "request_id 格式无效"}), 400
+    try:
+        since = parse_time(request.args.get("since", TRACE_DEFAULT_SINCE))
+        until = parse_time(request.args.get("until"))
+    except ValueError:
+        return jsonify({"error": "since/until 时间格式不正确"}), 400
+    get_tracer().flush(timeout=2)
+    try:
+        spans = load_trace(request_id, since=since, until=until)
+    except OSError as e:
+        return jsonify({"error": f"读取链路失败: {str(e)}"}), 500
+    if not spans:
+        return jsonify({"error": "找不到该请求的链路"}), 404
+    waterfall = render_waterfall(spans)
+    if request.args.get("format") == "text":
+        return Response(waterfall + "\n", mimetype="text/plain; charset=utf-8")
+    return jsonify({"trace_id": request_id, "spans": spans, "waterfall": waterfall}), 200
+
+
+@app.route("/admin/memory", methods=["GET"])
+@admin_required
+def memory_summary():
+    """
+    内存概况（需要管理员token）：RSS、tracemalloc状态、已保存的快照、
+    存活的CommentParser/Evaluator/Polisher/History/Session数量、解析缓冲区大小和流式生成器
+    """
+    diagnostics = get_memory_diagnostics()
+    return (
+        jsonify(
+            {
+                "pid": os.getpid(),
+                "rss_bytes": rss_bytes(),
+                "tracemalloc": diagnostics.tracing_status(),
+                "snapshots": diagnostics.snapshots(),
+                **live_objects(),
+            }
+        ),
+        200,
+    )
+
+
+@app.route("/admin/memory/tracemalloc", methods=["POST"])
+@admin_required
+def memory_tracing():
+    """
+    开启/关闭tracemalloc（需要管理员token）
+
+    请求体: { "action": "start" | "stop", "frames": 10 }
+    """
+    data = request.get_json(silent=True) or {}
+    diagnostics = get_memory_diagnostics()
+    action = data.get("action")
+    if action == "start":
+        frames = data.get("frames", 10)
+        if not isinstance(frames, int):
+            return jsonify({"error": "frames 需为整数"}), 400
+        status = diagnostics.start_tracing(frames)
+    elif action == "stop":
+        status = diagnostics.stop_tracing()
+    else:
+        return jsonify({"error": "action 需为 start 或 stop"}), 400
+    log_event(
+        "memory.tracemalloc",
+        request_id=g.get("request_id"),
+        user_id=g.get("user_id"),
+        action=action,
+    )
+    return jsonify(status), 200
+
+
+@app.route("/admin/memory/snapshots", methods=["POST"])
+@admin_required
+def memory_snapshot():
+    """
+    保存tracemalloc快照（需要管理员token，需先开启tracemalloc）
+
+    请求体: { "label": "可选说明" }
+    Query参数: limit（返回分配最多的位置数量，默认20）、key_type（lineno/filename/traceback）
+    """
+    data = request.get_json(silent=True) or {}
+    diagnostics = get_memory_diagnostics()
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 200)
+    try:
+        snapshot = diagnostics.take_snapshot(data.get("label"))
+        top = diagnostics.top_allocations(
+            limit, request.args.get("key_type", "lineno"), snapshot["id"]
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({**snapshot, "top": top}), 201
+
+
+@app.route("/admin/memory/snapshots/<int:snapshot_id>/diff", methods=["GET"])
+@admin_required
+def memory_snapshot_diff(snapshot_id):
+    """
+    比较快照（需要管理员token）
+
+    Query参数:
+        against: 另一个快照编号，默认与当前内存比较
+        limit: 返回增长最多的位置数量，默认20
+        key_type: lineno（默认）、filename 或 traceback
+    """
+    try:
+        result = get_memory_diagnostics().compare(
+            snapshot_id,
+            against=request.args.get("against", type=int),
+            limit=min(max(request.args.get("limit", 20, type=int), 1), 200),
+            key_type=request.args.get("key_type", "lineno"),
+        )
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result), 200
+
+
 @app.route("/history/<path:history_id>", methods=["GET"])
 @jwt_required()
 def get_history_detail(history_id):
@@ -265,28 +801,77 @@ def delete_history_route(history_id):
         return jsonify({"error": message}), 400
 
 
+# 日志下载：tail模式最多返回的事件数，以及每次发送的块大小
+TELEMETRY_TAIL_MAX = 10000
+TELEMETRY_CHUNK_SIZE = 64 * 1024
+
+
 @app.route("/logs/telemetry", methods=["GET"])
 def download_logs():
-    """下载遥测日志文件。"""
-    if not LOG_FILE.exists():
+    """下载遥测日志（流式，包含已轮转的压缩分段）
+
+    Query参数:
+        since: 开始时间（Unix时间戳、ISO 8601，或相对时间如 30m、1h、2d）
+        until: 结束时间（格式同since）
+        event: 事件名，逗号分隔；也匹配以 "<事件名>." 开头的事件
+        request_id: 只返回该请求的事件
+        tail: 只返回最后N条匹配的事件（最多10000）
+
+    Returns:
+        text/plain，每行一个JSON事件
+    """
+    try:
+        since = parse_time(request.args.get("since"))
+        until = parse_time(request.args.get("until"))
+    except ValueError:
+        return jsonify({"error": "since/until 时间格式不正确"}), 400
+    tail = request.args.get("tail", type=int)
+    if tail is not None and not 1 <= tail <= TELEMETRY_TAIL_MAX:
+        return jsonify({"error": f"tail 需在 1 到 {TELEMETRY_TAIL_MAX} 之间"}), 400
+    events = [e.strip() for e in request.args.get("event", "").split(",") if e.strip()]
+
+    writer = get_telemetry_writer()
+    if not LOG_FILE.exists() and not writer.segments.segments():
         return jsonify({"error": "log file not found"}), 404
-    # 使用一次性读取避免代理端对流式响应解析错误
-    with open(LOG_FILE, "rb") as f:
-        data = f.read()
-    resp = Response(data, mimetype="text/plain")
+    writer.flush(timeout=1)  # 让刚记录的事件也能下载到
+
+    lines = writer.segments.iter_lines(
+        since=since,
+        until=until,
+        events=events,
+        request_id=request.args.get("request_id") or None,
+        tail=tail,
+    )
+
+    def generate():
+        # 合并为较大的块发送，内存占用与日志大小无关
+        chunk, size = [], 0
+        for line in lines:
+            chunk.append(line)
+            size += len(line)
+            if size >= TELEMETRY_CHUNK_SIZE:
+                yield "".join(chunk)
+                chunk, size = [], 0
+        if chunk:
+            yield "".join(chunk)
+
+    resp = Response(stream_with_context(generate()), mimetype="text/plain")
     resp.headers["Content-Disposition"] = "attachment; filename=telemetry.log"
     resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
     return resp
 
 
 @app.route("/api/question/list", methods=["GET"])
 @app.route("/question/list", methods=["GET"])  # 兼容代理路径
+@question_cached
 def get_question_list():
     """获取题目列表（从题库）
 
     为了兼容前端，返回格式为 { files: string[] }，其中files是题目ID的字符串数组
 
     Query参数:
+        bank: 题库名（可选），默认为默认题库
         only_valid: 是否只返回有效题目，默认true
         offset: 偏移量，默认0
         limit: 限制数量，默认不限制
@@ -298,35 +883,20 @@ def get_question_list():
         JSON: 题目列表
     """
     try:
-        question_bank = get_question_bank()
+        snapshot = current_question_snapshot()
         only_valid = request.args.get("only_valid", "true").lower() == "true"
         offset = request.args.get("offset", 0, type=int)
         limit = request.args.get("limit", None, type=int)
         format_type = request.args.get("format", "simple").lower()
 
-        questions, total = question_bank.get_question_list(
+        # 响应体按参数缓存在题库中，重新加载题库时失效
+        body = snapshot.get_question_list_response(
             only_valid=only_valid,
             offset=offset,
             limit=limit,
+            format_type=format_type,
         )
-
-        if format_type == "detailed":
-            # 返回详细格式
-            return (
-                jsonify(
-                    {
-                        "questions": questions,
-                        "total": total,
-                        "offset": offset,
-                        "limit": limit,
-                    }
-                ),
-                200,
-            )
-        else:
-            # 返回简单格式（兼容前端）：只返回题目ID的字符串数组
-            files = [q["id"] for q in questions]
-            return jsonify({"files": files}), 200
+        return Response(body, status=200, mimetype="application/json")
     except Exception as e:
         log_event(
             "get_question_list.error",
@@ -340,17 +910,163 @@ def get_question_list():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/question/search", methods=["GET"])
+@app.route("/question/search", methods=["GET"])  # 兼容代理路径
+@question_cached
+def search_questions():
+    """检索题目（倒排索引）
+
+    Query参数:
+        bank: 题库名（可选），默认为默认题库
+        q: 关键词，可为空（为空时只按过滤条件返回）
+        subject: 科目过滤
+        professor: 教授名字过滤
+        student: 学生名字过滤
+        only_valid: 是否只返回有效题目，默认true
+        offset: 偏移量，默认0
+        limit: 每页数量，默认20，最大100
+
+    Returns:
+        JSON: { query, results: [...], total, offset, limit, facets: { subject: [{value, count}] } }
+    """
+    try:
+        snapshot = current_question_snapshot()
+        offset = max(request.args.get("offset", 0, type=int), 0)
+        limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+        result = snapshot.search(
+            query=request.args.get("q", "").strip(),
+            subject=request.args.get("subject") or None,
+            professor=request.args.get("professor") or None,
+            student=request.args.get("student") or None,
+            only_valid=request.args.get("only_valid", "true").lower() == "true",
+            offset=offset,
+            limit=limit,
+        )
+        return jsonify(result), 200
+    except Exception as e:
+        log_event(
+            "search_questions.error",
+            request_id=getattr(g, "request_id", None),
+            error=str(e),
+            error_type=type(e).__name__,
+        )
+        return jsonify({"error": str(e)}), 500
+
+
+# 批量接口一次最多返回的题目数量
+QUESTION_BATCH_MAX_IDS = 100
+
+
+def requested_batch_ids():
+    """批量接口请求的题目引用（可重复传ids参数，每个参数内逗号分隔）"""
+    return [
+        qid.strip()
+        for value in request.args.getlist("ids")
+        for qid in value.split(",")
+        if qid.strip()
+    ]
+
+
+def requested_batch_refs():
+    """
+    批量接口请求的题目引用（去重，保持请求顺序）-> 所属题库名
+    不带前缀或前缀不是已注册题库名的引用属于bank参数指定的题库
+    """
+    refs = g.get("question_batch_refs")
+    if refs is None:
+        registry = get_question_registry()
+        default_bank = request.args.get("bank") or None
+        refs = g.question_batch_refs = {
+            ref: registry.split_ref(ref, default_bank)[0]
+            for ref in dict.fromkeys(requested_batch_ids()[:QUESTION_BATCH_MAX_IDS])
+        }
+    return refs
+
+
+@app.route("/api/question/batch", methods=["GET"])
+@app.route("/question/batch", methods=["GET"])  # 兼容代理路径
+@question_cached(related_banks=lambda: requested_batch_refs().values())
+def get_question_batch():
+    """批量获取题目数据
+
+    Query参数:
+        bank: 题库名（可选），默认为默认题库
+        ids: 题目ID，逗号分隔（也可以重复传多个ids参数），最多100个；
+            可以带题库前缀（如 "ielts:12"），返回的id与请求中的写法一致
+        fields: 需要返回的字段，逗号分隔，可选值：
+            subject, instruction, professor, students, is_valid, markdown
+            不传时返回全部字段（id总是返回）
+
+    Returns:
+        JSON: { questions: [...], missing: [不存在或无效的ID] }
+    """
+    try:
+        ids = requested_batch_ids()
+        if not ids:
+            return jsonify({"error": "参数 'ids' 是必需的"}), 400
+        if len(ids) > QUESTION_BATCH_MAX_IDS:
+            return (
+                jsonify({"error": f"一次最多获取 {QUESTION_BATCH_MAX_IDS} 道题目"}),
+                400,
+            )
+
+        fields = None
+        if request.args.get("fields"):
+            fields = [f.strip() for f in request.args["fields"].split(",") if f.strip()]
+            unknown = [
+                f for f in fields if f != "id" and f not in QUESTION_RECORD_FIELDS
+            ]
+            if unknown:
+                return jsonify({"error": f"不支持的字段: {', '.join(unknown)}"}), 400
+            fields = [f for f in fields if f != "id"]
+
+        # 按题库分组批量读取，再按请求顺序组装结果
+        refs = requested_batch_refs()
+        by_bank = {}
+        for ref, bank_name in refs.items():
+            by_bank.setdefault(bank_name, []).append(ref)
+        registry = get_question_registry()
+        found = {}
+        for bank_name, bank_refs in by_bank.items():
+            question_ids = [registry.split_ref(ref, bank_name)[1] for ref in bank_refs]
+            batch = question_snapshot_for(bank_name).get_question_batch(
+                question_ids, fields=fields
+            )
+            records = {record["id"]: record for record in batch["questions"]}
+            for ref, question_id in zip(bank_refs, question_ids):
+                record = records.get(question_id)
+                if record is not None and ref != question_id:
+                    record = dict(record, id=ref)  # 缓存的数据是共享的，不能直接修改
+                found[ref] = record
+
+        questions = [found[ref] for ref in refs if found[ref] is not None]
+        missing = [ref for ref in refs if found[ref] is None]
+        return jsonify({"questions": questions, "missing": missing}), 200
+    except Exception as e:
+        log_event(
+            "get_question_batch.error",
+            request_id=getattr(g, "request_id", None),
+            error=str(e),
+            error_type=type(e).__name__,
+        )
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/question/statistics", methods=["GET"])
 @app.route("/question/statistics", methods=["GET"])  # 兼容代理路径
+@question_cached
 def get_question_statistics():
     """获取题库统计信息
 
+    Query参数:
+        bank: 题库名（可选），默认为默认题库
+
     Returns:
         JSON: 统计信息，包含总数、有效数、无效数
     """
     try:
-        question_bank = get_question_bank()
-        stats = question_bank.get_statistics()
+        snapshot = current_question_snapshot()
+        stats = snapshot.get_statistics()
         return jsonify(stats), 200
     except Exception as e:
         log_event(
@@ -364,12 +1080,14 @@ def get_question_statistics():
 
 @app.route("/api/question/markdown", methods=["GET"])
 @app.route("/question/markdown", methods=["GET"])  # 兼容代理路径
+@question_cached
 def get_question_markdown():
     """获取题目的markdown格式（原始TPO.json格式）
     可以直接传给大模型使用
 
     Query参数:
-        question: 题名（字符串），必填
+        bank: 题库名（可选），默认为默认题库
+        question: 题名（字符串），必填，可以带题库前缀（如 "ielts:12"）
         format: 返回格式，可选值：
             - "dict" (默认): 返回字典格式 {"instruction": "...", "teacher": "...", "students": [...]}
             - "string": 返回完整字符串格式
@@ -384,9 +1102,10 @@ def get_question_markdown():
 
         format_type = request.args.get("format", "dict").lower()
 
-        question_bank = get_question_bank()
-        result = question_bank.get_question_markdown(
-            question_id=question_name,
+        snapshot = current_question_snapshot()
+        _, question_id = requested_question_ref()
+        result = snapshot.get_question_markdown(
+            question_id=question_id,
             only_valid=True,
             as_string=(format_type == "string"),
         )
@@ -410,12 +1129,14 @@ def get_question_markdown():
 
 @app.route("/api/question", methods=["GET"])
 @app.route("/question", methods=["GET"])  # 兼容代理路径
+@question_cached
 def get_question():
     """获取题目数据
     从题库加载题目数据
 
     Query参数:
-        question: 题名（字符串），必填
+        bank: 题库名（可选），默认为默认题库
+        question: 题名（字符串），必填，可以带题库前缀（如 "ielts:12"）
 
     Returns:
         JSON: 题目数据，格式如下：
@@ -443,36 +1164,16 @@ def get_question():
         if not question_name:
             return jsonify({"error": "参数 'question' 是必需的"}), 400
 
-        question_bank = get_question_bank()
-        question = question_bank.get_question(question_name, only_valid=True)
+        snapshot = current_question_snapshot()
+        _, question_id = requested_question_ref()
+        record = snapshot.get_question_record(question_id)
 
-        if not question:
+        if not record:
             return jsonify({"error": f"题目不存在或无效: {question_name}"}), 404
 
-        # 解析subject（从instruction中提取）
-        instruction = question.instruction
-        subject_match = re.search(
-            r"teaching a class on (\w+)", instruction, re.IGNORECASE
-        )
-        subject = subject_match.group(1) if subject_match else "unknown"
-
         result = {
-            "id": question.id,
-            "subject": subject,
-            "instruction": question.instruction,
-            "professor": {
-                "name": question.teacher,
-                "avatar": "",
-                "prompt": question.teacher_content,
-            },
-            "students": [
-                {
-                    "name": student.get("name", ""),
-                    "avatar": "",
-                    "response": student.get("content", ""),
-                }
-                for student in question.students
-            ],
+            name: record[name]
+            for name in ("id", "subject", "instruction", "professor", "students")
         }
         return jsonify(result), 200
     except Exception as e:
@@ -593,6 +1294,7 @@ def grade_and_polish():
 
     def generate():
         history_id = None
+        insert_future = None
         try:
             log_event(
                 "grade_and_polish.start",
@@ -601,22 +1303,24 @@ def grade_and_polish():
                 user_id=current_user.id if current_user else None,
             )
 
-            # 如果用户已登录，先创建历史记录（用于获取ID）
+            # 如果用户已登录，先创建历史记录（预先分配global_id，由后台线程写入）
             if current_user:
                 try:
                     # 先创建一条空的历史记录，后续再更新
-                    success, message, history = save_history(
+                    pending_id = str(uuid.uuid4())
+                    insert_future = history_writer.save_history_async(
                         user_id=current_user.id,
                         answer=answer,
                         question=question,  # 保存题名
+                        global_id=pending_id,
                         comment="",  # 暂时为空，后续更新
                         polished_answer="",  # 暂时为空，后续更新
                     )
-                    if success and history:
-                        # 使用global_id作为history_id返回（不暴露主键）
-                        history_id = history.global_id
-                        # 发送历史记录ID
-                        yield f"data: {json.dumps({'type': 'history_id', 'history_id': history_id})}\n\n"
+                    # 不等待插入提交，立即返回预先分配的global_id（不暴露主键）；
+                    # 重新连接时记录尚未写入的情况由 get_grade_and_polish_stream 短暂等待处理
+                    history_id = pending_id
+                    # 发送历史记录ID
+                    yield f"data: {json.dumps({'type': 'history_id', 'history_id': history_id})}\n\n"
                 except Exception as e:
                     log_event(
                         "grade_and_polish.history_create_error",
@@ -683,21 +1387,34 @@ def grade_and_polish():
             # 发送完成通知
             yield f"data: {json.dumps({'type': 'polished_complete', 'polished_answer': polished_answer})}\n\n"
 
+            # 插入在开始时已排队，到这里才等待其提交
+            if insert_future is not None:
+                try:
+                    insert_future.result(timeout=HISTORY_ACK_TIMEOUT)
+                except Exception as e:
+                    log_event(
+                        "grade_and_polish.history_create_error",
+                        request_id=getattr(g, "request_id", None),
+                        error=str(e),
+                        user_id=current_user.id,
+                    )
+                    history_id = None
+
             # 如果用户已登录，更新历史记录
             if current_user and history_id:
                 try:
-                    # 使用get_history_by_id以支持多种ID类型
-                    history = get_history_by_id(history_id, current_user.id)
-                    if history:
-                        history.comment = comment
-                        history.polished_answer = polished_answer
+                    # 与创建操作同一队列，保证先插入后更新；提交成功后才通知前端已保存
+                    ack = history_writer.update_history_async(
+                        history_id,
+                        current_user.id,
+                        comment=comment,
+                        polished_answer=polished_answer,
                         # 从解析结果中提取score
-                        if final_parsed and final_parsed.get("score") is not None:
-                            history.score = final_parsed["score"]
-                        db.session.commit()
-                        yield f"data: {json.dumps({'type': 'history_saved', 'message': '历史记录已保存', 'history_id': history_id})}\n\n"
+                        score=final_parsed.get("score") if final_parsed else None,
+                    )
+                    ack.result(timeout=HISTORY_ACK_TIMEOUT)
+                    yield f"data: {json.dumps({'type': 'history_saved', 'message': '历史记录已保存', 'history_id': history_id})}\n\n"
                 except Exception as e:
-                    db.session.rollback()
                     log_event(
                         "grade_and_polish.history_update_error",
                         request_id=getattr(g, "request_id", None),
@@ -727,7 +1444,7 @@ def grade_and_polish():
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
 
     return Response(
-        stream_with_context(generate()),
+        stream_with_context(_track_stream(request.url_rule.rule, generate())),
         mimetype="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -737,6 +1454,14 @@ def grade_and_polish():
     )
 
 
+def _is_uuid(value):
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return len(value) == 36
+
+
 @app.route("/grade_and_polish/<path:history_id>", methods=["GET"])
 @jwt_required()
 def get_grade_and_polish_stream(history_id):
@@ -754,6 +1479,13 @@ def get_grade_and_polish_stream(history_id):
 
     # 获取历史记录
     history = get_history_by_id(history_id, current_user.id)
+    if history is None and _is_uuid(history_id):
+        # 流式接口先返回global_id再由写线程插入，刚开始就重新连接时短暂等待插入提交
+        deadline = time.monotonic() + HISTORY_RECONNECT_WAIT
+        while history is None and time.monotonic() < deadline:
+            time.sleep(0.1)
+            db.session.rollback()  # 结束旧的读事务，才能看到其他连接刚提交的记录
+            history = get_history_by_id(history_id, current_user.id)
 
     if not history:
         return jsonify({"error": "历史记录不存在"}), 404
@@ -779,6 +1511,9 @@ def get_grade_and_polish_stream(history_id):
         )
 
     # 如果还没有完整结果，重新执行评分
+    global_id = history.global_id
+    g.question = history.question  # 用量统计归集到原题目
+
     def generate():
         try:
             # history.question现在统一为题名
@@ -833,15 +1568,17 @@ def get_grade_and_polish_stream(history_id):
 
             # 更新历史记录
             try:
-                history.comment = comment
-                history.polished_answer = polished_answer
-                # 从解析结果中提取score
-                if final_parsed and final_parsed.get("score") is not None:
-                    history.score = final_parsed["score"]
-                db.session.commit()
+                ack = history_writer.update_history_async(
+                    global_id,
+                    current_user.id,
+                    comment=comment,
+                    polished_answer=polished_answer,
+                    # 从解析结果中提取score
+                    score=final_parsed.get("score") if final_parsed else None,
+                )
+                ack.result(timeout=HISTORY_ACK_TIMEOUT)
                 yield f"data: {json.dumps({'type': 'history_saved', 'message': '历史记录已保存', 'history_id': history_id})}\n\n"
             except Exception as e:
-                db.session.rollback()
                 log_event(
                     "grade_and_polish_stream_by_id.history_update_error",
                     request_id=getattr(g, "request_id", None),
@@ -862,7 +1599,7 @@ def get_grade_and_polish_stream(history_id):
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
 
     return Response(
-        stream_with_context(generate()),
+        stream_with_context(_track_stream(request.url_rule.rule, generate())),
         mimetype="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -2,7 +2,10 @@
 用户认证模块
 """
 
-from flask import jsonify
+import os
+from functools import wraps
+
+from flask import g, has_request_context, jsonify
 from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
@@ -98,7 +101,36 @@ def get_current_user():
         if user_id:
             # JWT identity是字符串，需要转换为整数来查询数据库
             user_id_int = int(user_id) if isinstance(user_id, str) else user_id
-            return User.query.get(user_id_int)
+            user = User.query.get(user_id_int)
+            if user and has_request_context():
+                g.user_id = user.id  # 供请求遥测和用量统计使用
+            return user
     except Exception:
         pass
     return None
+
+
+def admin_usernames():
+    """管理员用户名（ADMIN_USERNAMES，逗号分隔）；未配置时没有管理员，管理接口全部返回403"""
+    return {
+        name.strip()
+        for name in os.getenv("ADMIN_USERNAMES", "").split(",")
+        if name.strip()
+    }
+
+
+def admin_required(fn):
+    """
+    装饰器：需要登录且用户名在管理员列表中
+    未登录返回401（由JWT回调处理），非管理员返回403
+    """
+
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        user = get_current_user()
+        if not user or user.username not in admin_usernames():
+            return jsonify({"error": "需要管理员权限"}), 403
+        return fn(*args, **kwargs)
+
+    return wrapper
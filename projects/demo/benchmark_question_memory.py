@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题库内存基准测试
+
+把题库扩充到指定数量（复制题目并分配新id），分别用旧的表示方式
+（普通dataclass + 学生dict列表）和当前的Question（slots + 元组 + intern）
+加载，统计每道题占用的内存（tracemalloc，包含JSON解析出的字符串）。
+
+使用方法：
+    python benchmark_question_memory.py [--count 20000] [--json TOP_generated.json]
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List
+
+from question_bank import QuestionBank
+
+
+@dataclass
+class LegacyQuestion:
+    """旧版题目表示（用于对比）"""
+
+    id: str
+    instruction: str
+    teacher: str
+    teacher_content: str
+    students: List[Dict[str, str]]
+    is_valid: bool
+
+
+def build_legacy(data):
+    questions = {}
+    for item in data:
+        question_id = str(item.get("id", ""))
+        students = [
+            {
+                "name": s.get("name", "").strip(),
+                "content": s.get("content", "").strip(),
+            }
+            for s in item.get("students", [])
+            if isinstance(s, dict)
+        ]
+        questions[question_id] = LegacyQuestion(
+            id=question_id,
+            instruction=item.get("instruction", "").strip(),
+            teacher=item.get("teacher", "").strip(),
+            teacher_content=item.get("teacher_content", "").strip(),
+            students=students,
+            is_valid=True,
+        )
+    return questions
+
+
+def build_current(data):
+    # 复用QuestionBank的规范化逻辑，只构建题目字典（不含列表索引等快照数据）
+    return QuestionBank.parse_questions(data)
+
+
+def expand_bank(source, count):
+    """复制题目直到count道，返回JSON文本（每道题的id不同）"""
+    items = json.loads(Path(source).read_text(encoding="utf-8"))
+    expanded = []
+    for index in range(count):
+        item = dict(items[index % len(items)])
+        item["id"] = index + 1
+        expanded.append(item)
+    return json.dumps(expanded, ensure_ascii=False)
+
+
+def measure(builder, text):
+    """返回构建结果常驻内存的字节数（JSON解析出的原始数据释放后）"""
+    gc.collect()
+    tracemalloc.start()
+    data = json.loads(text)
+    questions = builder(data)
+    del data
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, len(questions)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="题库内存基准测试")
+    parser.add_argument("--count", type=int, default=20000, help="扩充后的题目数量")
+    parser.add_argument("--json", default="TOP_generated.json", help="题库文件")
+    args = parser.parse_args()
+
+    text = expand_bank(args.json, args.count)
+    before, total = measure(build_legacy, text)
+    after, _ = measure(build_current, text)
+
+    print(f"题目数量: {total}")
+    print(f"旧表示: {before / total:,.0f} 字节/题（共 {before / 1024 / 1024:.1f} MB）")
+    print(f"新表示: {after / total:,.0f} 字节/题（共 {after / 1024 / 1024:.1f} MB）")
+    print(f"节省: {(1 - after / before) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,6 @@ import sqlite3
 from pathlib import Path
 
 # 数据库文件路径（自动检测）
-from pathlib import Path
 
 if Path("instance/app.db").exists():
     DB_PATH = "instance/app.db"
@@ -20,13 +19,44 @@ else:
     DB_PATH = "instance/app.db"  # 默认使用instance目录
 
 
-def clear_database():
+def clear_search_index(cursor):
+    """
+    清空全文索引：histories_fts 是 contentless 表，删除 histories 时不会自动同步，
+    残留的索引会在 rowid 复用后产生错误的命中
+    """
+    exists = cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='histories_fts'"
+    ).fetchone()
+    if exists:
+        cursor.execute("INSERT INTO histories_fts(histories_fts) VALUES('delete-all')")
+    return bool(exists)
+
+
+# 由histories累加得到的评分汇总表，清空历史记录时一并清空
+SCORE_STATS_TABLES = ("user_score_stats", "user_weekly_scores", "user_question_scores")
+
+
+def clear_score_stats(cursor):
+    """清空评分汇总表（不存在的表跳过），返回清空的表名"""
+    cleared = []
+    for table in SCORE_STATS_TABLES:
+        exists = cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,)
+        ).fetchone()
+        if exists:
+            cursor.execute(f"DELETE FROM {table}")
+            cleared.append(table)
+    return cleared
+
+
+def clear_database(db_path=None):
     """清空数据库中的所有记录"""
-    if not Path(DB_PATH).exists():
-        print(f"数据库文件 {DB_PATH} 不存在")
+    db_path = db_path or DB_PATH
+    if not Path(db_path).exists():
+        print(f"数据库文件 {db_path} 不存在")
         return
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     try:
@@ -36,6 +66,10 @@ def clear_database():
         cursor.execute("DELETE FROM histories")
         deleted_histories = cursor.rowcount
         print(f"  已删除 {deleted_histories} 条历史记录")
+        if clear_search_index(cursor):
+            print("  已清空全文索引")
+        for table in clear_score_stats(cursor):
+            print(f"  已清空评分汇总表 {table}")
 
         # 可选：删除所有用户（如果需要）
         # cursor.execute("DELETE FROM users")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题库编译脚本
+功能：
+1. 读取TOP_generated.json（parse_tpo.py的输出），完成校验和规范化
+2. 生成可mmap的编译题库 TOP_generated.qbank（定长索引 + 按需解码的题目记录）
+
+服务启动/重新加载时，如果同名.qbank存在且不比JSON旧，QuestionBank直接映射编译题库，
+不再解析整个JSON；多个worker进程共享同一份文件页。
+
+使用方法：
+    python compile_question_bank.py [TOP_generated.json] [-o TOP_generated.qbank]
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+from question_bank import (
+    COMPILED_FORMAT_VERSION,
+    COMPILED_HEADER,
+    COMPILED_INDEX_ENTRY,
+    COMPILED_MAGIC,
+    COMPILED_SUFFIX,
+    QuestionBank,
+    content_version,
+    encode_question_record,
+    question_sort_key,
+)
+
+
+def compile_question_bank(input_file, output_file=None):
+    """
+    编译题库
+
+    Args:
+        input_file: JSON题库文件路径
+        output_file: 输出路径，默认与输入同名、扩展名为.qbank
+
+    Returns:
+        (输出路径, 题目数量)
+    """
+    input_file = Path(input_file)
+    output_file = (
+        Path(output_file) if output_file else input_file.with_suffix(COMPILED_SUFFIX)
+    )
+
+    raw = input_file.read_bytes()
+    questions = QuestionBank.parse_questions(json.loads(raw.decode("utf-8")))
+    # 与JSON加载时的排序一致（稳定排序，非数字id保持原有顺序）
+    ordered = sorted(questions.values(), key=lambda q: question_sort_key(q.id))
+
+    encoded_ids = [q.id.encode("utf-8") for q in ordered]
+    records = [encode_question_record(q) for q in ordered]
+
+    data_start = (
+        COMPILED_HEADER.size
+        + COMPILED_INDEX_ENTRY.size * len(ordered)
+        + sum(len(qid) for qid in encoded_ids)
+    )
+    index = []
+    offset = data_start
+    for question, qid, record in zip(ordered, encoded_ids, records):
+        index.append(
+            COMPILED_INDEX_ENTRY.pack(offset, len(record), len(qid), question.is_valid)
+        )
+        offset += len(record)
+
+    header = COMPILED_HEADER.pack(
+        COMPILED_MAGIC,
+        COMPILED_FORMAT_VERSION,
+        0,
+        len(ordered),
+        content_version(raw).encode("ascii"),
+    )
+
+    # 先写临时文件再替换：正在映射旧文件的进程不受影响
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
+    with open(tmp_file, "wb") as f:
+        f.write(header)
+        f.writelines(index)
+        f.writelines(encoded_ids)
+        f.writelines(records)
+    os.replace(tmp_file, output_file)
+    return output_file, len(ordered)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="编译题库为可mmap的快照文件")
+    parser.add_argument("input", nargs="?", default="TOP_generated.json")
+    parser.add_argument("-o", "--output", default=None, help="输出文件路径")
+    args = parser.parse_args()
+
+    try:
+        output_file, count = compile_question_bank(args.input, args.output)
+        print(f"成功编译 {count} 道题目")
+        print(f"输出文件: {output_file}")
+    except FileNotFoundError:
+        print(f"错误: 找不到文件 {args.input}")
+    except json.JSONDecodeError as e:
+        print(f"错误: JSON解析失败 - {e}")
+
+
+if __name__ == "__main__":
+    main()
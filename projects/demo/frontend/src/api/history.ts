@@ -28,6 +28,34 @@ export interface HistoryListResponse {
 	};
 }
 
+export interface HistorySearchResult {
+	global_id: string;
+	user_sequence: number;
+	question: string;
+	score: number | null;
+	created_at: string;
+	rank: number | null; // 相关度（越大越相关）
+	snippets: Partial<Record<"answer" | "comment" | "polished_answer", string>>;
+}
+
+export interface HistorySearchResponse {
+	query: string;
+	results: HistorySearchResult[];
+	pagination: HistoryListResponse["pagination"];
+}
+
+export interface ScoreSummary {
+	scored_count: number;
+	average_score: number | null;
+	best_score: number | null;
+}
+
+export interface HistoryStatsResponse {
+	summary: ScoreSummary & { updated_at: string | null };
+	weekly: Array<{ week_start: string; scored_count: number; average_score: number | null }>;
+	questions: Array<ScoreSummary & { question: string }>;
+}
+
 export interface ApiError {
 	error: string;
 }
@@ -122,3 +150,48 @@ export async function deleteHistory(historyId: string | number): Promise<void> {
 		throw new Error((result as ApiError).error || "删除历史记录失败");
 	}
 }
+
+/**
+ * 全文检索历史记录（作文、评语、润色稿）
+ */
+export async function searchHistories(
+	query: string,
+	page: number = 1,
+	perPage: number = 20
+): Promise<HistorySearchResponse> {
+	const params = new URLSearchParams({
+		q: query,
+		page: String(page),
+		per_page: String(perPage),
+	});
+	const response = await fetch(`${API_BASE_URL}/history/search?${params.toString()}`, {
+		method: "GET",
+		headers: getAuthHeaders(),
+	});
+
+	const result = await response.json();
+
+	if (!response.ok) {
+		throw new Error((result as ApiError).error || "检索历史记录失败");
+	}
+
+	return result as HistorySearchResponse;
+}
+
+/**
+ * 获取评分统计（平均分、每周趋势、每题最高分）
+ */
+export async function getHistoryStats(weeks: number = 12): Promise<HistoryStatsResponse> {
+	const response = await fetch(`${API_BASE_URL}/history/stats?weeks=${weeks}`, {
+		method: "GET",
+		headers: getAuthHeaders(),
+	});
+
+	const result = await response.json();
+
+	if (!response.ok) {
+		throw new Error((result as ApiError).error || "获取评分统计失败");
+	}
+
+	return result as HistoryStatsResponse;
+}
@@ -266,3 +266,55 @@ export async function getQuestionData(question: string): Promise<QuestionData> {
 	}
 	return await response.json();
 }
+
+/**
+ * 批量获取题目时可选择的字段
+ */
+export type QuestionField =
+	| "subject"
+	| "instruction"
+	| "professor"
+	| "students"
+	| "is_valid"
+	| "markdown";
+
+export interface QuestionBatchItem extends Partial<QuestionData> {
+	id: string;
+	is_valid?: boolean;
+	markdown?: {
+		instruction: string;
+		teacher: string;
+		students: string[];
+	};
+}
+
+export interface QuestionBatchResponse {
+	questions: QuestionBatchItem[];
+	missing: string[];
+}
+
+/**
+ * 批量获取题目数据（一次请求最多100个ID）
+ * @param questions 题名列表
+ * @param fields 只返回指定字段，不传时返回全部字段
+ */
+export async function getQuestionBatch(
+	questions: string[],
+	fields?: QuestionField[]
+): Promise<QuestionBatchResponse> {
+	const params = new URLSearchParams();
+	params.append("ids", questions.join(","));
+	if (fields && fields.length > 0) {
+		params.append("fields", fields.join(","));
+	}
+	const response = await fetch(
+		`${API_BASE_URL}/question/batch?${params.toString()}`
+	);
+	if (!response.ok) {
+		const error: ApiError = await response.json().catch(() => ({
+			error: `HTTP error! status: ${response.status}`,
+		}));
+		throw new Error(error.error || `HTTP error! status: ${response.status}`);
+	}
+	return await response.json();
+}
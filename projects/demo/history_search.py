@@ -0,0 +1,330 @@
+"""
+历史记录全文检索模块
+
+对 answer / comment / polished_answer 三个字段建立全文索引：
+- SQLite：使用 FTS5 contentless 虚拟表（只存倒排索引，不重复存储正文）
+- 其他数据库：退化为 LIKE 扫描（可通过 register_backend 注册更合适的实现）
+
+索引与 histories 表的同步由 history_service 在同一事务内完成。
+"""
+
+import os
+import re
+import threading
+from sqlalchemy import LargeBinary, and_, func, literal, not_, or_, text
+from text_compression import MAGIC, TEXT_MAGIC, decompress_value
+
+SEARCH_FIELDS = ("answer", "comment", "polished_answer")
+
+# 每个字段在排序时的权重（user_key 只用于过滤，不参与打分）
+FIELD_WEIGHTS = {"answer": 1.0, "comment": 1.0, "polished_answer": 0.5}
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def extract_terms(query, max_terms=8):
+    """把用户输入拆成检索词（去重、转小写，最多max_terms个）"""
+    terms = []
+    for term in _TERM_RE.findall(query or ""):
+        term = term.lower()
+        if term not in terms:
+            terms.append(term)
+    return terms[:max_terms]
+
+
+def search_document(history):
+    """提取一条历史记录的索引内容（None统一为空字符串，删除索引时需要原值）"""
+    return {field: getattr(history, field) or "" for field in SEARCH_FIELDS}
+
+
+def make_snippet(content, terms, radius=60):
+    """围绕第一个命中词截取片段，未命中返回None"""
+    if not content:
+        return None
+    lowered = content.lower()
+    positions = [lowered.find(term) for term in terms]
+    positions = [pos for pos in positions if pos != -1]
+    if not positions:
+        return None
+
+    hit = min(positions)
+    start = max(0, hit - radius)
+    end = min(len(content), hit + radius * 2)
+    snippet = " ".join(content[start:end].split())
+    if start > 0:
+        snippet = "…" + snippet
+    if end < len(content):
+        snippet = snippet + "…"
+    return snippet
+
+
+class SearchBackend:
+    """检索后端接口，所有方法都在调用方的session/事务内执行"""
+
+    name = "base"
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def ensure_schema(self):
+        """创建索引结构（幂等）"""
+
+    def index(self, session, history_id, user_id, document):
+        """新增一条记录的索引"""
+
+    def remove(self, session, history_id, user_id, document):
+        """删除一条记录的索引，document为建立索引时的原始内容"""
+
+    def update(self, session, history_id, user_id, old_document, new_document):
+        """更新索引：先删旧内容再写新内容"""
+        if old_document == new_document:
+            return
+        self.remove(session, history_id, user_id, old_document)
+        self.index(session, history_id, user_id, new_document)
+
+    def search(self, session, user_id, terms, offset, limit):
+        """
+        检索指定用户的记录
+        Returns: (hits: list[(history_id, rank)], total: int)
+        """
+        raise NotImplementedError
+
+    def rebuild(self, session):
+        """根据histories表重建全部索引"""
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """SQLite FTS5 后端（contentless 表，rowid 对应 histories.id）"""
+
+    name = "fts5"
+    table = "histories_fts"
+
+    def ensure_schema(self):
+        with self.engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT name FROM sqlite_master WHERE type='table' AND name=:n"),
+                {"n": self.table},
+            ).fetchone()
+            if exists:
+                return
+            conn.execute(
+                text(
+                    f"CREATE VIRTUAL TABLE {self.table} USING fts5("
+                    "user_key, answer, comment, polished_answer, "
+                    "content='', tokenize='unicode61 remove_diacritics 2')"
+                )
+            )
+            # 新建索引时补齐已有数据
+            has_histories = conn.execute(
+                text(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name='histories'"
+                )
+            ).fetchone()
+            if has_histories:
+                self._reindex_all(conn)
+
+    def _reindex_all(self, conn, batch_size=500):
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                text(
+                    "SELECT id, user_id, answer, comment, polished_answer "
+                    "FROM histories WHERE id > :last_id ORDER BY id LIMIT :limit"
+                ),
+                {"last_id": last_id, "limit": batch_size},
+            ).fetchall()
+            if not rows:
+                break
+            conn.execute(
+                text(
+                    f"INSERT INTO {self.table}"
+                    "(rowid, user_key, answer, comment, polished_answer) "
+                    "VALUES (:id, :user_key, :answer, :comment, :polished_answer)"
+                ),
+                [
+                    {
+                        "id": row.id,
+                        "user_key": self._user_key(row.user_id),
+                        "answer": decompress_value(row.answer) or "",
+                        "comment": decompress_value(row.comment) or "",
+                        "polished_answer": decompress_value(row.polished_answer) or "",
+                    }
+                    for row in rows
+                ],
+            )
+            last_id = rows[-1].id
+
+    @staticmethod
+    def _user_key(user_id):
+        # 用户ID也作为一列写入索引，检索时与关键词求交集，避免先全局匹配再按用户过滤
+        return f"u{user_id}"
+
+    def index(self, session, history_id, user_id, document):
+        session.execute(
+            text(
+                f"INSERT INTO {self.table}"
+                "(rowid, user_key, answer, comment, polished_answer) "
+                "VALUES (:id, :user_key, :answer, :comment, :polished_answer)"
+            ),
+            {"id": history_id, "user_key": self._user_key(user_id), **document},
+        )
+
+    def remove(self, session, history_id, user_id, document):
+        session.execute(
+            text(
+                f"INSERT INTO {self.table}"
+                f"({self.table}, rowid, user_key, answer, comment, polished_answer) "
+                "VALUES ('delete', :id, :user_key, :answer, :comment, :polished_answer)"
+            ),
+            {"id": history_id, "user_key": self._user_key(user_id), **document},
+        )
+
+    def _match_expression(self, user_id, terms):
+        # 每个词都加引号，避免用户输入被当作FTS5语法；最后一个词做前缀匹配
+        quoted = [f'"{term}"' for term in terms[:-1]]
+        quoted.append(f'"{terms[-1]}"*')
+        fields = " ".join(SEARCH_FIELDS)
+        return (
+            f'user_key:"{self._user_key(user_id)}" AND {{{fields}}}: ({" ".join(quoted)})'
+        )
+
+    def search(self, session, user_id, terms, offset, limit):
+        match = self._match_expression(user_id, terms)
+        weights = ", ".join(
+            ["0.0"] + [str(FIELD_WEIGHTS[field]) for field in SEARCH_FIELDS]
+        )
+        rows = session.execute(
+            text(
+                f"SELECT rowid, bm25({self.table}, {weights}) AS rank "
+                f"FROM {self.table} WHERE {self.table} MATCH :match "
+                "ORDER BY rank LIMIT :limit OFFSET :offset"
+            ),
+            {"match": match, "limit": limit, "offset": offset},
+        ).fetchall()
+        total = session.execute(
+            text(f"SELECT count(*) FROM {self.table} WHERE {self.table} MATCH :match"),
+            {"match": match},
+        ).scalar()
+        # bm25越小越相关，对外统一为越大越相关
+        return [(row.rowid, -row.rank) for row in rows], total
+
+    def rebuild(self, session):
+        session.execute(text(f"INSERT INTO {self.table}({self.table}) VALUES('delete-all')"))
+        self._reindex_all(session.connection())
+
+
+def _is_compressed(session, column):
+    """SQL条件：列的存储值为压缩格式（SQLite存二进制，LIKE遇到二进制数据不可靠）"""
+    if session.get_bind().dialect.name == "sqlite":
+        condition = func.substr(column, 1, 1) == literal(MAGIC, LargeBinary())
+    else:
+        condition = column.startswith(TEXT_MAGIC)
+    return and_(column.isnot(None), condition)
+
+
+class LikeSearchBackend(SearchBackend):
+    """
+    通用后端：不维护索引，直接对原表做LIKE查询（按时间倒序）
+    压缩存储的列无法在SQL中匹配：用户有压缩记录时，明文记录仍在SQL中匹配，
+    压缩记录解压后在Python中逐条确认，再按时间合并分页
+    """
+
+    name = "like"
+
+    def search(self, session, user_id, terms, offset, limit):
+        from user_models import History
+
+        columns = (History.answer, History.comment, History.polished_answer)
+        compressed = or_(*(_is_compressed(session, column) for column in columns))
+        user_rows = session.query(History.id).filter(History.user_id == user_id)
+        if user_rows.filter(compressed).first() is None:
+            # 没有压缩记录（未开启压缩时总是如此）：全部在SQL中匹配和分页
+            query = self._match(user_rows, columns, terms)
+            total = query.count()
+            rows = (
+                query.order_by(History.created_at.desc()).offset(offset).limit(limit).all()
+            )
+            return [(row.id, None) for row in rows], total
+
+        plain = self._match(
+            session.query(History.id, History.created_at).filter(
+                History.user_id == user_id, not_(compressed)
+            ),
+            columns,
+            terms,
+        )
+        matched = [(row.created_at, row.id) for row in plain]
+        candidates = session.query(History.id, History.created_at, *columns).filter(
+            History.user_id == user_id, compressed
+        )
+        for row in candidates.yield_per(500):
+            contents = [(decompress_value(value) or "").lower() for value in row[2:]]
+            if all(any(term in content for content in contents) for term in terms):
+                matched.append((row.created_at, row.id))
+        matched.sort(reverse=True)
+        return [(history_id, None) for _, history_id in matched[offset : offset + limit]], len(
+            matched
+        )
+
+    @staticmethod
+    def _match(query, columns, terms):
+        for term in terms:
+            pattern = f"%{term}%"
+            query = query.filter(or_(*(column.ilike(pattern) for column in columns)))
+        return query
+
+
+# 方言名 -> 后端类，可通过register_backend扩展（例如PostgreSQL tsvector）
+_BACKENDS = {
+    "sqlite": SQLiteFTSBackend,
+}
+_BACKENDS_BY_NAME = {
+    SQLiteFTSBackend.name: SQLiteFTSBackend,
+    LikeSearchBackend.name: LikeSearchBackend,
+}
+
+_backend_cache = {}
+_backend_lock = threading.Lock()
+
+
+def register_backend(dialect_name, backend_cls):
+    """为指定数据库方言注册检索后端"""
+    _BACKENDS[dialect_name] = backend_cls
+    _BACKENDS_BY_NAME[backend_cls.name] = backend_cls
+    _backend_cache.clear()
+
+
+def get_search_backend(engine):
+    """
+    获取engine对应的检索后端（每个engine只初始化一次）
+    可通过环境变量 HISTORY_SEARCH_BACKEND（fts5/like）强制指定
+    """
+    backend = _backend_cache.get(engine)
+    if backend is not None:
+        return backend
+
+    with _backend_lock:
+        backend = _backend_cache.get(engine)
+        if backend is None:
+            forced = os.getenv("HISTORY_SEARCH_BACKEND")
+            if forced:
+                backend_cls = _BACKENDS_BY_NAME[forced]
+            else:
+                backend_cls = _BACKENDS.get(engine.dialect.name, LikeSearchBackend)
+            backend = backend_cls(engine)
+            backend.ensure_schema()
+            _backend_cache[engine] = backend
+    return backend
+
+
+if __name__ == "__main__":
+    # 手动重建索引：python history_search.py
+    from app import app
+    from user_models import db
+
+    with app.app_context():
+        db.create_all()
+        backend = get_search_backend(db.engine)
+        backend.rebuild(db.session)
+        db.session.commit()
+        print(f"检索索引重建完成（后端: {backend.name}）")
@@ -7,10 +7,81 @@ from datetime import datetime
 from sqlalchemy import func
 from user_models import db, History, User
 from flask import jsonify
+from history_search import (
+    get_search_backend,
+    search_document,
+    extract_terms,
+    make_snippet,
+    SEARCH_FIELDS,
+)
+from stats_service import apply_score_change
+from tracing import traced
 
 
+def add_history(
+    user_id,
+    answer,
+    question,
+    comment=None,
+    polished_answer=None,
+    score=None,
+    global_id=None,
+):
+    """
+    新增历史记录并同步检索索引和评分统计（不提交事务，由调用方提交）
+    Args同save_history，global_id为None时自动生成
+    Returns: History
+    """
+    # 在写入前获取检索后端：首次调用会建表，必须在本事务持有写锁之前完成
+    search_backend = get_search_backend(db.engine)
+
+    # 如果score为None且comment存在，尝试从comment中解析score
+    if score is None and comment:
+        from model import CommentParser
+
+        parser = CommentParser()
+        parsed_comment = parser.parse_complete(comment)
+        score = parsed_comment.get("score")
+
+    # 生成全局唯一ID（流式接口会预先分配，以便在写入前返回给前端）
+    if global_id is None:
+        global_id = str(uuid.uuid4())
+
+    # 计算用户内部序号：取该用户当前最大序号+1（走(user_id, user_sequence)索引，
+    # 删除记录后也不会与已有序号重复）
+    user_sequence = (
+        db.session.query(func.max(History.user_sequence))
+        .filter_by(user_id=user_id)
+        .scalar()
+        or 0
+    ) + 1
+
+    history = History(
+        user_id=user_id,
+        global_id=global_id,
+        user_sequence=user_sequence,
+        answer=answer,
+        question=question,
+        comment=comment,
+        polished_answer=polished_answer,
+        score=score,
+    )
+    db.session.add(history)
+    db.session.flush()  # 获取主键，用于写入检索索引
+    search_backend.index(db.session, history.id, user_id, search_document(history))
+    apply_score_change(history, None, score)
+    return history
+
+
+@traced("history.save")
 def save_history(
-    user_id, answer, question, comment=None, polished_answer=None, score=None
+    user_id,
+    answer,
+    question,
+    comment=None,
+    polished_answer=None,
+    score=None,
+    global_id=None,
 ):
     """
     保存历史记录
@@ -22,37 +93,19 @@ def save_history(
         comment: 评语（可选）
         polished_answer: 润色后的答案（可选）
         score: 总评分（可选，如果为None且comment存在，会从comment中解析）
+        global_id: 预先分配的全局ID（可选）
     Returns: (success: bool, message: str, history: History or None)
     """
     try:
-        # 如果score为None且comment存在，尝试从comment中解析score
-        if score is None and comment:
-            from model import CommentParser
-
-            parser = CommentParser()
-            parsed_comment = parser.parse_complete(comment)
-            score = parsed_comment.get("score")
-
-        # 生成全局唯一ID
-        global_id = str(uuid.uuid4())
-
-        # 计算用户内部序号（该用户的第几条记录）
-        user_sequence = (
-            db.session.query(func.count(History.id)).filter_by(user_id=user_id).scalar()
-            + 1
-        )
-
-        history = History(
-            user_id=user_id,
-            global_id=global_id,
-            user_sequence=user_sequence,
-            answer=answer,
-            question=question,
+        history = add_history(
+            user_id,
+            answer,
+            question,
             comment=comment,
             polished_answer=polished_answer,
             score=score,
+            global_id=global_id,
         )
-        db.session.add(history)
         db.session.commit()
         return True, "历史记录保存成功", history
     except Exception as e:
@@ -60,6 +113,53 @@ def save_history(
         return False, f"保存历史记录失败: {str(e)}", None
 
 
+def apply_history_update(history, comment=None, polished_answer=None, score=None):
+    """
+    修改历史记录的评分结果并同步检索索引和评分统计（不提交事务，由调用方提交）
+    Args同update_history
+    """
+    search_backend = get_search_backend(db.engine)
+    old_document = search_document(history)
+    old_score = history.score
+    if comment is not None:
+        history.comment = comment
+    if polished_answer is not None:
+        history.polished_answer = polished_answer
+    if score is not None:
+        history.score = score
+
+    search_backend.update(
+        db.session,
+        history.id,
+        history.user_id,
+        old_document,
+        search_document(history),
+    )
+    apply_score_change(history, old_score, history.score)
+
+
+@traced("history.update")
+def update_history(history, comment=None, polished_answer=None, score=None):
+    """
+    更新历史记录的评分结果（同时同步检索索引和评分统计）
+    Args:
+        history: History对象
+        comment: 评语（None表示不修改）
+        polished_answer: 润色后的答案（None表示不修改）
+        score: 总评分（None表示不修改）
+    Returns: (success: bool, message: str)
+    """
+    try:
+        apply_history_update(
+            history, comment=comment, polished_answer=polished_answer, score=score
+        )
+        db.session.commit()
+        return True, "历史记录更新成功"
+    except Exception as e:
+        db.session.rollback()
+        return False, f"更新历史记录失败: {str(e)}"
+
+
 def get_user_histories(user_id, page=1, per_page=20):
     """
     获取用户的历史记录（分页）
@@ -118,6 +218,7 @@ def get_history_by_id(history_id, user_id):
     return None
 
 
+@traced("history.delete")
 def delete_history(history_id, user_id):
     """
     删除历史记录（确保属于当前用户）
@@ -131,9 +232,77 @@ def delete_history(history_id, user_id):
         return False, "历史记录不存在或无权限"
 
     try:
+        search_backend = get_search_backend(db.engine)
+        search_backend.remove(
+            db.session, history.id, history.user_id, search_document(history)
+        )
+        apply_score_change(history, history.score, None)
         db.session.delete(history)
         db.session.commit()
         return True, "删除成功"
     except Exception as e:
         db.session.rollback()
         return False, f"删除失败: {str(e)}"
+
+
+def search_histories(user_id, query, page=1, per_page=20):
+    """
+    全文检索用户的历史记录（answer/comment/polished_answer）
+    Returns: dict，包含按相关度排序的结果片段和分页信息
+    """
+    page = max(page, 1)
+    per_page = max(1, min(per_page, 100))
+    terms = extract_terms(query)
+    if not terms:
+        hits, total = [], 0
+    else:
+        backend = get_search_backend(db.engine)
+        hits, total = backend.search(
+            db.session, user_id, terms, offset=(page - 1) * per_page, limit=per_page
+        )
+
+    # 只加载当前页的记录来生成片段
+    histories = {}
+    if hits:
+        rows = History.query.filter(
+            History.user_id == user_id, History.id.in_([hid for hid, _ in hits])
+        ).all()
+        histories = {h.id: h for h in rows}
+
+    results = []
+    for history_id, rank in hits:
+        history = histories.get(history_id)
+        if not history:
+            continue
+        snippets = {}
+        for field in SEARCH_FIELDS:
+            snippet = make_snippet(getattr(history, field), terms)
+            if snippet:
+                snippets[field] = snippet
+        results.append(
+            {
+                "global_id": history.global_id,
+                "user_sequence": history.user_sequence,
+                "question": history.question,
+                "score": history.score,
+                "created_at": (
+                    history.created_at.isoformat() if history.created_at else None
+                ),
+                "rank": rank,
+                "snippets": snippets,
+            }
+        )
+
+    pages = (total + per_page - 1) // per_page if total else 0
+    return {
+        "query": query,
+        "results": results,
+        "pagination": {
+            "page": page,
+            "per_page": per_page,
+            "total": total,
+            "pages": pages,
+            "has_next": page < pages,
+            "has_prev": page > 1,
+        },
+    }
@@ -0,0 +1,258 @@
+"""
+历史记录后台写入模块（write-behind）
+
+流式评分接口不在请求线程里提交数据库事务，而是把写操作放进有界队列，
+由单个后台线程按批次执行并合并为一次提交（group commit）：
+- submit 返回 Future，事务提交成功后才会完成（持久化确认）
+- 一批中有操作失败时整批回滚，再逐条重试，失败只影响对应的 Future
+- 进程退出时（atexit）会先处理完队列中已有的写操作
+- 队列和写线程属于当前进程：fork出的worker各自重新创建，flush 只等待本进程提交的操作
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+
+from user_models import db, History
+from history_service import add_history, apply_history_update
+from metrics import HISTORY_SAVE_DURATION
+from tracing import current_span, span, start_span
+
+_STOP = object()
+
+
+def _insert_op(**fields):
+    history = add_history(**fields)
+    return history.global_id
+
+
+def _update_op(global_id, user_id, **fields):
+    history = History.query.filter_by(global_id=global_id, user_id=user_id).first()
+    if not history:
+        raise LookupError(f"历史记录不存在: {global_id}")
+    apply_history_update(history, **fields)
+    return global_id
+
+
+def _barrier_op():
+    return None
+
+
+def _operation(func):
+    return func.__name__.strip("_").replace("_op", "")
+
+
+def _op_span(func, parent):
+    """写操作的span，挂在提交它的请求下（没有所属请求时不记录）"""
+    if parent is None:
+        return nullcontext()
+    return span(f"history.{_operation(func)}", parent=parent)
+
+
+def _trace_commit(batch, start_ns):
+    """一次提交可能包含多个请求的写操作，在每个请求的trace中各记录一个commit span"""
+    parents = {parent.span_id: parent for _, _, _, _, parent in batch if parent is not None}
+    if not parents:
+        return
+    end_ns = time.time_ns()
+    for parent in parents.values():
+        start_span(
+            "history.commit", parent=parent, start_ns=start_ns, batch_size=len(batch)
+        ).end(end_ns)
+
+
+def _observe_save(func, submitted):
+    """返回Future回调：记录写操作从提交到事务完成的耗时"""
+    operation = _operation(func)
+
+    def _callback(future):
+        HISTORY_SAVE_DURATION.observe(
+            time.perf_counter() - submitted,
+            operation=operation,
+            outcome="error" if future.exception() else "success",
+        )
+
+    return _callback
+
+
+class HistoryWriter:
+    """历史记录后台写入器：单写线程 + 有界队列 + 批量提交"""
+
+    def __init__(
+        self,
+        app,
+        max_queue_size=None,
+        max_batch_size=None,
+        enqueue_timeout=None,
+    ):
+        """
+        Args:
+            app: Flask应用（写线程在其app context中执行）
+            max_queue_size: 队列容量，默认读取 HISTORY_WRITER_QUEUE_SIZE（1000）
+            max_batch_size: 每次提交最多合并的操作数，默认读取 HISTORY_WRITER_BATCH_SIZE（50）
+            enqueue_timeout: 队列满时提交方最多等待的秒数（5秒）
+        """
+        self.app = app
+        self.max_batch_size = max_batch_size or int(
+            os.getenv("HISTORY_WRITER_BATCH_SIZE", "50")
+        )
+        self.enqueue_timeout = (
+            enqueue_timeout
+            if enqueue_timeout is not None
+            else float(os.getenv("HISTORY_WRITER_ENQUEUE_TIMEOUT", "5"))
+        )
+        self._max_queue_size = max_queue_size or int(
+            os.getenv("HISTORY_WRITER_QUEUE_SIZE", "1000")
+        )
+        self._queue = queue.Queue(maxsize=self._max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        # 预加载应用后fork出的worker没有父进程的写线程，队列中的操作也属于父进程
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._queue = queue.Queue(maxsize=self._max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """启动写线程（首次提交时自动调用）"""
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(
+                    target=self._run, name="history-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        提交一个写操作。func在写线程的app context中执行，不能自行提交事务，
+        返回值需为普通数据（不要返回ORM对象）
+        Returns: Future，事务提交后得到func的返回值
+        """
+        if self._closed:
+            raise RuntimeError("历史记录写入器已关闭")
+        self.start()
+        future = Future()
+        parent = None
+        if func is not _barrier_op:
+            future.add_done_callback(_observe_save(func, time.perf_counter()))
+            parent = current_span()
+        try:
+            self._queue.put(
+                (func, args, kwargs, future, parent), timeout=self.enqueue_timeout
+            )
+        except queue.Full:
+            raise RuntimeError("历史记录写入队列已满") from None
+        return future
+
+    def save_history_async(self, user_id, answer, question, global_id, **fields):
+        """异步新增历史记录（global_id需预先分配），Future结果为global_id"""
+        return self.submit(
+            _insert_op,
+            user_id=user_id,
+            answer=answer,
+            question=question,
+            global_id=global_id,
+            **fields,
+        )
+
+    def update_history_async(self, global_id, user_id, **fields):
+        """异步更新历史记录的评分结果，Future结果为global_id"""
+        return self.submit(_update_op, global_id, user_id, **fields)
+
+    def flush(self, timeout=None):
+        """
+        等待本进程此前提交的所有写操作落盘
+        只是进程内的屏障：其他worker进程中排队的写操作不受影响，
+        跨请求的可见性应依赖 submit 返回的 Future（提交成功后再把id告诉客户端）
+        """
+        if self._thread is None:
+            return
+        self.submit(_barrier_op).result(timeout)
+
+    def qsize(self):
+        """当前排队中的写操作数量"""
+        return self._queue.qsize()
+
+    def close(self, timeout=30):
+        """停止接收新操作，处理完队列中已有的操作后退出写线程"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self._queue.get()
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.max_batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._commit_batch(batch)
+
+        # 关闭期间仍可能有并发提交进入队列，全部处理掉，避免Future永远不完成
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftovers.append(item)
+        if leftovers:
+            self._commit_batch(leftovers)
+
+    def _commit_batch(self, batch):
+        with self.app.app_context():
+            try:
+                results = []
+                for func, args, kwargs, _, parent in batch:
+                    with _op_span(func, parent):
+                        results.append(func(*args, **kwargs))
+                commit_start = time.time_ns()
+                db.session.commit()
+                _trace_commit(batch, commit_start)
+            except Exception:
+                db.session.rollback()
+                # 整批失败时逐条重试，避免一条坏数据拖累其他写操作
+                for item in batch:
+                    self._commit_one(item)
+                return
+
+        for (_, _, _, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+    def _commit_one(self, item):
+        func, args, kwargs, future, parent = item
+        try:
+            with _op_span(func, parent):
+                result = func(*args, **kwargs)
+            commit_start = time.time_ns()
+            db.session.commit()
+            _trace_commit([item], commit_start)
+        except Exception as e:
+            db.session.rollback()
+            future.set_exception(e)
+        else:
+            future.set_result(result)
@@ -0,0 +1,276 @@
+"""
+内存诊断模块
+
+用于定位长时间运行的 worker 中 RSS 缓慢上涨的问题（SSE 生成器、CommentParser 缓冲区、
+SQLAlchemy 会话等），不需要挂调试器：
+- 后台线程每 MEMORY_SAMPLE_INTERVAL 秒（默认 60，0 关闭）记录一次 memory.sample 遥测事件
+  （RSS、tracemalloc 当前/峰值、正在输出的 SSE 流数量），只读取计数器，不遍历堆
+- tracemalloc 按需开启；保存多个时间点的快照，比较两次快照的差异或查看当前分配最多的位置
+- 按需（/admin/memory）统计存活的 CommentParser/Evaluator/Polisher/History/Session 对象数量、
+  CommentParser 缓冲区大小，以及正在运行的流式生成器
+"""
+
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+from metrics import STREAMS_IN_FLIGHT
+from telemetry import log_event
+
+MEMORY_SAMPLE_INTERVAL = float(os.getenv("MEMORY_SAMPLE_INTERVAL", "60"))
+# 内存中保留的 tracemalloc 快照数量，超过后删除最旧的
+MAX_SNAPSHOTS = int(os.getenv("MEMORY_MAX_SNAPSHOTS", "5"))
+SNAPSHOT_KEY_TYPES = ("lineno", "filename", "traceback")
+
+# 统计存活实例的类（按类名匹配，避免导入 Flask/SQLAlchemy 相关模块）
+TRACKED_CLASSES = ("CommentParser", "Evaluator", "Polisher", "History", "Session")
+# 流式输出相关的生成器所在模块
+STREAM_MODULES = ("app.py", "model.py", "profiling.py")
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# 快照过滤掉 tracemalloc 自身和导入机制的分配
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss_bytes() -> Optional[int]:
+    """当前进程的常驻内存（Linux读取/proc；其他平台返回峰值RSS）"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def live_objects() -> Dict[str, Any]:
+    """
+    遍历gc跟踪的对象，统计存活实例和流式生成器（开销与堆大小成正比，仅用于诊断）
+    Returns: { gc_objects, objects: {类名: 数量}, parser_buffer_chars, streams: {生成器名: 数量} }
+    """
+    objects = Counter({name: 0 for name in TRACKED_CLASSES})
+    streams = Counter()
+    buffer_chars = 0
+    tracked = gc.get_objects()
+    for obj in tracked:
+        name = type(obj).__name__
+        if name in objects:
+            objects[name] += 1
+            if name == "CommentParser":
+                buffer_chars += len(getattr(obj, "buffer", "") or "")
+                buffer_chars += len(getattr(obj, "current_item_text", "") or "")
+        elif name == "generator" and obj.gi_frame is not None:
+            code = obj.gi_code
+            if os.path.basename(code.co_filename) in STREAM_MODULES:
+                streams[code.co_name] += 1
+    return {
+        "gc_objects": len(tracked),
+        "objects": dict(objects),
+        "parser_buffer_chars": buffer_chars,
+        "streams": dict(streams),
+    }
+
+
+class MemoryDiagnostics:
+    """tracemalloc 快照管理和 RSS 采样"""
+
+    def __init__(self, sample_interval: float = MEMORY_SAMPLE_INTERVAL):
+        self.sample_interval = sample_interval
+        self._lock = threading.Lock()
+        self._snapshots: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 1
+        self._sampler = None
+        self._sampler_pid = None
+        self._stop = threading.Event()
+
+    # ---------- tracemalloc ----------
+
+    def start_tracing(self, frames: int = 10) -> Dict[str, Any]:
+        """开启 tracemalloc（frames: 每次分配记录的调用栈深度）"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, min(int(frames), 100)))
+        return self.tracing_status()
+
+    def stop_tracing(self) -> Dict[str, Any]:
+        """关闭 tracemalloc 并清空快照（快照引用的统计数据会一并释放）"""
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+        return self.tracing_status()
+
+    def tracing_status(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        status = {"tracing": tracing}
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            status.update(
+                frames=tracemalloc.get_traceback_limit(),
+                traced_bytes=current,
+                traced_peak_bytes=peak,
+                overhead_bytes=tracemalloc.get_tracemalloc_memory(),
+            )
+        return status
+
+    def _snapshot(self):
+        if not tracemalloc.is_tracing():
+            raise ValueError("tracemalloc 未开启")
+        return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+    def take_snapshot(self, label: Optional[str] = None) -> Dict[str, Any]:
+        """保存一个快照，返回其编号"""
+        snapshot = self._snapshot()
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = {
+                "snapshot": snapshot,
+                "label": label,
+                "ts": time.time(),
+                "rss_bytes": rss_bytes(),
+            }
+            while len(self._snapshots) > MAX_SNAPSHOTS:
+                self._snapshots.popitem(last=False)
+        return self._describe(snapshot_id)
+
+    def _describe(self, snapshot_id: int) -> Dict[str, Any]:
+        entry = self._snapshots[snapshot_id]
+        return {
+            "id": snapshot_id,
+            "label": entry["label"],
+            "ts": entry["ts"],
+            "rss_bytes": entry["rss_bytes"],
+            "traced_bytes": sum(t.size for t in entry["snapshot"].traces),
+        }
+
+    def snapshots(self) -> List[Dict[str, Any]]:
+        """已保存的快照"""
+        with self._lock:
+            return [self._describe(snapshot_id) for snapshot_id in self._snapshots]
+
+    def _get(self, snapshot_id: int):
+        with self._lock:
+            entry = self._snapshots.get(snapshot_id)
+        if entry is None:
+            raise LookupError(f"快照不存在: {snapshot_id}")
+        return entry["snapshot"]
+
+    def top_allocations(
+        self, limit: int = 20, key_type: str = "lineno", snapshot_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """当前（或指定快照中）分配内存最多的位置"""
+        if key_type not in SNAPSHOT_KEY_TYPES:
+            raise ValueError(f"key_type 只支持: {', '.join(SNAPSHOT_KEY_TYPES)}")
+        snapshot = self._get(snapshot_id) if snapshot_id else self._snapshot()
+        return [
+            {
+                "location": _format_traceback(stat.traceback),
+                "size_bytes": stat.size,
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics(key_type)[:limit]
+        ]
+
+    def compare(
+        self,
+        snapshot_id: int,
+        against: Optional[int] = None,
+        limit: int = 20,
+        key_type: str = "lineno",
+    ) -> Dict[str, Any]:
+        """
+        比较两个快照（against为空时与当前内存比较），按增长量排序
+        Returns: { from, to, total_diff_bytes, top: [{location, size_bytes, size_diff_bytes, count, count_diff}] }
+        """
+        if key_type not in SNAPSHOT_KEY_TYPES:
+            raise ValueError(f"key_type 只支持: {', '.join(SNAPSHOT_KEY_TYPES)}")
+        old = self._get(snapshot_id)
+        new = self._get(against) if against else self._snapshot()
+        diffs = new.compare_to(old, key_type)
+        return {
+            "from": snapshot_id,
+            "to": against or "now",
+            "total_diff_bytes": sum(d.size_diff for d in diffs),
+            "top": [
+                {
+                    "location": _format_traceback(d.traceback),
+                    "size_bytes": d.size,
+                    "size_diff_bytes": d.size_diff,
+                    "count": d.count,
+                    "count_diff": d.count_diff,
+                }
+                for d in diffs[:limit]
+            ],
+        }
+
+    # ---------- RSS 采样 ----------
+
+    def sample(self) -> Dict[str, Any]:
+        """
+        采样一次内存状态并记录 memory.sample 事件
+        只读取计数器（开销固定）；遍历gc对象的 live_objects() 与堆大小成正比，只在 /admin/memory 中按需调用
+        """
+        fields = {
+            "rss_bytes": rss_bytes(),
+            "active_streams": int(sum(STREAMS_IN_FLIGHT.samples().values())),
+        }
+        if tracemalloc.is_tracing():
+            fields["traced_bytes"], fields["traced_peak_bytes"] = tracemalloc.get_traced_memory()
+        log_event("memory.sample", pid=os.getpid(), **fields)
+        return fields
+
+    def ensure_sampler(self):
+        """启动采样线程（fork后的子进程中重新启动）；每个请求开始时调用，开销很小"""
+        if self.sample_interval <= 0 or self._sampler_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sampler_pid == os.getpid():
+                return
+            self._sampler_pid = os.getpid()
+            self._stop = threading.Event()
+            self._sampler = threading.Thread(
+                target=self._run_sampler, name="memory-sampler", daemon=True
+            )
+            self._sampler.start()
+
+    def stop_sampler(self):
+        self._stop.set()
+
+    def _run_sampler(self):
+        stop = self._stop
+        while not stop.wait(self.sample_interval):
+            try:
+                self.sample()
+            except Exception as e:
+                log_event("memory.sample.error", error=str(e), error_type=type(e).__name__)
+
+
+def _format_traceback(traceback) -> List[str]:
+    """调用栈（最近的调用在前），路径只保留项目内的相对部分"""
+    root = os.path.dirname(os.path.abspath(__file__)) + os.sep
+    return [
+        f"{frame.filename.replace(root, '')}:{frame.lineno}" for frame in reversed(traceback)
+    ]
+
+
+_diagnostics = MemoryDiagnostics()
+
+
+def get_memory_diagnostics() -> MemoryDiagnostics:
+    """进程内共享的内存诊断对象"""
+    return _diagnostics
@@ -0,0 +1,458 @@
+"""
+进程内指标注册表（计数器、仪表、固定分桶直方图），以 Prometheus 文本格式导出
+
+- 每个指标按标签值分别统计，更新时只持有该指标自己的锁
+- 仪表可以绑定回调函数（如队列长度），在导出时读取
+- 多进程部署（prefork）时设置 METRICS_MULTIPROC_DIR：每个进程定期（以及退出时）
+  把自己的数据写入 <目录>/metrics-<pid>-<启动时间>.json，导出时合并所有进程的数据；
+  计数器和直方图累加（包括已退出的进程），仪表只累加仍在运行的进程
+- 已退出进程的计数器和直方图在导出时并入 <目录>/totals.json 并删除其文件，
+  worker 反复重启时文件数量不会一直增长；pid 被新进程复用时按启动时间区分
+"""
+
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：不加锁
+    fcntl = None
+
+# 默认分桶（秒）：覆盖毫秒级接口到分钟级的LLM流式调用
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Dict[Tuple[str, ...], object]:
+        """当前各标签组合的值（副本）"""
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """仪表：可增可减，或在导出时通过回调读取"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """导出时调用function获取当前值（如队列长度）"""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def samples(self):
+        values = super().samples()
+        with self._lock:
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = float(function())
+            except Exception:
+                continue  # 回调失败时不影响其他指标
+        return values
+
+
+class Histogram(_Metric):
+    """固定分桶直方图（分桶上限升序，自动追加 +Inf）"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各桶计数（非累计，最后一个为+Inf）, 总和, 次数]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1], value[2]]
+
+
+class MetricsRegistry:
+    """指标注册表：同名指标只创建一次"""
+
+    def __init__(self, multiproc_dir: Optional[str] = None, flush_interval: float = 5.0):
+        """
+        Args:
+            multiproc_dir: 多进程数据目录，默认读取 METRICS_MULTIPROC_DIR（不设置时只导出本进程）
+            flush_interval: 多进程模式下写入本进程数据的间隔秒数
+        """
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        multiproc_dir = multiproc_dir or os.getenv("METRICS_MULTIPROC_DIR")
+        self.multiproc_dir = Path(multiproc_dir) if multiproc_dir else None
+        self.flush_interval = flush_interval
+        self._flusher = None
+        self._started = time.time_ns()
+        # 预加载应用后fork出的worker没有父进程的线程，需要重新启动写入线程
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标 {name} 已注册为 {metric.kind}")
+        self._start_flusher()
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def collect(self) -> Dict[str, Dict]:
+        """本进程的指标数据（可序列化为JSON）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        data = {}
+        for metric in metrics:
+            entry = {
+                "type": metric.kind,
+                "help": metric.documentation,
+                "labels": list(metric.labelnames),
+                "samples": [[list(k), v] for k, v in metric.samples().items()],
+            }
+            if isinstance(metric, Histogram):
+                entry["buckets"] = list(metric.buckets)
+            data[metric.name] = entry
+        return data
+
+    # ---------- 多进程 ----------
+
+    def _process_file(self) -> Path:
+        return self.multiproc_dir / f"metrics-{os.getpid()}-{self._started}.json"
+
+    @property
+    def _totals_file(self) -> Path:
+        return self.multiproc_dir / "totals.json"
+
+    def _start_flusher(self):
+        if self.multiproc_dir is None or self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="metrics-flusher", daemon=True
+            )
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._flusher = None
+        # 子进程使用自己的文件，不覆盖父进程的数据
+        self._started = time.time_ns()
+        if self._metrics:
+            self._start_flusher()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def flush(self):
+        """把本进程的数据写入多进程目录（原子替换）"""
+        if self.multiproc_dir is None:
+            return
+        self.multiproc_dir.mkdir(parents=True, exist_ok=True)
+        data = {"pid": os.getpid(), "started": self._started, "metrics": self.collect()}
+        self._write_json(self._process_file(), data)
+
+    @staticmethod
+    def _write_json(path: Path, data: Dict):
+        tmp_file = path.with_name(path.name + ".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_file, path)
+
+    @staticmethod
+    def _read_json(path: Path) -> Optional[Dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @contextmanager
+    def _dir_lock(self):
+        """多进程目录的排他锁：合并已退出进程的数据时不会被其他进程重复累加"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.multiproc_dir / "metrics.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _all_processes(self) -> List[Tuple[Dict, bool]]:
+        """
+        所有进程的数据：[(指标数据, 是否仍在运行)]，本进程使用内存中的最新数据
+        已退出进程的文件并入 totals.json 后删除（同一个 pid 只有启动时间最新的文件可能仍在运行）
+        """
+        processes = [(self.collect(), True)]
+        if self.multiproc_dir is None or not self.multiproc_dir.exists():
+            return processes
+        with self._dir_lock():
+            files = []
+            for path in self.multiproc_dir.glob("metrics-*.json"):
+                data = self._read_json(path)
+                if data is not None:
+                    files.append((path, data))
+            newest: Dict[int, int] = {}
+            for _, data in files:
+                pid = data.get("pid", 0)
+                newest[pid] = max(newest.get(pid, 0), data.get("started", 0))
+
+            dead = []
+            for path, data in files:
+                pid, started = data.get("pid", 0), data.get("started", 0)
+                if pid == os.getpid() and started == self._started:
+                    continue
+                if pid != os.getpid() and started == newest[pid] and self._alive(pid):
+                    processes.append((data.get("metrics", {}), True))
+                else:
+                    dead.append((path, data.get("metrics", {})))
+
+            totals = (self._read_json(self._totals_file) or {}).get("metrics", {})
+            if dead:
+                merged = _merge([(totals, False)] + [(metrics, False) for _, metrics in dead])
+                totals = _serializable(merged)
+                self._write_json(self._totals_file, {"metrics": totals})
+                for path, _ in dead:
+                    path.unlink(missing_ok=True)
+            processes.append((totals, False))
+        return processes
+
+    def merged(self) -> Dict[str, Dict]:
+        """合并所有进程的数据"""
+        return _merge(self._all_processes())
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        for name, entry in sorted(self.merged().items()):
+            labelnames = tuple(entry["labels"])
+            lines.append(f"# HELP {name} {entry['help']}")
+            lines.append(f"# TYPE {name} {entry['type']}")
+            for key, value in sorted(entry["samples"].items()):
+                if entry["type"] != "histogram":
+                    lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(entry["buckets"]) + [math.inf], counts):
+                    cumulative += bucket_count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(
+                        f"{name}_bucket{_format_labels(labelnames, key, le)} {cumulative}"
+                    )
+                lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labelnames, key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge(processes: Iterable[Tuple[Dict, bool]]) -> Dict[str, Dict]:
+    """合并多个进程的指标数据，samples 为 {标签值元组: 值}"""
+    merged: Dict[str, Dict] = {}
+    for metrics, alive in processes:
+        for name, entry in metrics.items():
+            if entry["type"] == "gauge" and not alive:
+                continue  # 已退出进程的仪表值没有意义
+            target = merged.setdefault(name, dict(entry, samples={}))
+            if entry["type"] == "histogram" and entry.get("buckets") != target.get("buckets"):
+                continue  # 分桶定义不同（部署过程中新旧版本混跑）时跳过
+            samples = target["samples"]
+            for labels, value in entry["samples"]:
+                key = tuple(labels)
+                if entry["type"] == "histogram":
+                    state = samples.setdefault(key, [[0] * len(value[0]), 0.0, 0])
+                    state[0] = [a + b for a, b in zip(state[0], value[0])]
+                    state[1] += value[1]
+                    state[2] += value[2]
+                else:
+                    samples[key] = samples.get(key, 0) + value
+    return merged
+
+
+def _serializable(merged: Dict[str, Dict]) -> Dict[str, Dict]:
+    """_merge 的结果转换回 collect() 的格式（samples 为 [[标签值列表, 值]]）"""
+    return {
+        name: dict(entry, samples=[[list(k), v] for k, v in entry["samples"].items()])
+        for name, entry in merged.items()
+    }
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """进程内共享的指标注册表"""
+    return _registry
+
+
+# ---------- 服务使用的指标 ----------
+
+REQUEST_DURATION = _registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP请求耗时（流式接口为开始返回响应的时间）",
+    ("route", "method", "status"),
+)
+LLM_DURATION = _registry.histogram(
+    "llm_request_duration_seconds",
+    "LLM调用耗时（流式调用到最后一个块）",
+    ("model", "stage", "outcome"),
+)
+STREAMS_IN_FLIGHT = _registry.gauge(
+    "sse_streams_in_flight",
+    "正在输出的SSE流数量",
+    ("route",),
+)
+QUEUE_DEPTH = _registry.gauge(
+    "queue_depth",
+    "后台队列中等待处理的数量",
+    ("queue",),
+)
+PROCESS_RESIDENT_MEMORY = _registry.gauge(
+    "process_resident_memory_bytes",
+    "进程常驻内存（RSS）",
+)
+HISTORY_SAVE_DURATION = _registry.histogram(
+    "history_save_duration_seconds",
+    "历史记录写操作从提交到事务完成的耗时",
+    ("operation", "outcome"),
+)
+LLM_TIME_TO_FIRST_TOKEN = _registry.histogram(
+    "llm_time_to_first_token_seconds",
+    "LLM流式调用从发起请求到收到第一个内容块的时间",
+    ("model", "stage"),
+)
+LLM_CHUNK_GAP = _registry.histogram(
+    "llm_inter_chunk_gap_seconds",
+    "LLM流式调用相邻两个块之间等待上游的时间",
+    ("model", "stage"),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LLM_STREAM_STALLS = _registry.counter(
+    "llm_stream_stalls_total",
+    "LLM流式调用中等待时间超过阈值（LLM_STALL_SECONDS）的次数",
+    ("model", "stage"),
+)
+LLM_OUTPUT_RATE = _registry.histogram(
+    "llm_output_chars_per_second",
+    "LLM流式调用从第一个内容块到结束的输出速度（字符/秒）",
+    ("model", "stage"),
+    buckets=(10, 25, 50, 100, 200, 400, 800, 1600),
+)
+LLM_TOKENS = _registry.counter(
+    "llm_tokens_total",
+    "LLM调用消耗的token数（kind: prompt/completion）",
+    ("model", "stage", "kind"),
+)
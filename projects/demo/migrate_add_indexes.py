@@ -0,0 +1,87 @@
+"""
+数据库迁移脚本：为历史记录表创建复合索引
+
+使用方法：
+    python migrate_add_indexes.py
+
+功能：
+    1. 创建与查询路径对应的复合索引（如果不存在）
+       - (user_id, created_at)：按用户分页获取历史记录
+       - (user_id, user_sequence)：按用户内部序号查询、计算下一个序号
+       - (user_id, score)：按用户查找缺失评分的记录
+    2. 删除被复合索引覆盖的旧单列索引
+"""
+
+import sys
+from sqlalchemy import text
+from app import app
+from user_models import db
+
+COMPOSITE_INDEXES = {
+    "ix_histories_user_id_created_at": "user_id, created_at",
+    "ix_histories_user_id_user_sequence": "user_id, user_sequence",
+    "ix_histories_user_id_score": "user_id, score",
+}
+
+# 旧模型中 index=True 生成的单列索引，已被以 user_id 开头的复合索引取代
+LEGACY_INDEXES = (
+    "ix_histories_user_id",
+    "ix_histories_user_sequence",
+    "ix_histories_created_at",
+)
+
+
+def migrate_indexes():
+    """创建复合索引并删除冗余的单列索引"""
+    inspector = db.inspect(db.engine)
+    existing = {index["name"] for index in inspector.get_indexes("histories")}
+    dialect = db.engine.dialect.name
+
+    try:
+        with db.engine.begin() as conn:
+            for name, columns in COMPOSITE_INDEXES.items():
+                if name in existing:
+                    print(f"✓ 索引 {name} 已存在，跳过")
+                    continue
+                print(f"正在创建索引 {name} ({columns})...")
+                conn.execute(text(f"CREATE INDEX {name} ON histories ({columns})"))
+
+            for name in LEGACY_INDEXES:
+                if name not in existing:
+                    continue
+                print(f"正在删除冗余索引 {name}...")
+                if dialect == "mysql":
+                    conn.execute(text(f"DROP INDEX {name} ON histories"))
+                else:
+                    conn.execute(text(f"DROP INDEX {name}"))
+
+            if dialect == "sqlite":
+                # 更新统计信息，帮助查询规划器选择新索引
+                conn.execute(text("ANALYZE histories"))
+        return True
+    except Exception as e:
+        print(f"✗ 迁移索引失败: {str(e)}")
+        return False
+
+
+def main():
+    """主函数"""
+    print("=" * 60)
+    print("数据库迁移脚本：创建历史记录复合索引")
+    print("=" * 60)
+
+    with app.app_context():
+        # 确保数据库表已创建
+        db.create_all()
+
+        if not migrate_indexes():
+            print("\n迁移失败")
+            sys.exit(1)
+
+        print("\n" + "=" * 60)
+        print("迁移完成！")
+        print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,8 +13,9 @@ import os
 import sys
 from pathlib import Path
 from app import app
-from user_models import db, History
+from user_models import db, History, User
 from model import CommentParser
+from stats_service import apply_score_change
 
 
 def migrate_add_score_field():
@@ -70,36 +71,68 @@ def upgrade_existing_records():
     """升级现有记录：从comment中解析score并更新"""
     print("\n开始升级现有记录...")
 
-    # 查询所有有comment但没有score的记录
-    histories = History.query.filter(
-        History.comment.isnot(None),
-        History.comment != "",
-        (History.score.is_(None) | (History.score == 0)),
-    ).all()
+    updated_count = 0
+    failed_count = 0
+    found_count = 0
+
+    # 按用户分批处理：每批走(user_id, score)索引查询，并单独提交
+    user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+    for user_id in user_ids:
+        # 查询该用户有comment但没有score的记录
+        histories = History.query.filter(
+            History.user_id == user_id,
+            History.comment.isnot(None),
+            History.comment != "",
+            (History.score.is_(None) | (History.score == 0)),
+        ).all()
+        if not histories:
+            continue
+
+        found_count += len(histories)
+        updated, failed = _upgrade_batch(histories)
+        updated_count += updated
+        failed_count += failed
+
+        # 提交该用户的更改
+        try:
+            db.session.commit()
+            print(f"  用户 {user_id}: 处理 {len(histories)} 条记录")
+        except Exception as e:
+            db.session.rollback()
+            print(f"\n✗ 提交用户 {user_id} 的更改失败: {str(e)}")
+            return False
 
-    if not histories:
+    if not found_count:
         print("✓ 没有需要升级的记录")
         return True
 
-    print(f"找到 {len(histories)} 条需要升级的记录")
+    print(f"\n✓ 升级完成！共找到 {found_count} 条需要升级的记录")
+    print(f"  - 成功更新: {updated_count} 条")
+    print(f"  - 解析失败: {failed_count} 条")
+    return True
+
 
-    parser = CommentParser()
+def _upgrade_batch(histories):
+    """从comment中解析score并更新一批记录（不提交）"""
     updated_count = 0
     failed_count = 0
 
     for i, history in enumerate(histories, 1):
         try:
-            # 解析comment获取score
-            parsed_comment = parser.parse_complete(history.comment)
+            # 解析comment获取score（每条记录使用新的解析器，避免沿用上一条的结果）
+            parsed_comment = CommentParser().parse_complete(history.comment)
             score = parsed_comment.get("score")
 
             if score is not None:
+                # 同步更新评分统计汇总表（与记录在同一事务中提交）
+                apply_score_change(history, history.score, score)
                 history.score = score
                 updated_count += 1
                 if i % 10 == 0:
                     print(f"  已处理 {i}/{len(histories)} 条记录...")
             else:
                 # 如果解析不出score，设置为None（保持NULL）
+                apply_score_change(history, history.score, None)
                 history.score = None
                 failed_count += 1
         except Exception as e:
@@ -107,17 +140,7 @@ def upgrade_existing_records():
             failed_count += 1
             continue
 
-    # 提交所有更改
-    try:
-        db.session.commit()
-        print(f"\n✓ 升级完成！")
-        print(f"  - 成功更新: {updated_count} 条")
-        print(f"  - 解析失败: {failed_count} 条")
-        return True
-    except Exception as e:
-        db.session.rollback()
-        print(f"\n✗ 提交更改失败: {str(e)}")
-        return False
+    return updated_count, failed_count
 
 
 def main():
@@ -0,0 +1,106 @@
+"""
+数据库迁移脚本：按当前压缩配置批量重写历史记录的大文本字段
+
+使用方法：
+    HISTORY_TEXT_COMPRESSION=zlib python migrate_compress_history.py [--batch-size 500] [--vacuum]
+
+功能：
+    1. 按主键分批读取 answer / comment / polished_answer 的存储值
+    2. 解压后按当前配置重新压缩（HISTORY_TEXT_COMPRESSION=none 时还原为明文），
+       只更新存储值发生变化的记录，每批单独提交
+    3. 可选执行 VACUUM（仅SQLite）回收磁盘空间
+"""
+
+import argparse
+import sys
+from sqlalchemy import select, text
+from app import app
+from user_models import db, History
+from text_compression import compress_text, decompress_value, get_compression_mode
+
+TEXT_COLUMNS = ("answer", "comment", "polished_answer")
+
+
+def recompress_histories(batch_size=500):
+    """
+    分批重写历史记录的文本字段
+    Returns: (scanned: int, rewritten: int)
+    """
+    table = History.__table__
+    binary = db.engine.dialect.name == "sqlite"
+    mode = get_compression_mode()
+    last_id = 0
+    scanned = 0
+    rewritten = 0
+
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, *[table.c[name] for name in TEXT_COLUMNS])
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            changed = {}
+            for name in TEXT_COLUMNS:
+                stored = getattr(row, name)
+                if stored is None:
+                    continue
+                target = compress_text(
+                    decompress_value(stored), mode=mode, binary=binary
+                )
+                if target != stored:
+                    changed[name] = target
+            if changed:
+                updates.append((row.id, changed))
+
+        for history_id, changed in updates:
+            db.session.execute(
+                table.update().where(table.c.id == history_id).values(**changed)
+            )
+        db.session.commit()
+
+        scanned += len(rows)
+        rewritten += len(updates)
+        last_id = rows[-1].id
+        print(f"  已处理 {scanned} 条记录，重写 {rewritten} 条...")
+
+    return scanned, rewritten
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="按当前压缩配置重写历史记录文本字段")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--vacuum", action="store_true", help="完成后执行VACUUM（SQLite）")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"数据库迁移脚本：历史记录文本压缩（模式: {get_compression_mode()}）")
+    print("=" * 60)
+
+    with app.app_context():
+        db.create_all()
+        try:
+            scanned, rewritten = recompress_histories(batch_size=args.batch_size)
+        except Exception as e:
+            db.session.rollback()
+            print(f"\n✗ 迁移失败: {str(e)}")
+            sys.exit(1)
+
+        if args.vacuum and db.engine.dialect.name == "sqlite":
+            print("正在执行 VACUUM...")
+            with db.engine.connect() as conn:
+                conn.execute(text("VACUUM"))
+
+        print("\n" + "=" * 60)
+        print(f"迁移完成！共扫描 {scanned} 条记录，重写 {rewritten} 条")
+        print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import math
 import os
 import time
 import yaml
@@ -8,12 +9,34 @@ from dotenv import load_dotenv
 from typing import Dict, List, Optional
 
 from telemetry import log_event
-from question_bank import get_question_bank
+from metrics import (
+    LLM_CHUNK_GAP,
+    LLM_DURATION,
+    LLM_OUTPUT_RATE,
+    LLM_STREAM_STALLS,
+    LLM_TIME_TO_FIRST_TOKEN,
+    LLM_TOKENS,
+)
+from question_bank import get_question_registry
+from tracing import KIND_CLIENT, start_span, traced
 
 load_dotenv()
 
 PROMPT_DIR = Path(__file__).parent / "prompt"
 
+# 流式调用中等待上游超过该秒数记为一次卡顿
+LLM_STALL_SECONDS = float(os.getenv("LLM_STALL_SECONDS", "5"))
+# 流式调用时请求上游在最后一个块中返回usage（不支持stream_options的服务可设为0）
+LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "1") != "0"
+
+# token用量监听器：fn(model_name, stage, prompt_tokens, completion_tokens)
+_usage_listeners = []
+
+
+def add_usage_listener(listener):
+    """注册token用量监听器（在调用LLM的线程中执行，如app用来写入用量汇总表）"""
+    _usage_listeners.append(listener)
+
 
 def load_prompt(filename: str) -> str:
     """从文件中加载提示词"""
@@ -227,26 +250,32 @@ class CommentParser:
 
 
 class Evaluator:
+    @traced("evaluator.init")
     def __init__(
         self,
         question: str = None,
         instruction: str = None,
         teacher: str = None,
         students: list = None,
+        bank: str = None,
     ):
         """初始化评估器
         Args:
-            question: 题名（字符串），如果提供则从题库加载（优先级最高）
+            question: 题名（字符串），如果提供则从题库加载（优先级最高），
+                可以带题库前缀，如 "ielts:12"
             instruction: 指令文本（当question未提供时使用）
             teacher: 教师问题（当question未提供时使用）
             students: 学生回复列表（当question未提供时使用）
+            bank: 题库名，question不带前缀时使用，默认为默认题库
         """
         self.question_markdown = None  # markdown格式字符串
 
         if question:
             # 从题库加载，使用新的markdown格式API
-            question_bank = get_question_bank()
-            question_obj = question_bank.get_question(question, only_valid=True)
+            question_bank, question_id = get_question_registry().resolve(
+                question, bank
+            )
+            question_obj = question_bank.get_question(question_id, only_valid=True)
             if not question_obj:
                 raise ValueError(f"题目不存在或无效: {question}")
             # 使用新的markdown格式API获取完整字符串
@@ -349,7 +378,7 @@ class Evaluator:
             base_url=base_url,
         )
         completion = _call_llm(
-            client, model_name, self.generate_prompt(answer), stream
+            client, model_name, self.generate_prompt(answer), stream, stage="evaluate"
         )
         if stream:
             return completion
@@ -357,6 +386,7 @@ class Evaluator:
 
 
 class Polisher:
+    @traced("polisher.init")
     def __init__(self, answer: str, comment: str):
         self.answer = answer
         self.comment = comment
@@ -387,14 +417,122 @@ class Polisher:
             api_key=os.getenv("DASHSCOPE_API_KEY"),
             base_url=base_url,
         )
-        completion = _call_llm(client, model_name, self.generate_prompt(), stream)
+        completion = _call_llm(
+            client, model_name, self.generate_prompt(), stream, stage="polish"
+        )
         if stream:
             return completion
         return completion.choices[0].message.content
 
 
-def _call_llm(client: OpenAI, model_name: str, messages, stream: bool = False):
-    """调用 LLM 并记录基础遥测（时延/错误）。"""
+def _report_usage(usage, model_name: str, stage: str, request_id) -> Dict:
+    """记录一次调用的token用量（指标 + 监听器），返回附加到遥测事件的字段"""
+    if usage is None:
+        return {}
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or 0
+    LLM_TOKENS.inc(prompt_tokens, model=model_name, stage=stage, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, model=model_name, stage=stage, kind="completion")
+    for listener in _usage_listeners:
+        try:
+            listener(model_name, stage, prompt_tokens, completion_tokens)
+        except Exception as e:
+            log_event(
+                "llm.usage.listener_error",
+                request_id=request_id,
+                error=str(e),
+                error_type=type(e).__name__,
+            )
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩百分位数（输入需已排序）"""
+    index = max(math.ceil(q * len(sorted_values)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class _StreamStats:
+    """
+    LLM流式调用的体感速度统计
+
+    块间隔只统计等待上游返回下一个块的时间，不包含调用方处理块（解析、SSE输出）的时间
+    """
+
+    def __init__(self, start: float, model_name: str, stage: str, request_id):
+        self.start = start
+        self.labels = {"model": model_name, "stage": stage}
+        self.request_id = request_id
+        self.first_token_at = None
+        self.last_chunk_at = None
+        self.chunks = 0
+        self.chars = 0
+        self.stalls = 0
+        self.gaps: List[float] = []
+        self.usage = None
+
+    def record(self, chunk, waited: float, now: float):
+        """记录一个块（waited: 等待这个块的时间）"""
+        self.chunks += 1
+        self.last_chunk_at = now
+        if self.chunks > 1:
+            self.gaps.append(waited)
+            LLM_CHUNK_GAP.observe(waited, **self.labels)
+            # 第一个块之前的等待属于首字时间（TTFT），不算卡顿
+            if waited >= LLM_STALL_SECONDS:
+                self.stalls += 1
+                LLM_STREAM_STALLS.inc(**self.labels)
+                log_event(
+                    "llm.stream.stall",
+                    request_id=self.request_id,
+                    llm_model=self.labels["model"],
+                    stage=self.labels["stage"],
+                    gap_ms=int(waited * 1000),
+                    chunk_index=self.chunks,
+                )
+
+        if getattr(chunk, "usage", None) is not None:
+            self.usage = chunk.usage  # include_usage时最后一个块带用量（choices为空）
+        content = None
+        if getattr(chunk, "choices", None):
+            content = getattr(chunk.choices[0].delta, "content", None)
+        if content:
+            self.chars += len(content)
+            if self.first_token_at is None:
+                self.first_token_at = now
+                LLM_TIME_TO_FIRST_TOKEN.observe(now - self.start, **self.labels)
+
+    def summary(self) -> Dict:
+        """遥测字段；结束时记录输出速度指标"""
+        fields = {"chunks": self.chunks, "output_chars": self.chars, "stalls": self.stalls}
+        if self.first_token_at is not None:
+            fields["ttft_ms"] = int((self.first_token_at - self.start) * 1000)
+            generating = self.last_chunk_at - self.first_token_at
+            if generating > 0:
+                rate = self.chars / generating
+                fields["chars_per_sec"] = round(rate, 1)
+                LLM_OUTPUT_RATE.observe(rate, **self.labels)
+        if self.gaps:
+            gaps = sorted(self.gaps)
+            fields["gap_p50_ms"] = int(_percentile(gaps, 0.5) * 1000)
+            fields["gap_p90_ms"] = int(_percentile(gaps, 0.9) * 1000)
+            fields["gap_p99_ms"] = int(_percentile(gaps, 0.99) * 1000)
+            fields["gap_max_ms"] = int(gaps[-1] * 1000)
+        return fields
+
+
+def _call_llm(
+    client: OpenAI,
+    model_name: str,
+    messages,
+    stream: bool = False,
+    stage: str = "other",
+):
+    """调用 LLM 并记录基础遥测（时延/错误）和指标（按模型/阶段的耗时直方图）。"""
     try:
         from flask import g
 
@@ -404,54 +542,112 @@ def _call_llm(client: OpenAI, model_name: str, messages, stream: bool = False):
 
     start = time.perf_counter()
     log_event(
-        "llm.call.start", request_id=request_id, llm_model=model_name, stream=stream
+        "llm.call.start",
+        request_id=request_id,
+        llm_model=model_name,
+        stage=stage,
+        stream=stream,
     )
+
+    def _observe(outcome):
+        elapsed = time.perf_counter() - start
+        LLM_DURATION.observe(elapsed, model=model_name, stage=stage, outcome=outcome)
+        return int(elapsed * 1000)
+
+    # 流式调用的span在输出结束时才结束，拆分为首字等待(llm.ttft)和输出(llm.stream)两段
+    llm_span = start_span(
+        "llm.call",
+        kind=KIND_CLIENT,
+        **{"llm.model": model_name, "llm.stage": stage, "llm.stream": stream},
+    )
+
+    options = {}
+    if stream and LLM_STREAM_USAGE:
+        options["stream_options"] = {"include_usage": True}
     try:
         completion = client.chat.completions.create(
-            model=model_name, messages=messages, stream=stream
+            model=model_name, messages=messages, stream=stream, **options
         )
     except Exception as e:
         log_event(
             "llm.call.error",
             request_id=request_id,
             llm_model=model_name,
-            llm_latency_ms=int((time.perf_counter() - start) * 1000),
+            llm_latency_ms=_observe("error"),
             llm_error=str(e),
+            stage=stage,
             stream=stream,
         )
+        llm_span.record_exception(e)
+        llm_span.end()
         raise
 
     if not stream:
+        usage = _report_usage(
+            getattr(completion, "usage", None), model_name, stage, request_id
+        )
         log_event(
             "llm.call.success",
             request_id=request_id,
             llm_model=model_name,
-            llm_latency_ms=int((time.perf_counter() - start) * 1000),
+            llm_latency_ms=_observe("success"),
+            stage=stage,
             stream=False,
+            **usage,
         )
+        llm_span.set_attributes(**usage)
+        llm_span.end()
         return completion
 
     def _stream_wrapper():
+        stats = _StreamStats(start, model_name, stage, request_id)
+        phase = start_span("llm.ttft", parent=llm_span, start_ns=llm_span.start_ns)
+        streaming = False
         try:
-            for chunk in completion:
+            iterator = iter(completion)
+            while True:
+                waiting = time.perf_counter()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    break
+                now = time.perf_counter()
+                stats.record(chunk, now - waiting, now)
+                if not streaming and stats.first_token_at is not None:
+                    streaming = True
+                    phase.end()
+                    phase = start_span("llm.stream", parent=llm_span)
                 yield chunk
+            summary = stats.summary()
+            usage = _report_usage(stats.usage, model_name, stage, request_id)
             log_event(
                 "llm.call.success",
                 request_id=request_id,
                 llm_model=model_name,
-                llm_latency_ms=int((time.perf_counter() - start) * 1000),
+                llm_latency_ms=_observe("success"),
+                stage=stage,
                 stream=True,
+                **summary,
+                **usage,
             )
+            llm_span.set_attributes(**summary, **usage)
         except Exception as e:
             log_event(
                 "llm.call.error",
                 request_id=request_id,
                 llm_model=model_name,
-                llm_latency_ms=int((time.perf_counter() - start) * 1000),
+                llm_latency_ms=_observe("error"),
                 llm_error=str(e),
+                stage=stage,
                 stream=True,
+                **stats.summary(),
             )
+            llm_span.record_exception(e)
             raise
+        finally:
+            # 客户端断开（GeneratorExit）时同样结束
+            phase.end()
+            llm_span.end()
 
     return _stream_wrapper()
 
@@ -6,10 +6,25 @@ TPO.json 数据解析脚本
 1. 清理markdown格式
 2. 优化数据结构：teacher下面即名字，添加teacher_content字段
 3. students下使用Object列表，采用 {name:"name",content:"content"}的格式
+4. 增量处理：流式读取、多进程处理，只改写新增/变化的题目
+5. 入库校验：写入is_valid字段，并生成校验报告和隔离文件（见question_validation.py）
+
+使用方法：
+    python parse_tpo.py [TPO.json] [TOP_generated.json] [--workers N] [--full] [--report report.json]
 """
 
+import argparse
+import hashlib
 import json
+import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from question_validation import prepare_question, validate_bank
+
+# 处理逻辑的版本，变化后旧的哈希记录失效（所有条目重新处理）
+PROCESSOR_VERSION = 2
 
 
 def clean_markdown(text):
@@ -89,63 +104,359 @@ def extract_student_info(student_text):
             return {"name": "", "content": student_text.strip()}
 
 
-def parse_tpo_data(input_file, output_file):
+def process_item(item):
+    """处理单个条目（在工作进程中执行）"""
+    processed_item = {
+        "id": item.get("id"),
+        "instruction": clean_markdown(item.get("instruction", "")),
+    }
+
+    # 处理teacher字段
+    teacher_text = item.get("teacher", "")
+    teacher_name, teacher_content = extract_teacher_info(teacher_text)
+    processed_item["teacher"] = teacher_name
+    processed_item["teacher_content"] = teacher_content
+
+    # 处理students字段
+    students = item.get("students", [])
+    processed_students = []
+    for student_text in students:
+        student_info = extract_student_info(student_text)
+        # 只添加有名字或内容的学生
+        if student_info["name"] or student_info["content"]:
+            processed_students.append(student_info)
+
+    processed_item["students"] = processed_students
+
+    # 入库校验：规范化并写入is_valid，题库加载时不再重复校验
+    processed_item, _ = prepare_question(processed_item)
+    return processed_item
+
+
+def content_hash(item):
+    """条目内容哈希（键排序后的紧凑JSON）"""
+    data = json.dumps(item, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def iter_json_array(path, chunk_size=1 << 20):
+    """
+    流式读取JSON数组文件，逐个返回 (元素, 元素原始文本)
+    只在内存中保留当前读取块，不需要一次载入整个文件
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer, pos, eof = "", 0, False
+
+        def fill():
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+
+        def next_token():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if eof:
+                    raise ValueError(f"JSON数组不完整: {path}")
+                fill()
+
+        fill()
+        if next_token() != "[":
+            raise ValueError(f"不是JSON数组: {path}")
+        pos += 1
+        if next_token() == "]":
+            return
+
+        while True:
+            next_token()
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # 数值等标量可能被块边界截断，读到缓冲区末尾时补读后重试
+                if end == len(buffer) and not eof:
+                    raise json.JSONDecodeError("truncated", buffer, end)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            yield value, buffer[pos:end]
+            pos = end
+
+            token = next_token()
+            pos += 1
+            if token == "]":
+                return
+            if token != ",":
+                raise ValueError(f"JSON数组格式错误: {path}")
+
+
+def format_output_item(item):
+    """按输出文件的格式序列化单个条目（与 json.dump(list, indent="\t") 一致）"""
+    text = json.dumps(item, ensure_ascii=False, indent="\t")
+    return "\t" + text.replace("\n", "\n\t")
+
+
+def load_manifest(manifest_file):
+    """读取上次运行记录的内容哈希（id -> {source, output}）和条目顺序"""
+    try:
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"questions": {}, "order": []}
+    if manifest.get("version") != PROCESSOR_VERSION:
+        return {"questions": {}, "order": manifest.get("order", [])}
+    return manifest
+
+
+def _batched(iterable, size):
+    batch = []
+    for element in iterable:
+        batch.append(element)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _scan_source(input_file, manifest, output_exists, workers, batch_size):
+    """
+    第一遍：流式读取源文件，只处理内容有变化的条目
+    同一id出现多次时保留最后出现的条目（位置按第一次出现），与加载题库时的行为一致
+    Returns: (新的条目顺序, 新的哈希记录, 变化条目 id -> 处理结果, 报告)
+    """
+    previous = manifest.get("questions", {}) if output_exists else {}
+    order, hashes, changed = [], {}, {}
+    status = {}  # id -> added / changed / unchanged（以最后出现的条目为准）
+    duplicates = []
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        items = (item for item, _ in iter_json_array(input_file))
+        for batch in _batched(items, batch_size):
+            todo = {}
+            for item in batch:
+                key = str(item.get("id"))
+                if key in hashes:
+                    duplicates.append(key)
+                else:
+                    order.append(key)
+                source_hash = content_hash(item)
+                old = previous.get(key)
+                if old and old["source"] == source_hash:
+                    hashes[key] = old
+                    status[key] = "unchanged"
+                    changed.pop(key, None)
+                    todo.pop(key, None)
+                else:
+                    hashes[key] = {"source": source_hash, "output": None}
+                    todo[key] = item
+
+            if executor is not None:
+                results = executor.map(process_item, list(todo.values()), chunksize=16)
+            else:
+                results = map(process_item, list(todo.values()))
+
+            for key, processed in zip(list(todo), results):
+                output_hash = content_hash(processed)
+                hashes[key]["output"] = output_hash
+                old = previous.get(key)
+                if old and old["output"] == output_hash:
+                    # 源数据格式变化但处理结果相同
+                    status[key] = "unchanged"
+                    changed.pop(key, None)
+                    continue
+                changed[key] = processed
+                status[key] = "changed" if old else "added"
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    seen = set(order)
+    report = {
+        "added": [key for key in order if status[key] == "added"],
+        "changed": [key for key in order if status[key] == "changed"],
+        "removed": [key for key in previous if key not in seen],
+        "duplicates": duplicates,
+        "unchanged": sum(1 for key in order if status[key] == "unchanged"),
+        "total": len(order),
+    }
+    return order, hashes, changed, report
+
+
+class StaleOutputError(Exception):
+    """输出文件中找不到未变化条目的原文（输出文件被修改过，与哈希记录不一致）"""
+
+
+def _write_output(output_file, order, changed):
+    """
+    第二遍：按新顺序写出结果，未变化的条目直接复制旧文件中的原始文本
+    先写临时文件再替换，写入过程中读取方看到的始终是完整文件
+    Raises: StaleOutputError 旧文件中缺少需要复制的条目
     """
-    解析TPO.json文件并生成清理后的数据
+    old_items = iter_json_array(output_file) if os.path.exists(output_file) else iter(())
+    pending = {}  # 顺序调整时暂存读到的旧条目
+
+    def old_text(key):
+        while key not in pending:
+            try:
+                item, raw = next(old_items)
+            except StopIteration:
+                raise StaleOutputError(f"输出文件中缺少条目: {key}") from None
+            pending[str(item.get("id"))] = raw
+        return pending.pop(key)
+
+    tmp_file = f"{output_file}.tmp"
+    try:
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            if not order:
+                f.write("[]")
+            else:
+                f.write("[\n")
+                for index, key in enumerate(order):
+                    if index:
+                        f.write(",\n")
+                    if key in changed:
+                        f.write(format_output_item(changed[key]))
+                    else:
+                        f.write("\t" + old_text(key))
+                f.write("\n]")
+    except StaleOutputError:
+        os.remove(tmp_file)
+        raise
+    os.replace(tmp_file, output_file)
+
+
+def parse_tpo_data(
+    input_file,
+    output_file,
+    workers=None,
+    full=False,
+    batch_size=256,
+    manifest_file=None,
+):
+    """
+    解析TPO.json文件并增量更新生成的数据
+
+    流式读取源文件，按条目计算内容哈希，只处理（多进程）和写入新增/变化的条目；
+    没有任何变化时不改写输出文件。哈希记录保存在 <输出文件>.manifest.json
 
     Args:
         input_file: 输入的TPO.json文件路径
         output_file: 输出的TOP_generated.json文件路径
-    """
-    # 读取输入文件
-    with open(input_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
+        workers: 工作进程数，默认CPU核数；1表示在当前进程处理
+        full: 忽略上次的哈希记录，全部重新处理
+        batch_size: 每批读取的条目数（控制内存占用）
+        manifest_file: 哈希记录文件路径
 
-    # 处理每个条目
-    processed_data = []
-    for item in data:
-        processed_item = {
-            "id": item.get("id"),
-            "instruction": clean_markdown(item.get("instruction", "")),
-        }
+    Returns:
+        dict: 运行报告（added/changed/removed/duplicates的id、unchanged数量、是否写入等）
+    """
+    started = time.perf_counter()
+    manifest_file = manifest_file or f"{output_file}.manifest.json"
+    manifest = {"questions": {}, "order": []} if full else load_manifest(manifest_file)
+    output_exists = os.path.exists(output_file)
 
-        # 处理teacher字段
-        teacher_text = item.get("teacher", "")
-        teacher_name, teacher_content = extract_teacher_info(teacher_text)
-        processed_item["teacher"] = teacher_name
-        processed_item["teacher_content"] = teacher_content
+    order, hashes, changed, report = _scan_source(
+        input_file,
+        manifest,
+        output_exists,
+        workers or os.cpu_count() or 1,
+        batch_size,
+    )
 
-        # 处理students字段
-        students = item.get("students", [])
-        processed_students = []
-        for student_text in students:
-            student_info = extract_student_info(student_text)
-            # 只添加有名字或内容的学生
-            if student_info["name"] or student_info["content"]:
-                processed_students.append(student_info)
+    needs_write = (
+        not output_exists
+        or changed
+        or report["removed"]
+        or order != manifest.get("order")
+    )
+    if needs_write:
+        try:
+            _write_output(output_file, order, changed)
+        except StaleOutputError as e:
+            if full:
+                raise
+            # 输出文件与哈希记录不一致：忽略哈希记录，全部重新处理
+            print(f"{e}，改为全量重新生成")
+            return parse_tpo_data(
+                input_file,
+                output_file,
+                workers=workers,
+                full=True,
+                batch_size=batch_size,
+                manifest_file=manifest_file,
+            )
 
-        processed_item["students"] = processed_students
+    tmp_manifest = f"{manifest_file}.tmp"
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(
+            {"version": PROCESSOR_VERSION, "questions": hashes, "order": order},
+            f,
+            ensure_ascii=False,
+        )
+    os.replace(tmp_manifest, manifest_file)
 
-        processed_data.append(processed_item)
+    report["written"] = bool(needs_write)
+    report["duration_ms"] = int((time.perf_counter() - started) * 1000)
+    return report
 
-    # 写入输出文件
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(processed_data, f, ensure_ascii=False, indent="\t")
 
-    print(f"成功解析 {len(processed_data)} 条数据")
-    print(f"输出文件: {output_file}")
+def print_report(report, output_file):
+    """打印运行报告"""
+    print(f"成功解析 {report['total']} 条数据")
+    print(
+        f"新增 {len(report['added'])}，修改 {len(report['changed'])}，"
+        f"删除 {len(report['removed'])}，未变化 {report['unchanged']}"
+    )
+    for name, label in (("added", "新增"), ("changed", "修改"), ("removed", "删除")):
+        if report[name]:
+            print(f"  {label}: {', '.join(report[name][:50])}")
+    if report["duplicates"]:
+        print(f"  重复id（保留最后出现的条目）: {', '.join(report['duplicates'])}")
+    if report["written"]:
+        print(f"输出文件: {output_file}")
+    else:
+        print(f"没有变化，未改写 {output_file}")
+    print(f"耗时 {report['duration_ms']} ms")
 
 
-if __name__ == "__main__":
-    input_file = "TPO.json"
-    output_file = "TOP_generated.json"
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="解析TPO.json并增量生成题库")
+    parser.add_argument("input", nargs="?", default="TPO.json")
+    parser.add_argument("output", nargs="?", default="TOP_generated.json")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数")
+    parser.add_argument("--full", action="store_true", help="忽略哈希记录，全部重新处理")
+    parser.add_argument("--report", default=None, help="把运行报告写入JSON文件")
+    args = parser.parse_args()
 
     try:
-        parse_tpo_data(input_file, output_file)
+        report = parse_tpo_data(
+            args.input, args.output, workers=args.workers, full=args.full
+        )
+        print_report(report, args.output)
+        validation = validate_bank(args.output)
+        print(
+            f"校验: 有效 {validation['valid']}，无效 {validation['invalid']}"
+            f"（详见 {os.path.splitext(args.output)[0]}.validation.json）"
+        )
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
         print("解析完成！")
     except FileNotFoundError:
-        print(f"错误: 找不到文件 {input_file}")
+        print(f"错误: 找不到文件 {args.input}")
     except json.JSONDecodeError as e:
         print(f"错误: JSON解析失败 - {e}")
     except Exception as e:
         print(f"错误: {e}")
+
+
+if __name__ == "__main__":
+    main()
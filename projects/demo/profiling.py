@@ -0,0 +1,168 @@
+"""
+按需的单请求 CPU 性能分析
+
+线上某个路由变慢时，不需要重新部署即可对部分请求做 cProfile：
+- PROFILE_SAMPLE_RATE：按比例抽样请求（默认 0，即关闭）
+- PROFILE_DEBUG_TOKEN：配置后，带请求头 X-Debug-Profile: <token> 的请求一定会被分析
+- PROFILE_ROUTES：只分析这些路径前缀的请求（逗号分隔，默认全部）
+
+分析覆盖视图函数以及流式响应生成器的每一次输出（只在生成器运行时开启，
+不包含等待客户端读取的时间），结果以 pstats 格式写入
+log/profiles/<时间>-<request_id>.pstats，最多保留 PROFILE_MAX_FILES（200）个：
+
+    python -m pstats log/profiles/20261019T120000-<request_id>.pstats
+"""
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import time
+from typing import Iterable, Iterator, Optional
+
+from telemetry import LOG_DIR, log_event
+
+PROFILE_DIR = LOG_DIR / "profiles"
+DEBUG_HEADER = "X-Debug-Profile"
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DEBUG_TOKEN = os.getenv("PROFILE_DEBUG_TOKEN", "")
+PROFILE_ROUTES = tuple(
+    p.strip() for p in os.getenv("PROFILE_ROUTES", "").split(",") if p.strip()
+)
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+# 写入遥测事件的耗时最多的函数数量
+PROFILE_TOP_FUNCTIONS = 10
+
+
+def profile_reason(path: str, header_value: Optional[str]) -> Optional[str]:
+    """
+    判断请求是否需要分析
+    Returns: "header"（带有效调试头）、"sampled"（被抽样）或 None
+    """
+    if PROFILE_ROUTES and not path.startswith(PROFILE_ROUTES):
+        return None
+    if (
+        header_value
+        and PROFILE_DEBUG_TOKEN
+        and hmac.compare_digest(header_value, PROFILE_DEBUG_TOKEN)
+    ):
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+class RequestProfiler:
+    """一个请求的 cProfile（只在视图函数和流式生成器运行时开启）"""
+
+    def __init__(self, request_id: str, route: str, reason: str):
+        self.request_id = request_id
+        self.route = route
+        self.reason = reason
+        self.profile = cProfile.Profile()
+        self.active = False
+        self.failed = False
+        self.finished = False
+        self.started_at = time.time()
+
+    def resume(self) -> bool:
+        """开始/继续分析；同一时间只能有一个分析器时（其他分析工具已启用）放弃本次分析"""
+        if self.failed or self.active:
+            return not self.failed
+        try:
+            self.profile.enable()
+        except ValueError:
+            self.failed = True
+            return False
+        self.active = True
+        return True
+
+    def pause(self):
+        if self.active:
+            self.profile.disable()
+            self.active = False
+
+    def wrap(self, iterable: Iterable) -> Iterator:
+        """包装流式响应：每次生成下一块时开启分析"""
+        iterator = iter(iterable)
+        try:
+            while True:
+                self.resume()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.pause()
+                yield chunk
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                self.resume()
+                try:
+                    close()
+                finally:
+                    self.pause()
+
+    def finish(self) -> Optional[str]:
+        """停止分析并写入 pstats 文件（重复调用无效）"""
+        self.pause()
+        if self.finished or self.failed:
+            return None
+        self.finished = True
+        try:
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(self.started_at))
+            path = PROFILE_DIR / f"{stamp}-{self.request_id}.pstats"
+            self.profile.dump_stats(str(path))
+            stats = pstats.Stats(self.profile, stream=io.StringIO())
+        except (OSError, TypeError) as e:
+            log_event(
+                "profile.error",
+                request_id=self.request_id,
+                route=self.route,
+                error=str(e),
+            )
+            return None
+
+        log_event(
+            "profile.saved",
+            request_id=self.request_id,
+            route=self.route,
+            reason=self.reason,
+            file=path.name,
+            cpu_ms=int(stats.total_tt * 1000),
+            calls=stats.total_calls,
+            top=_top_functions(stats, PROFILE_TOP_FUNCTIONS),
+        )
+        _cleanup(PROFILE_MAX_FILES)
+        return str(path)
+
+
+def _top_functions(stats: pstats.Stats, limit: int):
+    """按自身耗时排序的函数（"文件:行号(函数名)"、调用次数、自身耗时、累计耗时）"""
+    rows = []
+    for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append(
+            {
+                "function": f"{os.path.basename(filename)}:{line}({name})",
+                "calls": calls,
+                "self_ms": round(tottime * 1000, 2),
+                "cumulative_ms": round(cumtime * 1000, 2),
+            }
+        )
+    rows.sort(key=lambda r: -r["self_ms"])
+    return rows[:limit]
+
+
+def _cleanup(max_files: int):
+    """删除最旧的分析文件，只保留 max_files 个"""
+    files = sorted(PROFILE_DIR.glob("*.pstats"))
+    for old in files[: max(len(files) - max_files, 0)]:
+        try:
+            old.unlink()
+        except FileNotFoundError:
+            pass
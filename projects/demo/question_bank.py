@@ -7,24 +7,118 @@
 2. 将题目缓存在内存中
 3. 标记题目是否有效
 4. 通过id（字符串）访问题目
+5. 热更新：重新加载时原子替换不可变快照，可选轮询文件变化
 """
 
+import hashlib
 import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import Mapping as MappingABC
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
-from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple, Union
+from dataclasses import dataclass, field
 
+from question_index import QuestionIndex
+from telemetry import log_event
 
-@dataclass
+# 列表接口中指令的截断长度
+LIST_INSTRUCTION_LENGTH = 100
+# 题目列表响应缓存的最大条目数（超过后整体清空）
+LIST_RESPONSE_CACHE_SIZE = 256
+# 题目接口数据缓存的最大条目数（按最近最少使用淘汰）
+RECORD_CACHE_SIZE = int(os.getenv("QUESTION_RECORD_CACHE_SIZE", "1024"))
+
+# 批量接口可选择返回的字段（id总是返回）
+QUESTION_RECORD_FIELDS = (
+    "subject",
+    "instruction",
+    "professor",
+    "students",
+    "is_valid",
+    "markdown",
+)
+
+# 编译题库格式（compile_question_bank.py 生成，可直接mmap）：
+# 头部 | 索引（每题定长一项，按题目排序） | id区 | 题目记录区（每题一段紧凑JSON）
+COMPILED_SUFFIX = ".qbank"
+COMPILED_MAGIC = b"QBNK"
+COMPILED_FORMAT_VERSION = 1
+# magic, 格式版本, 保留, 题目数, 内容版本（与JSON源文件的版本相同）
+COMPILED_HEADER = struct.Struct("<4sHHI16s")
+# 记录偏移, 记录长度, id长度, 是否有效
+COMPILED_INDEX_ENTRY = struct.Struct("<QIHBx")
+
+
+_SUBJECT_RE = re.compile(r"teaching a class on (\w+)", re.IGNORECASE)
+
+
+def extract_subject(instruction: str) -> str:
+    """从指令中提取科目（如 "teaching a class on sociology" -> "sociology"）"""
+    match = _SUBJECT_RE.search(instruction)
+    return sys.intern(match.group(1)) if match else "unknown"
+
+
+class Student(NamedTuple):
+    """学生回复（元组存储，比dict节省内存）"""
+
+    name: str
+    content: str
+
+
+@dataclass(frozen=True, slots=True)
 class Question:
-    """题目数据类"""
+    """
+    题目数据类（不可变，使用__slots__）
+
+    teacher和学生名字在加载时intern，同名只保存一份；
+    markdown/Evaluator格式在第一次使用时渲染并缓存在对象上，之后直接复用
+    """
 
     id: str  # 题目ID（字符串）
     instruction: str  # 指令
     teacher: str  # 教授名字
     teacher_content: str  # 教授内容
-    students: List[Dict[str, str]]  # 学生列表，每个元素包含name和content
+    students: Tuple[Student, ...]  # 学生列表，每个元素包含name和content
     is_valid: bool  # 是否有效
+    # 科目（从指令中提取，创建时计算一次）
+    subject: str = field(default="", compare=False)
+    # 渲染结果缓存（不参与比较和repr）
+    _teacher_text: Optional[str] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _markdown_students: Optional[Tuple[str, ...]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _evaluator_students: Optional[Tuple[str, ...]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _markdown_string: Optional[str] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        if not self.subject:
+            object.__setattr__(self, "subject", extract_subject(self.instruction))
+
+    def _memoize(self, name: str, value):
+        # 冻结对象只能通过object.__setattr__写入缓存；并发时重复计算的结果相同
+        object.__setattr__(self, name, value)
+        return value
+
+    def _get_teacher_text(self) -> str:
+        if self._teacher_text is not None:
+            return self._teacher_text
+        return self._memoize(
+            "_teacher_text", f"**Professor ({self.teacher}):** {self.teacher_content}"
+        )
 
     def to_dict(self) -> Dict:
         """转换为字典格式"""
@@ -33,27 +127,28 @@ class Question:
             "instruction": self.instruction,
             "teacher": self.teacher,
             "teacher_content": self.teacher_content,
-            "students": self.students,
+            "students": [student._asdict() for student in self.students],
             "is_valid": self.is_valid,
         }
 
     def to_evaluator_format(self) -> Dict:
         """转换为Evaluator类需要的格式（兼容旧格式）"""
         # 将students转换为字符串格式（兼容旧代码）
-        students_text = []
-        for student in self.students:
-            student_name = student.get("name", "")
-            student_content = student.get("content", "")
-            if student_name and student_content:
-                students_text.append(f"**Student ({student_name}):** {student_content}")
-
-        # 构建teacher字符串（兼容旧格式）
-        teacher_text = f"**Professor ({self.teacher}):** {self.teacher_content}"
+        students_text = self._evaluator_students
+        if students_text is None:
+            students_text = self._memoize(
+                "_evaluator_students",
+                tuple(
+                    f"**Student ({student.name}):** {student.content}"
+                    for student in self.students
+                    if student.name and student.content
+                ),
+            )
 
         return {
             "instruction": self.instruction,
-            "teacher": teacher_text,
-            "students": students_text,
+            "teacher": self._get_teacher_text(),
+            "students": list(students_text),
         }
 
     def to_markdown_format(self) -> Dict[str, str]:
@@ -67,23 +162,22 @@ class Question:
             - teacher: 教授内容（带markdown格式，如 "**Professor (Doctor Diaz):** content"）
             - students: 学生回复列表（带markdown格式，如 ["**Student 1 (Name):** content", ...]）
         """
-        # 构建teacher字符串（原始markdown格式）
-        teacher_text = f"**Professor ({self.teacher}):** {self.teacher_content}"
-
         # 构建students列表（原始markdown格式，带序号）
-        students_text = []
-        for idx, student in enumerate(self.students, start=1):
-            student_name = student.get("name", "")
-            student_content = student.get("content", "")
-            if student_name and student_content:
-                students_text.append(
-                    f"**Student {idx} ({student_name}):** {student_content}"
-                )
+        students_text = self._markdown_students
+        if students_text is None:
+            students_text = self._memoize(
+                "_markdown_students",
+                tuple(
+                    f"**Student {idx} ({student.name}):** {student.content}"
+                    for idx, student in enumerate(self.students, start=1)
+                    if student.name and student.content
+                ),
+            )
 
         return {
             "instruction": self.instruction,
-            "teacher": teacher_text,
-            "students": students_text,
+            "teacher": self._get_teacher_text(),
+            "students": list(students_text),
         }
 
     def to_markdown_string(self) -> str:
@@ -94,6 +188,9 @@ class Question:
         Returns:
             str: 完整的markdown格式字符串
         """
+        if self._markdown_string is not None:
+            return self._markdown_string
+
         md_format = self.to_markdown_format()
 
         # 构建完整字符串
@@ -106,140 +203,97 @@ class Question:
             parts.append(student)
             parts.append("")
 
-        return "\n".join(parts)
+        return self._memoize("_markdown_string", "\n".join(parts))
 
 
-class QuestionBank:
-    """题库管理类"""
+def question_sort_key(question_id: str) -> int:
+    """题目排序键：数字id按数值排序，其他id排在最前（保持原有顺序）"""
+    return int(question_id) if question_id.isdigit() else 0
 
-    def __init__(self, json_file: str = "TOP_generated.json"):
-        """
-        初始化题库
 
-        Args:
-            json_file: JSON文件路径，默认为TOP_generated.json
-        """
-        self.json_file = Path(json_file)
-        self.questions: Dict[str, Question] = {}  # id -> Question
-        self._load_questions()
-
-    def _load_questions(self):
-        """从JSON文件加载题目"""
-        if not self.json_file.exists():
-            raise FileNotFoundError(f"题库文件不存在: {self.json_file}")
-
-        with open(self.json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        self.questions = {}
-        for item in data:
-            question_id = str(item.get("id", ""))
-            if not question_id:
-                continue  # 跳过没有id的题目
-
-            instruction = item.get("instruction", "").strip()
-            teacher = item.get("teacher", "").strip()
-            teacher_content = item.get("teacher_content", "").strip()
-            students = item.get("students", [])
-
-            # 验证题目是否有效
-            is_valid = self._validate_question(
-                instruction, teacher, teacher_content, students
-            )
-
-            # 确保students格式正确
-            normalized_students = self._normalize_students(students)
-
-            question = Question(
-                id=question_id,
-                instruction=instruction,
-                teacher=teacher,
-                teacher_content=teacher_content,
-                students=normalized_students,
-                is_valid=is_valid,
-            )
-
-            self.questions[question_id] = question
+class QuestionSnapshot:
+    """
+    题库快照：一次加载的全部题目及预先计算的索引，创建后不再修改
+    重新加载时构建新的快照并整体替换，已取得旧快照的请求不受影响
+    """
 
-    def _validate_question(
+    def __init__(
         self,
-        instruction: str,
-        teacher: str,
-        teacher_content: str,
-        students: List,
-    ) -> bool:
-        """
-        验证题目是否有效
-
-        有效条件：
-        1. instruction不为空
-        2. teacher不为空
-        3. teacher_content不为空
-        4. students至少有一个有效的学生（有name和content）
-        """
-        if not instruction or not teacher or not teacher_content:
-            return False
-
-        # 检查是否有至少一个有效的学生
-        if not students:
-            return False
-
-        for student in students:
-            if isinstance(student, dict):
-                name = student.get("name", "").strip()
-                content = student.get("content", "").strip()
-                if name and content:
-                    return True  # 至少有一个有效的学生即可
-            elif isinstance(student, str):
-                # 兼容旧格式（字符串格式）
-                if student.strip():
-                    return True
-
-        return False
-
-    def _normalize_students(self, students: List) -> List[Dict[str, str]]:
-        """
-        规范化students格式
-
-        将students转换为统一的格式：List[Dict[str, str]]
-        每个dict包含name和content字段
-        """
-        normalized = []
-        for student in students:
-            if isinstance(student, dict):
-                # 已经是字典格式
-                name = student.get("name", "").strip()
-                content = student.get("content", "").strip()
-                if name or content:  # 至少有一个字段不为空
-                    normalized.append(
-                        {
-                            "name": name,
-                            "content": content,
-                        }
-                    )
-            elif isinstance(student, str):
-                # 旧格式：字符串格式，需要解析
-                # 格式: "**Student 1 (Name):** content"
-                import re
-
-                match = re.match(
-                    r"\*\*Student\s+\d+\s*\(([^)]+)\):\s*(.*)", student, re.DOTALL
-                )
-                if match:
-                    name = match.group(1).strip()
-                    content = match.group(2).strip()
-                    normalized.append(
-                        {
-                            "name": name,
-                            "content": content,
-                        }
+        questions: Mapping[str, Question],
+        version: str,
+        sorted_ids: Optional[Tuple[str, ...]] = None,
+        sorted_valid_ids: Optional[Tuple[str, ...]] = None,
+    ):
+        """
+        Args:
+            questions: id -> Question（dict，或编译题库的惰性映射）
+            version: 题库内容版本
+            sorted_ids/sorted_valid_ids: 预先排好序的id（编译题库直接提供，
+                避免为了排序解码全部题目）；不提供时根据questions计算
+        """
+        if isinstance(questions, dict):
+            questions = MappingProxyType(questions)
+        self.questions: Mapping[str, Question] = questions
+        # 题库内容版本（源文件内容的哈希），用作HTTP缓存的ETag
+        self.version = version
+
+        # 按id排序的不可变数组
+        if sorted_ids is None:
+            ordered = sorted(questions.values(), key=lambda q: question_sort_key(q.id))
+            sorted_ids = tuple(q.id for q in ordered)
+            sorted_valid_ids = tuple(q.id for q in ordered if q.is_valid)
+        self.sorted_ids: Tuple[str, ...] = sorted_ids
+        self.sorted_valid_ids: Tuple[str, ...] = sorted_valid_ids
+        # 预渲染的列表条目（首次出现在列表中时生成）
+        self._list_entries: Dict[str, Dict] = {}
+        # 预渲染的题目接口数据（首次请求时生成，最多RECORD_CACHE_SIZE条）
+        self._records: "OrderedDict[str, Dict]" = OrderedDict()
+        self._records_lock = threading.Lock()
+        self._statistics = {
+            "total": len(self.sorted_ids),
+            "valid": len(self.sorted_valid_ids),
+            "invalid": len(self.sorted_ids) - len(self.sorted_valid_ids),
+        }
+        # 序列化后的列表响应缓存：(only_valid, offset, limit, format) -> JSON字符串
+        # 缓存属于快照，替换快照即失效
+        self._list_response_cache: Dict[Tuple, str] = {}
+        self._list_cache_lock = threading.Lock()
+        # 倒排索引（JSON题库在加载时创建；编译题库在第一次检索时创建，避免启动时解码全部题目）
+        self._search_index: Optional[QuestionIndex] = None
+        self._index_lock = threading.Lock()
+
+    @property
+    def search_index(self) -> QuestionIndex:
+        """题库倒排索引"""
+        index = self._search_index
+        if index is None:
+            with self._index_lock:
+                index = self._search_index
+                if index is None:
+                    order = {qid: i for i, qid in enumerate(self.sorted_ids)}
+                    index = QuestionIndex(
+                        (self.questions[qid] for qid in self.sorted_ids), order
                     )
-
-        return normalized
-
-    def reload(self):
-        """重新加载题目（当文件更新时调用）"""
-        self._load_questions()
+                    self._search_index = index
+        return index
+
+    def _list_entry(self, question_id: str) -> Dict:
+        entry = self._list_entries.get(question_id)
+        if entry is None:
+            q = self.questions[question_id]
+            entry = {
+                "id": q.id,
+                "instruction": (
+                    q.instruction[:LIST_INSTRUCTION_LENGTH] + "..."
+                    if len(q.instruction) > LIST_INSTRUCTION_LENGTH
+                    else q.instruction
+                ),
+                "teacher": q.teacher,
+                "is_valid": q.is_valid,
+                "student_count": len(q.students),
+            }
+            self._list_entries[question_id] = entry
+        return entry
 
     def get_question(
         self, question_id: str, only_valid: bool = True
@@ -263,6 +317,73 @@ class QuestionBank:
 
         return question
 
+    def get_question_record(self, question_id: str) -> Optional[Dict]:
+        """
+        获取题目接口（/question、/question/batch）返回的数据，只返回有效题目
+        结果在快照内缓存并共享，调用方不能修改
+        """
+        with self._records_lock:
+            record = self._records.get(question_id)
+            if record is not None:
+                self._records.move_to_end(question_id)
+                return record
+
+        question = self.get_question(question_id, only_valid=True)
+        if not question:
+            return None
+        record = {
+            "id": question.id,
+            "subject": question.subject,
+            "instruction": question.instruction,
+            "professor": {
+                "name": question.teacher,
+                "avatar": "",
+                "prompt": question.teacher_content,
+            },
+            "students": [
+                {
+                    "name": student.name,
+                    "avatar": "",
+                    "response": student.content,
+                }
+                for student in question.students
+            ],
+            "is_valid": question.is_valid,
+            "markdown": question.to_markdown_format(),
+        }
+        with self._records_lock:
+            self._records[question_id] = record
+            while len(self._records) > RECORD_CACHE_SIZE:
+                self._records.popitem(last=False)
+        return record
+
+    def get_question_batch(
+        self, question_ids: List[str], fields: Optional[List[str]] = None
+    ) -> Dict:
+        """
+        批量获取题目
+
+        Args:
+            question_ids: 题目ID列表（按请求顺序返回，重复的只返回一次）
+            fields: 需要返回的字段（见QUESTION_RECORD_FIELDS），None表示全部
+
+        Returns:
+            dict: questions（题目数据列表）、missing（不存在或无效的ID）
+        """
+        questions, missing = [], []
+        for question_id in dict.fromkeys(question_ids):
+            record = self.get_question_record(question_id)
+            if record is None:
+                missing.append(question_id)
+            elif fields is None:
+                questions.append(record)
+            else:
+                projected = {"id": record["id"]}
+                for name in fields:
+                    projected[name] = record[name]
+                questions.append(projected)
+        return {"questions": questions, "missing": missing}
+
     def get_question_list(
         self,
         only_valid: bool = True,
@@ -280,45 +401,112 @@ class QuestionBank:
         Returns:
             (题目列表, 总数)
         """
-        # 筛选题目
-        filtered_questions = []
-        for question in self.questions.values():
-            if only_valid and not question.is_valid:
-                continue
-            filtered_questions.append(question)
+        ids = self.sorted_valid_ids if only_valid else self.sorted_ids
+        total = len(ids)
 
-        # 按id排序
-        filtered_questions.sort(key=lambda q: int(q.id) if q.id.isdigit() else 0)
+        # 分页：直接切片预先排序好的id数组
+        end = offset + limit if limit is not None else total
+        result = [dict(self._list_entry(qid)) for qid in ids[offset:end]]
 
-        total = len(filtered_questions)
+        return result, total
 
-        # 分页
-        start = offset
-        end = offset + limit if limit is not None else len(filtered_questions)
-        paginated_questions = filtered_questions[start:end]
+    def get_question_list_response(
+        self,
+        only_valid: bool = True,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        format_type: str = "simple",
+    ) -> str:
+        """
+        获取题目列表接口的JSON响应（按参数缓存）
 
-        # 转换为字典格式（简化版，只包含基本信息）
-        result = []
-        for question in paginated_questions:
-            result.append(
-                {
-                    "id": question.id,
-                    "instruction": (
-                        question.instruction[:100] + "..."
-                        if len(question.instruction) > 100
-                        else question.instruction
-                    ),
-                    "teacher": question.teacher,
-                    "is_valid": question.is_valid,
-                    "student_count": len(question.students),
-                }
-            )
+        Args:
+            only_valid/offset/limit: 同get_question_list
+            format_type: "simple" 返回 { files: [...] }，"detailed" 返回详细格式
 
-        return result, total
+        Returns:
+            str: 序列化后的JSON
+        """
+        format_type = "detailed" if format_type == "detailed" else "simple"
+        key = (only_valid, offset, limit, format_type)
+        cached = self._list_response_cache.get(key)
+        if cached is not None:
+            return cached
+
+        ids = self.sorted_valid_ids if only_valid else self.sorted_ids
+        end = offset + limit if limit is not None else len(ids)
+        page_ids = ids[offset:end]
+        if format_type == "detailed":
+            payload = {
+                "questions": [self._list_entry(qid) for qid in page_ids],
+                "total": len(ids),
+                "offset": offset,
+                "limit": limit,
+            }
+        else:
+            payload = {"files": list(page_ids)}
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+        with self._list_cache_lock:
+            if len(self._list_response_cache) >= LIST_RESPONSE_CACHE_SIZE:
+                self._list_response_cache = {}
+            self._list_response_cache[key] = body
+        return body
 
     def get_all_valid_ids(self) -> List[str]:
-        """获取所有有效题目的ID列表"""
-        return [q.id for q in self.questions.values() if q.is_valid]
+        """获取所有有效题目的ID列表（按id排序）"""
+        return list(self.sorted_valid_ids)
+
+    def search(
+        self,
+        query: str = "",
+        subject: Optional[str] = None,
+        professor: Optional[str] = None,
+        student: Optional[str] = None,
+        only_valid: bool = True,
+        offset: int = 0,
+        limit: int = 20,
+    ) -> Dict:
+        """
+        通过倒排索引检索题目
+
+        Args:
+            query: 关键词（多个词同时命中，最后一个词按前缀匹配）
+            subject/professor/student: 按科目、教授名字、学生名字过滤
+            only_valid: 是否只返回有效题目
+            offset/limit: 分页
+
+        Returns:
+            dict: results（列表条目 + subject + score）、total、facets（科目计数）
+        """
+        found = self.search_index.search(
+            query=query,
+            subject=subject,
+            professor=professor,
+            student=student,
+            only_valid=only_valid,
+            offset=offset,
+            limit=limit,
+        )
+        results = []
+        for qid, score in found["hits"]:
+            entry = dict(self._list_entry(qid))
+            entry["subject"] = self.questions[qid].subject
+            entry["score"] = score
+            results.append(entry)
+        return {
+            "query": query,
+            "results": results,
+            "total": found["total"],
+            "offset": offset,
+            "limit": limit,
+            "facets": {
+                "subject": [
+                    {"value": value, "count": count}
+                    for value, count in found["facets"].items()
+                ]
+            },
+        }
 
     def get_question_markdown(
         self, question_id: str, only_valid: bool = True, as_string: bool = False
@@ -345,39 +533,665 @@ class QuestionBank:
 
     def get_statistics(self) -> Dict:
         """获取题库统计信息"""
-        total = len(self.questions)
-        valid_count = sum(1 for q in self.questions.values() if q.is_valid)
-        invalid_count = total - valid_count
+        return dict(self._statistics)
+
+    def memory_usage(self) -> int:
+        """
+        估算快照占用的内存（字节）：已解码的题目及其文本和渲染缓存、id数组、
+        倒排索引、列表条目、题目接口数据和列表响应缓存；
+        同一对象只计一次，intern的名字由多道题共享，不计入；
+        编译题库的mmap页属于系统页缓存，不计入
+        """
+        questions = self.questions
+        if isinstance(questions, CompiledQuestions):
+            decoded = questions.decoded_values()
+        else:
+            decoded = questions.values()
+
+        seen = set()
+
+        def sizeof(obj) -> int:
+            if obj is None or id(obj) in seen:
+                return 0
+            seen.add(id(obj))
+            size = sys.getsizeof(obj)
+            if isinstance(obj, dict):
+                for key, value in obj.items():
+                    size += sizeof(key) + sizeof(value)
+            elif isinstance(obj, (list, tuple)):
+                for item in obj:
+                    size += sizeof(item)
+            return size
+
+        total = sizeof(self.sorted_ids) + sizeof(self.sorted_valid_ids)
+        seen.update(map(id, self.sorted_ids))
+        for question in decoded:
+            total += sys.getsizeof(question)
+            total += sizeof(question.instruction)
+            total += sizeof(question.teacher_content)
+            total += sys.getsizeof(question.students)
+            seen.update((id(question.teacher), id(question.subject)))
+            for student in question.students:
+                total += sys.getsizeof(student) + sizeof(student.content)
+                seen.add(id(student.name))
+            total += sizeof(question._teacher_text) + sizeof(question._markdown_string)
+            for rendered in (question._markdown_students, question._evaluator_students):
+                total += sizeof(rendered)
+
+        if self._search_index is not None:
+            total += self._search_index.memory_usage()
+        total += sizeof(self._list_entries)
+        with self._records_lock:
+            records = list(self._records.values())
+        total += sys.getsizeof(self._records) + sum(map(sizeof, records))
+        total += sizeof(dict(self._list_response_cache))
+        return total
+
+
+def content_version(raw: bytes) -> str:
+    """根据题库源文件内容计算版本号"""
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+def encode_question_record(question: Question) -> bytes:
+    """把题目编码为编译题库中的一条记录"""
+    return json.dumps(
+        [
+            question.instruction,
+            question.teacher,
+            question.teacher_content,
+            [list(student) for student in question.students],
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def decode_question_record(question_id: str, data: bytes, is_valid: bool) -> Question:
+    """从编译题库的记录解码题目"""
+    instruction, teacher, teacher_content, students = json.loads(data)
+    return Question(
+        id=question_id,
+        instruction=instruction,
+        teacher=sys.intern(teacher),
+        teacher_content=teacher_content,
+        students=tuple(
+            Student(sys.intern(name), content) for name, content in students
+        ),
+        is_valid=is_valid,
+    )
+
+
+class CompiledQuestions(MappingABC):
+    """
+    编译题库的只读映射（id -> Question）
+
+    文件以只读方式mmap，多个worker进程共享同一份页缓存；
+    加载时只解析定长索引和id，题目在第一次访问时才解码。
+    快照被替换或题库被卸载后，最后一个持有它的请求结束时关闭映射
+    （立即关闭会让仍在读取旧快照的请求失败）
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._finalizer = weakref.finalize(self, self._mmap.close)
+
+        magic, format_version, _, count, version = COMPILED_HEADER.unpack_from(
+            self._mmap, 0
+        )
+        if magic != COMPILED_MAGIC or format_version != COMPILED_FORMAT_VERSION:
+            raise ValueError(f"不支持的编译题库格式: {path}")
+        self.version = version.decode("ascii")
+
+        index_start = COMPILED_HEADER.size
+        ids_start = index_start + COMPILED_INDEX_ENTRY.size * count
+        entries = {}
+        sorted_ids, sorted_valid_ids = [], []
+        position = ids_start
+        for offset, length, id_length, is_valid in COMPILED_INDEX_ENTRY.iter_unpack(
+            self._mmap[index_start:ids_start]
+        ):
+            question_id = sys.intern(
+                self._mmap[position : position + id_length].decode("utf-8")
+            )
+            position += id_length
+            entries[question_id] = (offset, length, bool(is_valid))
+            sorted_ids.append(question_id)
+            if is_valid:
+                sorted_valid_ids.append(question_id)
+
+        self._entries = entries
+        self.sorted_ids: Tuple[str, ...] = tuple(sorted_ids)
+        self.sorted_valid_ids: Tuple[str, ...] = tuple(sorted_valid_ids)
+        self._decoded: Dict[str, Question] = {}
+
+    def __getitem__(self, question_id: str) -> Question:
+        question = self._decoded.get(question_id)
+        if question is None:
+            offset, length, is_valid = self._entries[question_id]
+            question = decode_question_record(
+                question_id, self._mmap[offset : offset + length], is_valid
+            )
+            # 并发时可能重复解码，结果相同
+            self._decoded[question_id] = question
+        return question
+
+    def __contains__(self, question_id) -> bool:
+        return question_id in self._entries
+
+    def __iter__(self):
+        return iter(self.sorted_ids)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
+
+    def close(self):
+        """关闭映射（之后不能再解码新的题目）"""
+        self._finalizer()
+
+    def decoded_count(self) -> int:
+        """已解码的题目数量"""
+        return len(self._decoded)
+
+    def decoded_values(self) -> List[Question]:
+        """已解码的题目"""
+        return list(self._decoded.values())
+
+
+class QuestionBank:
+    """
+    题库管理类
+
+    题目数据保存在不可变的QuestionSnapshot中，reload时在旁边构建新快照，
+    构建完成后通过一次引用赋值原子替换。需要多次读取题库的调用方
+    应先通过snapshot()取得快照，保证同一请求内看到的数据一致。
+    """
+
+    def __init__(self, json_file: str = "TOP_generated.json"):
+        """
+        初始化题库
+
+        Args:
+            json_file: JSON文件路径，默认为TOP_generated.json
+        """
+        self.json_file = Path(json_file)
+        self._reload_lock = threading.Lock()
+        self._source_stat: Optional[Tuple] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._watcher_stop = threading.Event()
+        self._snapshot: QuestionSnapshot = self._load_snapshot()
+
+    def snapshot(self) -> QuestionSnapshot:
+        """获取当前题库快照"""
+        return self._snapshot
+
+    @property
+    def questions(self) -> Mapping[str, Question]:
+        """当前快照中的全部题目（id -> Question，只读）"""
+        return self._snapshot.questions
+
+    @property
+    def version(self) -> str:
+        """当前快照的内容版本"""
+        return self._snapshot.version
+
+    def _resolve_source(self) -> Path:
+        """
+        选择要加载的文件：同名的.qbank编译题库存在且不比JSON旧时优先使用，
+        否则加载JSON（编译后又修改了JSON时自动回退）
+        """
+        if self.json_file.suffix == COMPILED_SUFFIX:
+            return self.json_file
+        compiled = self.json_file.with_suffix(COMPILED_SUFFIX)
+        if compiled.exists() and (
+            not self.json_file.exists()
+            or compiled.stat().st_mtime_ns >= self.json_file.stat().st_mtime_ns
+        ):
+            return compiled
+        return self.json_file
+
+    def _read_source_stat(self) -> Tuple:
+        """JSON和编译题库的文件状态（用于轮询检测变化）"""
+        stats = []
+        for path in (self.json_file, self.json_file.with_suffix(COMPILED_SUFFIX)):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                stats.append(None)
+            else:
+                stats.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(stats)
+
+    def _load_snapshot(self) -> QuestionSnapshot:
+        """从题库文件加载题目，构建新的快照（不修改当前快照）"""
+        source = self._resolve_source()
+        if not source.exists():
+            raise FileNotFoundError(f"题库文件不存在: {self.json_file}")
+
+        # 先记录文件状态再读取：读取期间文件又被修改时，下次轮询会再次加载
+        source_stat = self._read_source_stat()
+        if source.suffix == COMPILED_SUFFIX:
+            compiled = CompiledQuestions(source)
+            snapshot = QuestionSnapshot(
+                compiled,
+                compiled.version,
+                sorted_ids=compiled.sorted_ids,
+                sorted_valid_ids=compiled.sorted_valid_ids,
+            )
+        else:
+            raw = source.read_bytes()
+            snapshot = QuestionSnapshot(
+                self.parse_questions(json.loads(raw.decode("utf-8"))),
+                content_version(raw),
+            )
+            snapshot.search_index  # 题目已全部解码，加载时直接建立索引
+
+        self._source_stat = source_stat
+        return snapshot
+
+    @classmethod
+    def parse_questions(cls, data: List[Dict]) -> Dict[str, Question]:
+        """校验并规范化JSON中的题目列表（id -> Question）"""
+        questions = {}
+        for item in data:
+            question = cls._build_question(item)
+            if question is not None:
+                questions[question.id] = question
+        return questions
+
+    @classmethod
+    def _build_question(cls, item: Dict) -> Optional[Question]:
+        """
+        把JSON中的一道题转换为Question（没有id或无法解析时返回None）
+
+        带is_valid字段的题目已经在入库时校验和规范化（见question_validation.py），
+        直接使用；旧数据或字段缺失、类型错误的题目在这里现场规范化和校验，
+        单条坏数据不会导致整个题库加载失败
+        """
+        if isinstance(item, dict) and "is_valid" in item:
+            try:
+                return cls._question_from_prepared(item)
+            except (KeyError, TypeError, AttributeError):
+                pass
+
+        from question_validation import prepare_question
+
+        try:
+            prepared, errors = prepare_question(item)
+            if "malformed" not in errors:
+                return cls._question_from_prepared(prepared)
+            error, error_type = "malformed", "malformed"
+        except (KeyError, TypeError, AttributeError) as e:
+            error, error_type = str(e), type(e).__name__
+        log_event(
+            "question_bank.skip_item",
+            question_id=str(item.get("id")) if isinstance(item, dict) else None,
+            error=error,
+            error_type=error_type,
+        )
+        return None
+
+    @staticmethod
+    def _question_from_prepared(item: Dict) -> Optional[Question]:
+        """由规范化后的题目创建Question（id为0也是有效id）"""
+        question_id = item.get("id")
+        if question_id is None or question_id == "":
+            return None  # 跳过没有id的题目
+        question_id = str(question_id)
+
+        return Question(
+            id=sys.intern(question_id),
+            instruction=item["instruction"],
+            teacher=sys.intern(item["teacher"]),
+            teacher_content=item["teacher_content"],
+            students=tuple(
+                Student(sys.intern(s["name"]), s["content"]) for s in item["students"]
+            ),
+            is_valid=bool(item["is_valid"]),
+        )
+
+    def reload(self) -> QuestionSnapshot:
+        """
+        重新加载题目（当文件更新时调用）
+        新快照构建完成后才替换当前快照；加载失败时保留原快照并抛出异常
+        """
+        with self._reload_lock:
+            snapshot = self._load_snapshot()
+            self._snapshot = snapshot
+        return snapshot
+
+    def start_watcher(self, interval: float = 5.0):
+        """启动后台线程轮询题库文件，文件变化时自动重新加载"""
+        if self._watcher is not None:
+            return
+        self._watcher_stop.clear()
+        self._watcher = threading.Thread(
+            target=self._watch,
+            args=(interval,),
+            name="question-bank-watcher",
+            daemon=True,
+        )
+        self._watcher.start()
+
+    def stop_watcher(self):
+        """停止文件轮询线程"""
+        if self._watcher is not None:
+            self._watcher_stop.set()
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self, interval: float):
+        # 加载失败时的文件状态：文件再次变化前不重试，避免每次轮询都重新解析坏文件
+        failed_stat = None
+        while not self._watcher_stop.wait(interval):
+            try:
+                source_stat = self._read_source_stat()
+                if source_stat in (self._source_stat, failed_stat):
+                    continue
+                failed_stat = source_stat
+                snapshot = self.reload()
+                failed_stat = None
+                log_event(
+                    "question_bank.reloaded",
+                    version=snapshot.version,
+                    total=len(snapshot.questions),
+                )
+            except Exception as e:
+                # 文件写到一半或格式错误时继续使用旧快照，文件再次变化后重试
+                log_event(
+                    "question_bank.reload_error",
+                    error=str(e),
+                    error_type=type(e).__name__,
+                )
+
+    # 以下查询方法读取当前快照（单次调用内一致）
+    def get_question(
+        self, question_id: str, only_valid: bool = True
+    ) -> Optional[Question]:
+        """根据ID获取题目，见QuestionSnapshot.get_question"""
+        return self._snapshot.get_question(question_id, only_valid=only_valid)
+
+    def get_question_list(
+        self,
+        only_valid: bool = True,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> Tuple[List[Dict], int]:
+        """获取题目列表，见QuestionSnapshot.get_question_list"""
+        return self._snapshot.get_question_list(
+            only_valid=only_valid, offset=offset, limit=limit
+        )
+
+    def get_question_list_response(
+        self,
+        only_valid: bool = True,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        format_type: str = "simple",
+    ) -> str:
+        """获取题目列表接口的JSON响应，见QuestionSnapshot.get_question_list_response"""
+        return self._snapshot.get_question_list_response(
+            only_valid=only_valid, offset=offset, limit=limit, format_type=format_type
+        )
+
+    def get_all_valid_ids(self) -> List[str]:
+        """获取所有有效题目的ID列表（按id排序）"""
+        return self._snapshot.get_all_valid_ids()
+
+    def get_question_batch(
+        self, question_ids: List[str], fields: Optional[List[str]] = None
+    ) -> Dict:
+        """批量获取题目，见QuestionSnapshot.get_question_batch"""
+        return self._snapshot.get_question_batch(question_ids, fields=fields)
+
+    def search(self, query: str = "", **filters) -> Dict:
+        """检索题目，见QuestionSnapshot.search"""
+        return self._snapshot.search(query, **filters)
+
+    def get_question_markdown(
+        self, question_id: str, only_valid: bool = True, as_string: bool = False
+    ) -> Optional[Union[Dict[str, str], str]]:
+        """获取题目的markdown格式，见QuestionSnapshot.get_question_markdown"""
+        return self._snapshot.get_question_markdown(
+            question_id, only_valid=only_valid, as_string=as_string
+        )
+
+    def get_statistics(self) -> Dict:
+        """获取题库统计信息"""
+        return self._snapshot.get_statistics()
+
 
+# 默认题库（未指定题库名的请求和题目引用都使用它）
+DEFAULT_BANK = os.getenv("QUESTION_DEFAULT_BANK", "toefl")
+
+
+def configured_banks() -> Dict[str, str]:
+    """
+    读取题库配置（题库名 -> 文件路径）
+    环境变量 QUESTION_BANKS="ielts=IELTS_generated.json,practice=practice.json"，
+    默认题库对应 TOP_generated.json（也可以在QUESTION_BANKS中覆盖）
+    """
+    banks = {DEFAULT_BANK: "TOP_generated.json"}
+    for item in os.getenv("QUESTION_BANKS", "").split(","):
+        name, sep, path = item.partition("=")
+        if sep and name.strip() and path.strip():
+            banks[name.strip()] = path.strip()
+    return banks
+
+
+class QuestionBankRegistry:
+    """
+    多题库注册表：按题库名管理QuestionBank
+
+    - 题库在第一次使用时加载
+    - 记录每个题库的内存占用，超过预算时按最近最少使用淘汰其他题库
+      （被淘汰的题库下次使用时重新加载，进行中的请求继续使用已取得的快照）
+    - 题目可以用 "题库名:题目id" 引用，例如 "ielts:12"；不带前缀时使用默认题库
+    """
+
+    def __init__(
+        self,
+        banks: Optional[Dict[str, str]] = None,
+        default_bank: str = DEFAULT_BANK,
+        memory_budget: Optional[int] = None,
+        watch_interval: Optional[float] = None,
+    ):
+        """
+        Args:
+            banks: 题库名 -> 文件路径，默认读取configured_banks()
+            default_bank: 默认题库名
+            memory_budget: 内存预算（字节），默认读取 QUESTION_BANK_MEMORY_BUDGET_MB，0表示不限制
+            watch_interval: 文件轮询间隔（秒），默认读取 QUESTION_BANK_WATCH_INTERVAL，0表示不轮询
+        """
+        self._paths: Dict[str, str] = dict(banks or configured_banks())
+        self.default_bank = default_bank
+        self.memory_budget = (
+            memory_budget
+            if memory_budget is not None
+            else int(float(os.getenv("QUESTION_BANK_MEMORY_BUDGET_MB", "0")) * 1024**2)
+        )
+        self.watch_interval = (
+            watch_interval
+            if watch_interval is not None
+            else float(os.getenv("QUESTION_BANK_WATCH_INTERVAL", "0"))
+        )
+        # 已加载的题库，按最近使用排序（最后一个最新）
+        self._loaded: "OrderedDict[str, QuestionBank]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def register(self, name: str, path: str):
+        """注册题库（同名题库已加载且路径变化时先卸载）"""
+        with self._lock:
+            if self._paths.get(name) != path:
+                self.evict(name)
+            self._paths[name] = path
+
+    def name_for_path(self, path: str) -> Optional[str]:
+        """指向同一文件的已注册题库名（没有时返回None）"""
+        target = Path(path).resolve()
+        for name, registered in list(self._paths.items()):
+            if Path(registered).resolve() == target:
+                return name
+        return None
+
+    def names(self) -> List[str]:
+        """所有已注册的题库名"""
+        return list(self._paths)
+
+    def loaded(self) -> List[str]:
+        """当前已加载的题库名（按最近使用排序）"""
+        return list(self._loaded)
+
+    def get(self, name: Optional[str] = None) -> QuestionBank:
+        """
+        获取题库（第一次使用时加载）
+
+        Raises:
+            KeyError: 题库未注册
+        """
+        name = name or self.default_bank
+        bank = self._loaded.get(name)
+        if bank is not None:
+            try:
+                self._loaded.move_to_end(name)
+            except KeyError:
+                pass  # 并发淘汰，直接返回已取得的实例
+            return bank
+
+        with self._lock:
+            bank = self._loaded.get(name)
+            if bank is None:
+                if name not in self._paths:
+                    raise KeyError(f"题库不存在: {name}")
+                bank = QuestionBank(self._paths[name])
+                if self.watch_interval > 0:
+                    bank.start_watcher(self.watch_interval)
+                self._loaded[name] = bank
+                log_event(
+                    "question_bank.loaded",
+                    bank=name,
+                    total=len(bank.questions),
+                    memory_bytes=bank.snapshot().memory_usage(),
+                )
+                self.enforce_budget(keep=name)
+            self._loaded.move_to_end(name)
+            return bank
+
+    def split_ref(self, ref: str, bank: Optional[str] = None) -> Tuple[str, str]:
+        """
+        解析题目引用
+
+        Args:
+            ref: "题库名:题目id" 或题目id
+            bank: 未带前缀时使用的题库，默认为默认题库
+
+        Returns:
+            (题库名, 题目id)；前缀不是已注册的题库名时整个字符串视为题目id
+        """
+        prefix, sep, question_id = ref.partition(":")
+        if sep and prefix in self._paths:
+            return prefix, question_id
+        return bank or self.default_bank, ref
+
+    def resolve(
+        self, ref: str, bank: Optional[str] = None
+    ) -> Tuple[QuestionBank, str]:
+        """解析题目引用并返回 (题库, 题目id)"""
+        name, question_id = self.split_ref(ref, bank)
+        return self.get(name), question_id
+
+    def memory_usage(self) -> Dict[str, int]:
+        """已加载题库的估算内存占用（字节）"""
         return {
-            "total": total,
-            "valid": valid_count,
-            "invalid": invalid_count,
+            name: bank.snapshot().memory_usage()
+            for name, bank in list(self._loaded.items())
         }
 
+    def enforce_budget(self, keep: Optional[str] = None) -> List[str]:
+        """
+        超过内存预算时按最近最少使用淘汰题库（keep指定的题库不淘汰）
+        Returns: 被淘汰的题库名
+        """
+        if self.memory_budget <= 0:
+            return []
+        evicted = []
+        with self._lock:
+            usage = self.memory_usage()
+            total = sum(usage.values())
+            for name in list(self._loaded):
+                if total <= self.memory_budget:
+                    break
+                if name == keep:
+                    continue
+                total -= usage.get(name, 0)
+                self.evict(name)
+                evicted.append(name)
+                log_event(
+                    "question_bank.evicted",
+                    bank=name,
+                    memory_bytes=usage.get(name, 0),
+                    budget_bytes=self.memory_budget,
+                )
+        return evicted
+
+    def evict(self, name: str):
+        """卸载题库（下次使用时重新加载）"""
+        with self._lock:
+            bank = self._loaded.pop(name, None)
+        if bank is not None:
+            bank.stop_watcher()
+
+    def reload(self, name: Optional[str] = None):
+        """重新加载已加载的题库（未加载的题库下次使用时自然读取最新文件）"""
+        bank = self._loaded.get(name or self.default_bank)
+        if bank is not None:
+            bank.reload()
+
+
+# 全局题库注册表
+_registry: Optional[QuestionBankRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_question_registry() -> QuestionBankRegistry:
+    """获取全局题库注册表（线程安全）"""
+    global _registry
+    registry = _registry
+    if registry is not None:
+        return registry
 
-# 全局题库实例（单例模式）
-_question_bank: Optional[QuestionBank] = None
+    with _registry_lock:
+        if _registry is None:
+            _registry = QuestionBankRegistry()
+    return _registry
 
 
-def get_question_bank(json_file: str = "TOP_generated.json") -> QuestionBank:
+def get_question_bank(bank: Optional[str] = None) -> QuestionBank:
     """
-    获取全局题库实例（单例模式）
+    获取题库实例
 
     Args:
-        json_file: JSON文件路径，只在第一次调用时生效
+        bank: 题库名，默认为默认题库；传入.json/.qbank文件路径时使用指向该文件的
+            已注册题库，没有时以文件名（不含扩展名）为题库名注册（兼容旧的调用方式）
 
     Returns:
         QuestionBank实例
     """
-    global _question_bank
-    if _question_bank is None:
-        _question_bank = QuestionBank(json_file)
-    return _question_bank
+    registry = get_question_registry()
+    if bank and Path(bank).suffix in (".json", COMPILED_SUFFIX):
+        name = registry.name_for_path(bank)
+        if name is None:
+            name = Path(bank).stem
+            registry.register(name, bank)
+        return registry.get(name)
+    return registry.get(bank)
 
 
-def reload_question_bank():
+def reload_question_bank(bank: Optional[str] = None):
     """重新加载题库"""
-    global _question_bank
-    if _question_bank is not None:
-        _question_bank.reload()
+    get_question_registry().reload(bank)
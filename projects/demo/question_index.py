@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题库倒排索引模块
+
+在题库快照上建立倒排索引，支持关键词检索和分面统计：
+- 关键词：指令、教授提问、学生回复、教授/学生名字和科目中的词（最后一个词做前缀匹配）
+- 过滤字段：科目（subject）、教授名字、学生名字（精确匹配，不区分大小写）
+- 分面：命中结果按科目统计数量（不受科目过滤本身影响）
+
+索引随快照一起创建，题库重新加载时整体替换。
+"""
+
+import math
+import re
+import sys
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+_TERM_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# 常见虚词不进入索引
+STOPWORDS = frozenset(
+    """
+    a an and are as at be but by do does for from has have how i if in is it its
+    of on or our should so that the their them they this to was we were what
+    when which who why will with would you your
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """拆分检索词（小写，去掉虚词和单字母）"""
+    return [
+        term
+        for term in _TERM_RE.findall((text or "").lower())
+        if len(term) > 1 and term not in STOPWORDS
+    ]
+
+
+class QuestionIndex:
+    """题库倒排索引（创建后只读）"""
+
+    def __init__(self, questions: Iterable, order: Dict[str, int]):
+        """
+        Args:
+            questions: Question对象
+            order: 题目id -> 排序位置（结果相关度相同时按题目顺序返回）
+        """
+        self._order = order
+        postings: Dict[str, Dict[str, int]] = {}
+        self.subject_of: Dict[str, str] = {}
+        self.valid_ids = set()
+
+        subjects: Dict[str, List[str]] = {}
+        professors: Dict[str, List[str]] = {}
+        students: Dict[str, List[str]] = {}
+        for question in questions:
+            qid = question.id
+            if question.is_valid:
+                self.valid_ids.add(qid)
+            self.subject_of[qid] = question.subject
+            subjects.setdefault(question.subject.lower(), []).append(qid)
+            if question.teacher:
+                professors.setdefault(question.teacher.lower(), []).append(qid)
+            for student in question.students:
+                if student.name:
+                    students.setdefault(student.name.lower(), []).append(qid)
+
+            text_parts = [
+                question.subject,
+                question.instruction,
+                question.teacher,
+                question.teacher_content,
+            ]
+            for student in question.students:
+                text_parts.append(student.name)
+                text_parts.append(student.content)
+            for term, count in Counter(tokenize(" ".join(text_parts))).items():
+                postings.setdefault(term, {})[qid] = count
+
+        self._postings = postings
+        self._vocabulary = sorted(postings)
+        self._document_count = max(len(order), 1)
+        # 过滤字段（小写值 -> 题目id），同一题目只记录一次
+        self.subjects: Dict[str, Tuple[str, ...]] = {
+            k: tuple(dict.fromkeys(v)) for k, v in subjects.items()
+        }
+        self.professors: Dict[str, Tuple[str, ...]] = {
+            k: tuple(dict.fromkeys(v)) for k, v in professors.items()
+        }
+        self.students: Dict[str, Tuple[str, ...]] = {
+            k: tuple(dict.fromkeys(v)) for k, v in students.items()
+        }
+
+        # 没有检索词时的结果按题目顺序排列：预先排好序并统计分面，直接分页
+        all_ids = tuple(sorted(order, key=order.__getitem__))
+        valid_ids = tuple(qid for qid in all_ids if qid in self.valid_ids)
+        self._browse_ids = {False: all_ids, True: valid_ids}
+        self._browse_facets = {
+            only_valid: Counter(self.subject_of[qid] for qid in ids)
+            for only_valid, ids in self._browse_ids.items()
+        }
+        self._valid_subjects: Dict[str, Tuple[str, ...]] = {
+            k: tuple(qid for qid in v if qid in self.valid_ids)
+            for k, v in self.subjects.items()
+        }
+
+    def memory_usage(self) -> int:
+        """估算索引占用的内存（字节）；题目id与快照共享，不计入"""
+        total = sys.getsizeof(self._postings) + sys.getsizeof(self._vocabulary)
+        for term, posting in self._postings.items():
+            total += sys.getsizeof(term) + sys.getsizeof(posting)
+        for mapping in (self.subjects, self.professors, self.students, self._valid_subjects):
+            total += sys.getsizeof(mapping)
+            for key, ids in mapping.items():
+                total += sys.getsizeof(key) + sys.getsizeof(ids)
+        for container in (self.subject_of, self.valid_ids, self._order):
+            total += sys.getsizeof(container)
+        total += sum(map(sys.getsizeof, self._browse_ids.values()))
+        return total
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        start = bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _score_terms(self, terms: List[str]) -> Optional[Dict[str, float]]:
+        """所有词都命中的题目及得分（tf-idf）；没有检索词时返回None"""
+        if not terms:
+            return None
+        scores: Optional[Dict[str, float]] = None
+        for position, term in enumerate(terms):
+            # 最后一个词做前缀匹配（边输入边检索）
+            candidates = (
+                self._expand_prefix(term) if position == len(terms) - 1 else [term]
+            )
+            term_scores: Dict[str, float] = {}
+            for candidate in candidates:
+                posting = self._postings.get(candidate, {})
+                idf = math.log(1 + self._document_count / (1 + len(posting)))
+                for qid, count in posting.items():
+                    term_scores[qid] = max(term_scores.get(qid, 0.0), count * idf)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    qid: score + term_scores[qid]
+                    for qid, score in scores.items()
+                    if qid in term_scores
+                }
+            if not scores:
+                break
+        return scores
+
+    def search(
+        self,
+        query: str = "",
+        subject: Optional[str] = None,
+        professor: Optional[str] = None,
+        student: Optional[str] = None,
+        only_valid: bool = True,
+        offset: int = 0,
+        limit: int = 20,
+    ) -> Dict:
+        """
+        检索题目
+        Returns: dict，包含 total、hits（[(id, score)]，已分页）、facets（科目 -> 数量）
+        """
+        terms = tokenize(query)
+        if not terms and query.strip():
+            # 只有停用词或单字母的检索词：没有可检索的内容，不退化为浏览全部题目
+            return self._page([], None, Counter(), offset, limit)
+        scores = self._score_terms(terms)
+        if scores is None:
+            ranked, facets = self._browse(subject, professor, student, only_valid)
+            return self._page(ranked, None, facets, offset, limit)
+
+        candidates = set(scores)
+
+        if only_valid:
+            candidates &= self.valid_ids
+        for mapping, value in ((self.professors, professor), (self.students, student)):
+            if value:
+                candidates &= set(mapping.get(value.lower(), ()))
+
+        # 分面统计不受科目过滤影响，便于前端展示其他科目的数量
+        facets = Counter(self.subject_of[qid] for qid in candidates)
+        if subject:
+            candidates &= set(self.subjects.get(subject.lower(), ()))
+
+        ranked = sorted(candidates, key=lambda qid: (-scores[qid], self._order[qid]))
+        return self._page(ranked, scores, facets, offset, limit)
+
+    def _browse(
+        self,
+        subject: Optional[str],
+        professor: Optional[str],
+        student: Optional[str],
+        only_valid: bool,
+    ) -> Tuple[Sequence[str], Counter]:
+        """没有检索词时的结果（按题目顺序）和分面；不带过滤条件时不需要遍历题目"""
+        filters = [
+            mapping.get(value.lower(), ())
+            for mapping, value in ((self.professors, professor), (self.students, student))
+            if value
+        ]
+        if not filters:
+            facets = self._browse_facets[only_valid]
+            if not subject:
+                return self._browse_ids[only_valid], facets
+            subjects = self._valid_subjects if only_valid else self.subjects
+            return subjects.get(subject.lower(), ()), facets
+
+        # 过滤列表本身按题目顺序排列：从最短的列表出发，逐个检查其他条件
+        base = min(filters, key=len)
+        others = [set(ids) for ids in filters if ids is not base]
+        candidates = [
+            qid
+            for qid in base
+            if (not only_valid or qid in self.valid_ids)
+            and all(qid in ids for ids in others)
+        ]
+        facets = Counter(self.subject_of[qid] for qid in candidates)
+        if subject:
+            wanted = subject.lower()
+            candidates = [qid for qid in candidates if self.subject_of[qid].lower() == wanted]
+        return candidates, facets
+
+    @staticmethod
+    def _page(
+        ranked: Sequence[str],
+        scores: Optional[Dict[str, float]],
+        facets: Counter,
+        offset: int,
+        limit: int,
+    ) -> Dict:
+        page = ranked[offset : offset + limit]
+        return {
+            "total": len(ranked),
+            "hits": [(qid, round(scores[qid], 4) if scores else None) for qid in page],
+            "facets": dict(sorted(facets.items(), key=lambda item: (-item[1], item[0]))),
+        }
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题库入库校验模块
+功能：
+1. 规范化题目（去除首尾空白，旧格式的学生字符串解析为 {name, content}）
+2. 校验题目并给出原因，写入 is_valid 字段
+3. 生成机器可读的校验报告和隔离文件（无效题目及原因）
+4. CI检查：出现基线之外的新无效题目时返回非零退出码
+
+题库文件中带 is_valid 字段的题目视为已校验，QuestionBank 加载时直接使用，不再做正则解析。
+
+使用方法：
+    python question_validation.py [TOP_generated.json] [--write] [--strict] [--baseline FILE]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+# 错误代码 -> 说明
+ERROR_MESSAGES = {
+    "missing_id": "缺少id",
+    "missing_instruction": "instruction为空",
+    "missing_teacher": "teacher为空",
+    "missing_teacher_content": "teacher_content为空",
+    "no_students": "没有学生回复",
+    "no_valid_student": "没有同时包含名字和内容的学生回复",
+    "malformed": "题目格式错误（不是对象或字段类型不正确）",
+}
+
+_TEXT_FIELDS = ("instruction", "teacher", "teacher_content")
+
+_LEGACY_STUDENT_RE = re.compile(
+    r"\*\*Student\s+\d+\s*\(([^)]+)\):(?:\*\*)?\s*(.*)", re.DOTALL
+)
+
+
+def normalize_students(students):
+    """
+    规范化students格式
+
+    将students转换为统一的格式：List[Dict[str, str]]
+    每个dict包含name和content字段，名字和内容都为空的学生会被去掉
+    """
+    normalized = []
+    for student in students or []:
+        if isinstance(student, dict):
+            # 已经是字典格式
+            name = student.get("name") or ""
+            content = student.get("content") or ""
+            if not isinstance(name, str) or not isinstance(content, str):
+                continue
+            name, content = name.strip(), content.strip()
+        elif isinstance(student, str):
+            # 旧格式：字符串格式，需要解析
+            # 格式: "**Student 1 (Name):** content"
+            match = _LEGACY_STUDENT_RE.match(student)
+            if not match:
+                continue
+            name = match.group(1).strip()
+            content = match.group(2).strip()
+        else:
+            continue
+        if name or content:  # 至少有一个字段不为空
+            normalized.append({"name": name, "content": content})
+    return normalized
+
+
+def is_malformed(item):
+    """条目不是对象，或文本字段不是字符串、students不是列表"""
+    if not isinstance(item, dict):
+        return True
+    for field in _TEXT_FIELDS:
+        if item.get(field) is not None and not isinstance(item[field], str):
+            return True
+    students = item.get("students")
+    return students is not None and not isinstance(students, list)
+
+
+def prepare_question(item):
+    """
+    规范化并校验一道题
+
+    有效条件：
+    1. instruction、teacher、teacher_content不为空
+    2. students至少有一个有效的学生（有name和content）
+
+    不是对象或字段类型不正确的条目无法规范化，只返回 {id, is_valid: False}
+    和错误代码 malformed
+
+    Returns:
+        (规范化后的题目（含is_valid字段）, 错误代码列表)
+    """
+    if is_malformed(item):
+        question_id = item.get("id") if isinstance(item, dict) else None
+        return {"id": question_id, "is_valid": False}, ["malformed"]
+
+    question = {
+        "id": item.get("id"),
+        **{field: (item.get(field) or "").strip() for field in _TEXT_FIELDS},
+        "students": normalize_students(item.get("students")),
+    }
+
+    errors = []
+    if question["id"] in (None, ""):
+        errors.append("missing_id")
+    for field in _TEXT_FIELDS:
+        if not question[field]:
+            errors.append(f"missing_{field}")
+    if not question["students"]:
+        errors.append("no_students")
+    elif not any(s["name"] and s["content"] for s in question["students"]):
+        errors.append("no_valid_student")
+
+    question["is_valid"] = not errors
+    return question, errors
+
+
+def load_baseline(baseline_file):
+    """读取基线（已知的无效题目id列表，或之前生成的校验报告）"""
+    if not baseline_file or not os.path.exists(baseline_file):
+        return set()
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = [entry["id"] for entry in data.get("invalid_questions", [])]
+    return {str(qid) for qid in data}
+
+
+def validate_bank(
+    bank_file,
+    report_file=None,
+    quarantine_file=None,
+    write=False,
+    baseline_file=None,
+):
+    """
+    校验题库文件，生成报告和隔离文件
+
+    Args:
+        bank_file: 题库JSON文件
+        report_file: 报告路径，默认 <题库>.validation.json
+        quarantine_file: 隔离文件路径，默认 <题库>.quarantine.json
+        write: 把规范化结果和is_valid写回题库文件（内容变化时才写）
+        baseline_file: 基线文件，其中的无效题目不算作新问题
+
+    Returns:
+        dict: 校验报告
+    """
+    from parse_tpo import format_output_item, iter_json_array
+
+    base = os.path.splitext(bank_file)[0]
+    report_file = report_file or f"{base}.validation.json"
+    quarantine_file = quarantine_file or f"{base}.quarantine.json"
+    baseline = load_baseline(baseline_file)
+
+    total, invalid, quarantine = 0, [], []
+    needs_write = False
+    tmp_file = f"{bank_file}.tmp"
+    out = open(tmp_file, "w", encoding="utf-8") if write else None
+    try:
+        for item, _ in iter_json_array(bank_file):
+            question, errors = prepare_question(item)
+            if "malformed" in errors:
+                # 无法规范化的条目原样写回，原始内容同时保存在隔离文件中
+                question = item
+            elif question != item:
+                needs_write = True
+            if out is not None:
+                out.write(",\n" if total else "[\n")
+                out.write(format_output_item(question))
+            total += 1
+            if errors:
+                question_id = item.get("id") if isinstance(item, dict) else None
+                entry = {"id": str(question_id), "errors": errors}
+                invalid.append(entry)
+                quarantine.append(dict(entry, question=item))
+        if out is not None:
+            out.write("\n]" if total else "[]")
+    except BaseException:
+        # 校验中途失败时保留原题库，只删除临时文件
+        if out is not None:
+            out.close()
+            os.remove(tmp_file)
+        raise
+    if out is not None:
+        out.close()
+        if needs_write:
+            os.replace(tmp_file, bank_file)
+        else:
+            os.remove(tmp_file)
+
+    report = {
+        "bank": str(bank_file),
+        "total": total,
+        "valid": total - len(invalid),
+        "invalid": len(invalid),
+        "invalid_questions": invalid,
+        "new_invalid": [e["id"] for e in invalid if e["id"] not in baseline],
+        "error_messages": ERROR_MESSAGES,
+        "written": bool(write and needs_write),
+    }
+
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    with open(quarantine_file, "w", encoding="utf-8") as f:
+        json.dump(quarantine, f, ensure_ascii=False, indent="\t")
+    return report
+
+
+def print_report(report):
+    """打印校验结果"""
+    print(f"题目总数: {report['total']}，有效 {report['valid']}，无效 {report['invalid']}")
+    for entry in report["invalid_questions"]:
+        reasons = "；".join(ERROR_MESSAGES.get(code, code) for code in entry["errors"])
+        marker = "（新）" if entry["id"] in report["new_invalid"] else ""
+        print(f"  - {entry['id']}{marker}: {reasons}")
+    if report["written"]:
+        print(f"已写回规范化结果: {report['bank']}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="题库入库校验")
+    parser.add_argument("bank", nargs="?", default="TOP_generated.json")
+    parser.add_argument("--write", action="store_true", help="写回规范化结果和is_valid")
+    parser.add_argument("--report", default=None, help="报告文件路径")
+    parser.add_argument("--quarantine", default=None, help="隔离文件路径")
+    parser.add_argument("--baseline", default=None, help="已知无效题目的基线文件")
+    parser.add_argument(
+        "--strict", action="store_true", help="存在基线之外的无效题目时返回非零退出码"
+    )
+    args = parser.parse_args()
+
+    report = validate_bank(
+        args.bank,
+        report_file=args.report,
+        quarantine_file=args.quarantine,
+        write=args.write,
+        baseline_file=args.baseline,
+    )
+    print_report(report)
+    if args.strict and report["new_invalid"]:
+        print(f"✗ 发现 {len(report['new_invalid'])} 道新的无效题目")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
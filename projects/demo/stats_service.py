@@ -0,0 +1,261 @@
+"""
+用户评分统计服务模块
+
+评分汇总表（总体/每周/每题）在评分写入时增量维护，与历史记录在同一事务内提交。
+读取统计时只查汇总表，与历史记录数量无关。
+
+使用方法（重建/校验汇总表）：
+    python stats_service.py rebuild
+    python stats_service.py check
+"""
+
+import sys
+from datetime import timedelta
+from sqlalchemy import case, func, or_, select, update
+from user_models import (
+    db,
+    insert_ignore,
+    History,
+    UserScoreStats,
+    UserWeeklyScore,
+    UserQuestionScore,
+)
+
+
+def week_start_of(dt):
+    """返回dt所在周的周一（date）"""
+    day = dt.date()
+    return day - timedelta(days=day.weekday())
+
+
+def _increment(model, keys, count_delta, sum_delta, score=None):
+    """
+    原子地累加一行汇总数据（行不存在时先插入计数为0的行）
+    score不为空时同时把最高分提高到score
+    """
+    insert_ignore(model, scored_count=0, score_sum=0, **keys)
+    values = {
+        "scored_count": model.scored_count + count_delta,
+        "score_sum": model.score_sum + sum_delta,
+    }
+    if score is not None:
+        values["best_score"] = case(
+            (or_(model.best_score.is_(None), model.best_score < score), score),
+            else_=model.best_score,
+        )
+    db.session.execute(update(model).filter_by(**keys).values(**values))
+
+
+def _best_score(model, keys):
+    return db.session.execute(select(model.best_score).filter_by(**keys)).scalar()
+
+
+def _set_best_score(model, keys, best_score):
+    db.session.execute(update(model).filter_by(**keys).values(best_score=best_score))
+
+
+def _best_question_score(history):
+    """重新计算同一用户同一题目的最高分（排除history本身）"""
+    return (
+        db.session.query(func.max(History.score))
+        .filter(
+            History.user_id == history.user_id,
+            History.question == history.question,
+            History.id != history.id,
+            History.score.isnot(None),
+        )
+        .scalar()
+    )
+
+
+def apply_score_change(history, old_score, new_score):
+    """
+    把一条历史记录的评分变化应用到汇总表（不提交，由调用方提交事务）
+    - 新增评分: old_score=None, new_score=分数
+    - 修改评分: old_score=原分数, new_score=新分数
+    - 删除记录: old_score=原分数, new_score=None
+    """
+    if old_score == new_score:
+        return
+
+    # 计数和总和用 col = col + :n 累加，并发写入同一用户/题目时不会丢失更新
+    count_delta = (new_score is not None) - (old_score is not None)
+    sum_delta = (new_score or 0) - (old_score or 0)
+    user_id = history.user_id
+    overall_keys = {"user_id": user_id}
+    question_keys = {"user_id": user_id, "question": history.question}
+    _increment(UserScoreStats, overall_keys, count_delta, sum_delta, new_score)
+    _increment(
+        UserWeeklyScore,
+        {"user_id": user_id, "week_start": week_start_of(history.created_at)},
+        count_delta,
+        sum_delta,
+    )
+    _increment(UserQuestionScore, question_keys, count_delta, sum_delta, new_score)
+
+    # 最高分只能增量变大；原最高分被撤销（删除或改低）时需要重新计算该题
+    if old_score is None or (new_score is not None and new_score >= old_score):
+        return
+    if old_score == _best_score(UserQuestionScore, question_keys):
+        candidates = [
+            s for s in (_best_question_score(history), new_score) if s is not None
+        ]
+        _set_best_score(
+            UserQuestionScore, question_keys, max(candidates) if candidates else None
+        )
+    if old_score == _best_score(UserScoreStats, overall_keys):
+        _set_best_score(
+            UserScoreStats,
+            overall_keys,
+            db.session.query(func.max(UserQuestionScore.best_score))
+            .filter(UserQuestionScore.user_id == user_id)
+            .scalar(),
+        )
+
+
+def get_user_stats(user_id, weeks=12):
+    """
+    获取用户评分统计
+    Returns: dict，包含总体统计、最近weeks周的趋势和每题最高分
+    """
+    overall = db.session.get(UserScoreStats, user_id)
+    weekly = (
+        UserWeeklyScore.query.filter(
+            UserWeeklyScore.user_id == user_id, UserWeeklyScore.scored_count > 0
+        )
+        .order_by(UserWeeklyScore.week_start.desc())
+        .limit(weeks)
+        .all()
+    )
+    questions = (
+        UserQuestionScore.query.filter(
+            UserQuestionScore.user_id == user_id, UserQuestionScore.scored_count > 0
+        )
+        .order_by(UserQuestionScore.question)
+        .all()
+    )
+    return {
+        "summary": (
+            overall.to_dict()
+            if overall
+            else UserScoreStats(scored_count=0, score_sum=0).to_dict()
+        ),
+        "weekly": [w.to_dict() for w in reversed(weekly)],
+        "questions": [q.to_dict() for q in questions],
+    }
+
+
+def _compute_from_histories():
+    """从histories表全量计算汇总数据（流式读取）"""
+    overall, weekly, questions = {}, {}, {}
+    rows = (
+        db.session.query(
+            History.user_id, History.question, History.score, History.created_at
+        )
+        .filter(History.score.isnot(None))
+        .yield_per(1000)
+    )
+    for user_id, question, score, created_at in rows:
+        for table, key in (
+            (overall, user_id),
+            (weekly, (user_id, week_start_of(created_at))),
+            (questions, (user_id, question)),
+        ):
+            entry = table.setdefault(key, [0, 0, None])
+            entry[0] += 1
+            entry[1] += score
+            entry[2] = score if entry[2] is None else max(entry[2], score)
+    return overall, weekly, questions
+
+
+def _load_rollups():
+    overall = {
+        r.user_id: [r.scored_count, r.score_sum, r.best_score]
+        for r in UserScoreStats.query.all()
+        if r.scored_count
+    }
+    weekly = {
+        (r.user_id, r.week_start): [r.scored_count, r.score_sum, None]
+        for r in UserWeeklyScore.query.all()
+        if r.scored_count
+    }
+    questions = {
+        (r.user_id, r.question): [r.scored_count, r.score_sum, r.best_score]
+        for r in UserQuestionScore.query.all()
+        if r.scored_count
+    }
+    return overall, weekly, questions
+
+
+def check_stats():
+    """
+    校验汇总表与histories表是否一致
+    Returns: list[str]，不一致项的描述（空列表表示一致）
+    """
+    expected = _compute_from_histories()
+    actual = _load_rollups()
+    # 每周汇总不记录最高分
+    for entry in expected[1].values():
+        entry[2] = None
+
+    problems = []
+    for name, exp, act in zip(("overall", "weekly", "question"), expected, actual):
+        for key in sorted(set(exp) | set(act), key=str):
+            if exp.get(key) != act.get(key):
+                problems.append(f"{name} {key}: 期望 {exp.get(key)}，实际 {act.get(key)}")
+    return problems
+
+
+def rebuild_stats():
+    """清空并根据histories表重建汇总表"""
+    overall, weekly, questions = _compute_from_histories()
+    try:
+        UserQuestionScore.query.delete()
+        UserWeeklyScore.query.delete()
+        UserScoreStats.query.delete()
+        db.session.add_all(
+            UserScoreStats(user_id=k, scored_count=c, score_sum=s, best_score=b)
+            for k, (c, s, b) in overall.items()
+        )
+        db.session.add_all(
+            UserWeeklyScore(user_id=k[0], week_start=k[1], scored_count=c, score_sum=s)
+            for k, (c, s, _) in weekly.items()
+        )
+        db.session.add_all(
+            UserQuestionScore(
+                user_id=k[0], question=k[1], scored_count=c, score_sum=s, best_score=b
+            )
+            for k, (c, s, b) in questions.items()
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(overall)
+
+
+def main():
+    """主函数"""
+    from app import app
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    with app.app_context():
+        db.create_all()
+        if command == "rebuild":
+            users = rebuild_stats()
+            print(f"✓ 汇总表重建完成，共 {users} 个用户")
+        elif command == "check":
+            problems = check_stats()
+            if problems:
+                print(f"✗ 发现 {len(problems)} 处不一致：")
+                for problem in problems[:50]:
+                    print(f"  - {problem}")
+                sys.exit(1)
+            print("✓ 汇总表与历史记录一致")
+        else:
+            print("用法: python stats_service.py [rebuild|check]")
+            sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
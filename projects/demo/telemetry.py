@@ -1,31 +1,545 @@
+import atexit
+import fnmatch
+import itertools
 import json
-import logging
+import os
+import random
+import sys
+import threading
 import time
 import uuid
+import zlib
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Any, Dict, Optional
 
-"""轻量级 JSON 遥测记录器，输出到 stdout 和 log/telemetry.log。"""
+from telemetry_segments import SegmentStore, first_timestamp, last_timestamp
 
-LOG_DIR = Path(__file__).parent / "log"
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+"""
+轻量级 JSON 遥测记录器，输出到控制台和 log/telemetry.log。
+
+log_event 只在请求线程里组装事件并放入有界队列，序列化和写文件由后台线程批量完成：
+- 写线程每批最多处理 TELEMETRY_BATCH_SIZE 条，按 TELEMETRY_FSYNC_INTERVAL 秒定期 fsync
+- 队列满时先丢弃低优先级事件（*.start 等），错误事件最后丢弃，丢弃数量单独计数
+- 进程退出时（atexit）写完队列中剩余的事件
+- 当前文件超过大小/时间上限后轮转为压缩分段（见 telemetry_segments.py）
+- 事件级别、采样率和路由过滤由 TelemetryPolicy 控制，可在运行时修改
+"""
+
+# 日志目录（遥测、trace、性能分析文件），默认为项目下的 log/
+LOG_DIR = Path(os.getenv("TELEMETRY_LOG_DIR") or Path(__file__).parent / "log")
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 LOG_FILE = LOG_DIR / "telemetry.log"
 
-# 独立的 telemetry logger，打印一行一个 JSON，方便收集与 grep。
-logger = logging.getLogger("telemetry")
-if not logger.handlers:
-    formatter = logging.Formatter("%(message)s")
+# 事件优先级：队列满时按优先级从低到高、从旧到新丢弃
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 1
+PRIORITY_HIGH = 2
+PRIORITY_NAMES = {PRIORITY_LOW: "low", PRIORITY_NORMAL: "normal", PRIORITY_HIGH: "high"}
+
+
+def event_priority(event: str) -> int:
+    """根据事件名判断优先级：错误/失败为高，开始类事件为低。"""
+    name = event.lower()
+    if "error" in name or "fail" in name or "exception" in name:
+        return PRIORITY_HIGH
+    if name.endswith(".start"):
+        return PRIORITY_LOW
+    return PRIORITY_NORMAL
+
+
+class TelemetryWriter:
+    """遥测后台写入器：有界队列 + 单写线程 + 批量序列化"""
+
+    def __init__(
+        self,
+        log_file=LOG_FILE,
+        max_queue_size=None,
+        max_batch_size=None,
+        fsync_interval=None,
+        console=None,
+        rotate_bytes=None,
+        rotate_seconds=None,
+        max_segments=None,
+    ):
+        """
+        Args:
+            log_file: 日志文件路径
+            max_queue_size: 队列容量，默认读取 TELEMETRY_QUEUE_SIZE（10000）
+            max_batch_size: 每批最多写入的事件数，默认读取 TELEMETRY_BATCH_SIZE（500）
+            fsync_interval: fsync 间隔秒数，默认读取 TELEMETRY_FSYNC_INTERVAL（1秒）
+            console: 是否同时输出到控制台（stderr），默认读取 TELEMETRY_CONSOLE（1）
+            rotate_bytes: 当前文件超过该大小后轮转，默认读取 TELEMETRY_ROTATE_MB（50MB）
+            rotate_seconds: 当前文件的第一条事件超过该时间后轮转，默认读取 TELEMETRY_ROTATE_SECONDS（3600）
+            max_segments: 保留的压缩分段数量，默认读取 TELEMETRY_MAX_SEGMENTS（100）
+        """
+        self.log_file = Path(log_file)
+        self.max_queue_size = max_queue_size or int(
+            os.getenv("TELEMETRY_QUEUE_SIZE", "10000")
+        )
+        self.max_batch_size = max_batch_size or int(
+            os.getenv("TELEMETRY_BATCH_SIZE", "500")
+        )
+        self.fsync_interval = (
+            fsync_interval
+            if fsync_interval is not None
+            else float(os.getenv("TELEMETRY_FSYNC_INTERVAL", "1"))
+        )
+        self.console = (
+            console
+            if console is not None
+            else os.getenv("TELEMETRY_CONSOLE", "1") != "0"
+        )
+        self.rotate_bytes = rotate_bytes or int(
+            float(os.getenv("TELEMETRY_ROTATE_MB", "50")) * 1024 * 1024
+        )
+        self.rotate_seconds = rotate_seconds or float(
+            os.getenv("TELEMETRY_ROTATE_SECONDS", "3600")
+        )
+        self.segments = SegmentStore(
+            self.log_file,
+            max_segments=max_segments or int(os.getenv("TELEMETRY_MAX_SEGMENTS", "100")),
+        )
+        self._closed = False
+        self._reset_state()
+        # 预加载应用后fork出的worker没有父进程的写线程，需要重新创建队列和锁
+        os.register_at_fork(after_in_child=self._reset_state)
+
+    def _reset_state(self):
+        """初始化队列、写线程和文件状态（fork后的子进程中重新初始化）"""
+        # 每个优先级一个队列，元素为 (序号, 事件)；写线程按序号合并，保持入队顺序
+        self._queues = {level: deque() for level in PRIORITY_NAMES}
+        self._queued = 0
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._written = 0
+        self._dropped = {name: 0 for name in PRIORITY_NAMES.values()}
+        self._dropped_reported = 0
+        self._fsync_requested = False
+        self._fsync_count = 0
+        # 文件不带缓冲，父进程的文件对象中没有未写出的数据；子进程重新打开文件和锁
+        self._file = None
+        self._lock_file = None
+        self._file_shared = False
+        self._file_size = 0
+        self._file_events = None
+        self._file_start_ts = None
+        self._file_last_ts = None
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+
+    def start(self):
+        """启动写线程（首次记录事件时自动调用）"""
+        with self._cond:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(
+                    target=self._run, name="telemetry-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+
+    def submit(self, payload: Dict[str, Any], priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        放入一个事件（不阻塞）
+        Returns: 是否入队；队列满且没有更低优先级的事件可丢弃时返回False
+        """
+        if self._thread is None:
+            self.start()
+        with self._cond:
+            if self._closed:
+                return False
+            if self._queued >= self.max_queue_size and not self._make_room(priority):
+                self._dropped[PRIORITY_NAMES[priority]] += 1
+                return False
+            self._queues[priority].append((next(self._sequence), payload))
+            self._queued += 1
+            self._cond.notify()
+        return True
+
+    def _make_room(self, priority: int) -> bool:
+        # 调用方持有锁；丢弃最旧的、优先级最低且不高于新事件的事件
+        for level in range(PRIORITY_LOW, priority + 1):
+            queue = self._queues[level]
+            if queue:
+                queue.popleft()
+                self._queued -= 1
+                self._dropped[PRIORITY_NAMES[level]] += 1
+                return True
+        return False
+
+    def _pop_batch(self, limit: int):
+        """按入队顺序取出最多limit个事件（调用方持有锁）：[(优先级, 事件)]"""
+        batch = []
+        while self._queued and len(batch) < limit:
+            level = min(
+                (level for level, queue in self._queues.items() if queue),
+                key=lambda level: self._queues[level][0][0],
+            )
+            batch.append((level, self._queues[level].popleft()[1]))
+            self._queued -= 1
+        return batch
+
+    def stats(self) -> Dict[str, Any]:
+        """写入器状态：排队数量、已写入数量、各优先级丢弃数量"""
+        with self._cond:
+            return {
+                "queued": self._queued,
+                "written": self._written,
+                "dropped": sum(self._dropped.values()),
+                "dropped_by_priority": dict(self._dropped),
+            }
+
+    def qsize(self) -> int:
+        """当前排队中的事件数量"""
+        return self._queued
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待此前入队的事件全部写入文件并fsync；超时返回False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if self._thread is None:
+                return True
+            seen = self._fsync_count
+            self._fsync_requested = True
+            self._cond.notify_all()
+            while self._fsync_count == seen and self._thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10):
+        """停止接收新事件，写完队列中已有的事件后退出写线程"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queued and not self._closed and not self._fsync_requested:
+                    self._cond.wait(self.fsync_interval)
+                batch = self._pop_batch(self.max_batch_size)
+                dropped = sum(self._dropped.values()) - self._dropped_reported
+                self._dropped_reported += dropped
+                stopping = self._closed and not self._queued
+                # 队列写空时才响应flush，保证flush之前入队的事件都在fsync之前写入
+                force_fsync = stopping or (self._fsync_requested and not self._queued)
+                if force_fsync:
+                    self._fsync_requested = False
+
+            if dropped:
+                batch.append(
+                    (
+                        PRIORITY_HIGH,
+                        {"ts": time.time(), "event": "telemetry.dropped", "count": dropped},
+                    )
+                )
+            self._write_batch(batch, force_fsync)
+
+            with self._cond:
+                self._written += len(batch)
+                if force_fsync:
+                    self._fsync_count += 1
+                    self._cond.notify_all()
+            if stopping:
+                break
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """
+        跨进程的文件锁：多个worker写同一个文件，写入时持有共享锁，轮转时持有独占锁，
+        保证不会写进正在被其他进程轮转的文件（没有fcntl的平台不加锁）
+        """
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(f"{self.log_file}.lock", "ab")
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _replaced(self) -> bool:
+        """当前打开的文件是否已被其他进程轮转（路径指向了另一个文件）"""
+        try:
+            return os.stat(self.log_file).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _open_file(self):
+        if self._file is not None:
+            self._file.close()
+        # 不带缓冲的追加写：每批事件一次write，多个进程的行不会互相截断
+        self._file = open(self.log_file, "ab", buffering=0)
+        self._file_size = os.fstat(self._file.fileno()).st_size
+        # 接着写已有文件时不知道其中的事件数，清单中记为None
+        self._file_events = 0 if not self._file_size else None
+        self._file_start_ts = first_timestamp(self.log_file) if self._file_size else None
+        self._file_shared = False
+        self._dirty = False
+
+    def _rotate(self, end_ts):
+        """关闭当前文件并压缩为分段，之后写入新文件；其他进程已经轮转时只重新打开"""
+        with self._file_lock(exclusive=True):
+            if not self._replaced():
+                if self._dirty:
+                    os.fsync(self._file.fileno())
+                # 其他进程也写过这个文件时，从文件末尾读取最后一条事件的时间
+                if self._file_shared:
+                    end_ts = max(end_ts, last_timestamp(self.log_file) or end_ts)
+                self._file.close()
+                self._file = None
+                self.segments.rotate(self._file_start_ts, end_ts, self._file_events)
+            self._open_file()
+
+    def _write_batch(self, batch, force_fsync=False):
+        lines = []
+        first_ts = last_ts = None
+        for _, payload in batch:
+            try:
+                lines.append(json.dumps(payload, ensure_ascii=False, default=str))
+            except (TypeError, ValueError):
+                continue
+            ts = payload.get("ts")
+            if ts is not None:
+                first_ts = ts if first_ts is None else first_ts
+                last_ts = ts
+        text = "".join(line + "\n" for line in lines)
+        try:
+            if text:
+                data = text.encode("utf-8")
+                if self._file is None or self._replaced():
+                    self._open_file()
+                # 文件大小包含其他进程写入的内容
+                file_size = os.fstat(self._file.fileno()).st_size
+                if file_size != self._file_size:
+                    self._file_shared = True
+                    self._file_events = None
+                    self._file_size = file_size
+                if self._file_size and (
+                    self._file_size + len(data) > self.rotate_bytes
+                    or (
+                        self._file_start_ts is not None
+                        and first_ts is not None
+                        and first_ts - self._file_start_ts >= self.rotate_seconds
+                    )
+                ):
+                    self._rotate(self._file_last_ts or first_ts or time.time())
+                with self._file_lock(exclusive=False):
+                    if self._replaced():
+                        self._open_file()
+                    written = 0
+                    while written < len(data):
+                        written += self._file.write(data[written:])
+                self._dirty = True
+                self._file_size += len(data)
+                if self._file_events is not None:
+                    self._file_events += len(lines)
+                if self._file_start_ts is None:
+                    self._file_start_ts = first_ts
+                self._file_last_ts = last_ts
+                if self.console:
+                    sys.stderr.write(text)
+                    sys.stderr.flush()
+            # 定期fsync：空闲时也会按间隔醒来，把上一批数据刷到磁盘
+            now = time.monotonic()
+            if self._dirty and (
+                force_fsync or now - self._last_fsync >= self.fsync_interval
+            ):
+                os.fsync(self._file.fileno())
+                self._dirty = False
+                self._last_fsync = now
+        except (OSError, ValueError):
+            # 写日志失败不能影响业务；下次重新打开文件
+            self._file = None
+            self._dirty = False
+
+
+# 事件级别：低于最低级别的事件不记录
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+
+def _parse_mapping(value: str, convert) -> Dict[str, Any]:
+    """解析 "pattern=value,pattern=value" 形式的环境变量"""
+    mapping = {}
+    for entry in (value or "").split(","):
+        pattern, sep, raw = entry.partition("=")
+        if sep and pattern.strip():
+            try:
+                mapping[pattern.strip()] = convert(raw.strip())
+            except (KeyError, ValueError):
+                continue
+    return mapping
+
+
+def _parse_level(value) -> int:
+    return value if isinstance(value, int) else LEVELS[str(value).lower()]
+
+
+def _parse_routes(value: str):
+    return [route.strip() for route in (value or "").split(",") if route.strip()]
+
+
+class TelemetryPolicy:
+    """
+    遥测事件的级别、采样率和路由过滤（可在运行时修改）
+
+    - 事件模式支持通配符（如 api.request.*），精确匹配优先，其次是最长的模式
+    - 默认级别：错误/失败类事件为error，其他为info；低于 min_level 的事件直接丢弃
+    - 采样按 request_id 哈希决定，同一请求的 start/done 等事件一起保留或丢弃；错误类事件默认不采样
+    - 路由过滤只影响 api.request.* 事件（请求内部的错误事件照常记录）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Any] = {}
+        self.sampled_out = 0
+        self.configure(
+            min_level=os.getenv("TELEMETRY_LEVEL", "info"),
+            event_levels=_parse_mapping(os.getenv("TELEMETRY_EVENT_LEVELS", ""), _parse_level),
+            sample_rates=_parse_mapping(os.getenv("TELEMETRY_SAMPLING", ""), float),
+            route_allow=_parse_routes(os.getenv("TELEMETRY_ROUTE_ALLOW", "")),
+            route_deny=_parse_routes(os.getenv("TELEMETRY_ROUTE_DENY", "/health,/metrics")),
+        )
+
+    def configure(
+        self,
+        min_level=None,
+        event_levels=None,
+        sample_rates=None,
+        route_allow=None,
+        route_deny=None,
+    ):
+        """
+        修改配置（None表示保持不变），参数格式不正确时抛出 ValueError
+        Args:
+            min_level: 最低级别（debug/info/warning/error）
+            event_levels: 事件模式 -> 级别
+            sample_rates: 事件模式 -> 采样率（0~1）
+            route_allow: 只记录这些路由前缀的请求事件（为空表示全部）
+            route_deny: 不记录这些路由前缀的请求事件
+        """
+        updates = {}
+        try:
+            if min_level is not None:
+                updates["min_level"] = _parse_level(min_level)
+            if event_levels is not None:
+                updates["event_levels"] = {
+                    k: _parse_level(v) for k, v in event_levels.items()
+                }
+        except KeyError as e:
+            raise ValueError(f"未知的级别: {e.args[0]}") from None
+        if sample_rates is not None:
+            rates = {k: float(v) for k, v in sample_rates.items()}
+            if any(not 0 <= rate <= 1 for rate in rates.values()):
+                raise ValueError("采样率需在0到1之间")
+            updates["sample_rates"] = rates
+        for name, routes in (("route_allow", route_allow), ("route_deny", route_deny)):
+            if routes is not None:
+                if isinstance(routes, str):
+                    raise ValueError(f"{name} 需为路由前缀列表")
+                updates[name] = [str(route) for route in routes]
+
+        # 全部校验通过后再一起生效
+        with self._lock:
+            for name, value in updates.items():
+                setattr(self, name, value)
+            self._cache = {}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前配置"""
+        names = {level: name for name, level in LEVELS.items()}
+        with self._lock:
+            return {
+                "min_level": names.get(self.min_level, self.min_level),
+                "event_levels": {k: names.get(v, v) for k, v in self.event_levels.items()},
+                "sample_rates": dict(self.sample_rates),
+                "route_allow": list(self.route_allow),
+                "route_deny": list(self.route_deny),
+                "sampled_out": self.sampled_out,
+            }
+
+    @staticmethod
+    def _lookup(mapping: Dict[str, Any], event: str):
+        if event in mapping:
+            return mapping[event]
+        matches = [p for p in mapping if fnmatch.fnmatchcase(event, p)]
+        return mapping[max(matches, key=len)] if matches else None
+
+    def _resolve(self, event: str):
+        """(是否达到级别, 采样率)，按事件名缓存"""
+        resolved = self._cache.get(event)
+        if resolved is not None:
+            return resolved
+        # 未命中时在锁内计算：configure 同时修改配置并清空缓存，不会把旧配置的结果写进新缓存
+        with self._lock:
+            level = self._lookup(self.event_levels, event)
+            if level is None:
+                level = LEVELS["error"] if event_priority(event) == PRIORITY_HIGH else LEVELS["info"]
+            if event_priority(event) == PRIORITY_HIGH:
+                rate = self.sample_rates.get(event)  # 错误类事件只按精确配置采样
+            else:
+                rate = self._lookup(self.sample_rates, event)
+            resolved = (level >= self.min_level, 1.0 if rate is None else rate)
+            self._cache[event] = resolved
+        return resolved
+
+    def should_log(self, event: str, request_id: Optional[str] = None) -> bool:
+        """事件是否需要记录（级别 + 采样）"""
+        enabled, rate = self._resolve(event)
+        if not enabled:
+            return False
+        if rate >= 1:
+            return True
+        if request_id:
+            keep = zlib.crc32(request_id.encode()) % 10000 < rate * 10000
+        else:
+            keep = random.random() < rate
+        if not keep:
+            self.sampled_out += 1  # 近似计数，不加锁
+        return keep
+
+    def route_enabled(self, path: str) -> bool:
+        """请求事件（api.request.*）是否记录该路由"""
+        if any(path.startswith(route) for route in self.route_deny):
+            return False
+        return not self.route_allow or any(path.startswith(r) for r in self.route_allow)
+
+
+_policy = TelemetryPolicy()
+
+
+def get_telemetry_policy() -> TelemetryPolicy:
+    """进程内共享的遥测策略。"""
+    return _policy
+
 
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-    logger.addHandler(stream_handler)
+_writer = TelemetryWriter()
 
-    file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
 
-logger.setLevel(logging.INFO)
-logger.propagate = False
+def get_telemetry_writer() -> TelemetryWriter:
+    """进程内共享的遥测写入器。"""
+    return _writer
 
 
 def new_request_id() -> str:
@@ -34,10 +548,12 @@ def new_request_id() -> str:
 
 
 def log_event(event: str, **kwargs: Optional[Any]) -> None:
-    """输出结构化遥测事件。None 字段自动忽略。"""
+    """输出结构化遥测事件。None 字段自动忽略；按策略过滤级别和采样。"""
+    if not _policy.should_log(event, kwargs.get("request_id")):
+        return
     payload: Dict[str, Any] = {"ts": time.time(), "event": event}
     for key, value in kwargs.items():
         if value is None:
             continue
         payload[key] = value
-    logger.info(json.dumps(payload, ensure_ascii=False))
+    _writer.submit(payload, event_priority(event))
@@ -0,0 +1,236 @@
+"""
+遥测日志分段存储
+
+log/telemetry.log 是当前写入的文件，达到大小或时间上限后由写线程轮转：
+重命名后压缩为 log/telemetry/telemetry-<开始时间>.log.gz，并把时间范围和事件数
+记录到清单 log/telemetry/manifest.json（超过保留数量的旧分段自动删除）。
+
+读取时按清单中的时间范围跳过不相关的分段，逐行流式解压和过滤，内存占用与文件大小无关。
+"""
+
+import gzip
+import json
+import os
+import shutil
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+MANIFEST_NAME = "manifest.json"
+
+# 相对时间后缀（since=1h 表示最近一小时）
+_RELATIVE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_time(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    解析时间参数：Unix时间戳、ISO 8601 时间，或相对时间（如 30m、1h、2d）
+    无法解析时抛出 ValueError
+    """
+    if value is None or value == "":
+        return None
+    value = value.strip()
+    unit = _RELATIVE_UNITS.get(value[-1:].lower())
+    if unit and value[:-1].replace(".", "", 1).isdigit():
+        return (now if now is not None else time.time()) - float(value[:-1]) * unit
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def first_timestamp(path: Path) -> Optional[float]:
+    """日志文件第一条事件的时间"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.loads(f.readline()).get("ts")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def last_timestamp(path: Path, block_size: int = 65536) -> Optional[float]:
+    """日志文件最后一条事件的时间（只读取文件末尾）"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - block_size, 0))
+            lines = f.read().splitlines()
+        return json.loads(lines[-1]).get("ts") if lines else None
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class SegmentStore:
+    """遥测日志分段（轮转、压缩、清单和过滤读取）"""
+
+    def __init__(self, active_file, max_segments: int = 100):
+        """
+        Args:
+            active_file: 当前写入的日志文件
+            max_segments: 保留的压缩分段数量，超过后删除最旧的
+        """
+        self.active_file = Path(active_file)
+        self.directory = self.active_file.parent / self.active_file.stem
+        self.manifest_file = self.directory / MANIFEST_NAME
+        self.max_segments = max_segments
+
+    def segments(self) -> List[Dict]:
+        """清单中的分段（按时间从旧到新）"""
+        try:
+            with open(self.manifest_file, "r", encoding="utf-8") as f:
+                return json.load(f)["segments"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return []
+
+    def _save(self, segments: List[Dict]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.manifest_file.with_name(MANIFEST_NAME + ".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"segments": segments}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+    def rotate(self, start_ts: Optional[float], end_ts: float, events: Optional[int]):
+        """
+        把当前日志文件压缩为一个分段并更新清单（写线程在关闭文件后调用）
+        Returns: 新分段的清单条目；当前文件不存在或为空时返回None
+        """
+        try:
+            raw_size = self.active_file.stat().st_size
+        except FileNotFoundError:
+            return None
+        if not raw_size:
+            return None
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        start_ts = start_ts or first_timestamp(self.active_file) or end_ts
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(start_ts))
+        name = f"{self.active_file.stem}-{stamp}.log.gz"
+        suffix = 1
+        while (self.directory / name).exists():
+            suffix += 1
+            name = f"{self.active_file.stem}-{stamp}-{suffix}.log.gz"
+
+        # 先改名再压缩：压缩中途退出时原始数据仍保留在分段目录中
+        pending = self.directory / (name[: -len(".gz")])
+        os.replace(self.active_file, pending)
+        tmp_file = self.directory / (name + ".tmp")
+        with open(pending, "rb") as src, gzip.open(tmp_file, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(tmp_file, self.directory / name)
+        os.remove(pending)
+
+        entry = {
+            "file": name,
+            "start_ts": start_ts,
+            "end_ts": end_ts,
+            "events": events,
+            "size": (self.directory / name).stat().st_size,
+            "raw_size": raw_size,
+        }
+        segments = self.segments() + [entry]
+        expired = segments[: max(len(segments) - self.max_segments, 0)]
+        segments = segments[len(expired) :]
+        self._save(segments)
+        for old in expired:
+            try:
+                os.remove(self.directory / old["file"])
+            except FileNotFoundError:
+                pass
+        return entry
+
+    def _open_lines(self, path: Path) -> Iterator[str]:
+        opener = gzip.open if path.suffix == ".gz" else open
+        try:
+            with opener(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    # 写线程正在写入的最后一行可能不完整
+                    if line.endswith("\n"):
+                        yield line
+        except FileNotFoundError:
+            return  # 读取期间被轮转或清理
+
+    def _overlapping(self, since, until) -> List[Dict]:
+        return [
+            s
+            for s in self.segments()
+            if (since is None or s["end_ts"] >= since)
+            and (until is None or s["start_ts"] <= until)
+        ]
+
+    def paths(self, since: Optional[float] = None, until: Optional[float] = None) -> List[Path]:
+        """时间范围内的分段文件（从旧到新），最后是当前写入的文件"""
+        return [self.directory / s["file"] for s in self._overlapping(since, until)] + [
+            self.active_file
+        ]
+
+    def _sources(self, since, until, tail, filtered) -> Iterable[Path]:
+        segments = self._overlapping(since, until)
+        if tail and not filtered:
+            # 不过滤且只取最后N条时，从新到旧累计事件数，跳过更旧的分段
+            needed, keep = tail, 0
+            for segment in reversed(segments):
+                keep += 1
+                if not segment.get("events"):
+                    keep = len(segments)
+                    break
+                needed -= segment["events"]
+                if needed <= 0:
+                    break
+            segments = segments[len(segments) - keep :]
+        return [self.directory / s["file"] for s in segments] + [self.active_file]
+
+    def iter_lines(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        events: Optional[Iterable[str]] = None,
+        request_id: Optional[str] = None,
+        tail: Optional[int] = None,
+    ) -> Iterator[str]:
+        """
+        按条件流式返回日志行（保留原始JSON文本和换行）
+
+        Args:
+            since/until: 时间范围（Unix时间戳，含边界）
+            events: 事件名列表，匹配同名事件或以 "<名字>." 开头的事件
+            request_id: 只返回该请求的事件
+            tail: 只返回最后N条匹配的事件
+        """
+        events = tuple(events or ())
+        prefixes = tuple(e + "." for e in events)
+
+        filtered = bool(since or until or events or request_id)
+
+        def matches(line: str) -> bool:
+            # 先做子串预筛，避免每行都解析JSON
+            if request_id and request_id not in line:
+                return False
+            if not filtered:
+                return True
+            try:
+                payload = json.loads(line)
+            except ValueError:
+                return False
+            ts = payload.get("ts") or 0
+            if (since and ts < since) or (until and ts > until):
+                return False
+            if request_id and payload.get("request_id") != request_id:
+                return False
+            if events:
+                name = payload.get("event", "")
+                if name not in events and not name.startswith(prefixes):
+                    return False
+            return True
+
+        def generate():
+            for path in self._sources(since, until, tail, filtered):
+                for line in self._open_lines(path):
+                    if matches(line):
+                        yield line
+
+        if tail:
+            yield from deque(generate(), maxlen=tail)
+        else:
+            yield from generate()
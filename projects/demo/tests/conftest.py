@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试公共fixture：使用内存SQLite的独立Flask应用
+"""
+
+import os
+import tempfile
+
+# 遥测、trace和性能分析文件写入临时目录（需在导入telemetry之前设置）
+os.environ.setdefault("TELEMETRY_LOG_DIR", tempfile.mkdtemp(prefix="demo-log-"))
+
+import pytest
+from flask import Flask
+
+from user_models import db, User
+
+
+@pytest.fixture
+def db_app():
+    """创建带有内存数据库的Flask应用，测试结束后销毁"""
+    test_app = Flask(__name__)
+    test_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    test_app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(test_app)
+
+    with test_app.app_context():
+        db.create_all()
+        yield test_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def user(db_app):
+    """创建一个测试用户"""
+    test_user = User(username="tester", email="tester@example.com")
+    test_user.set_password("secret123")
+    db.session.add(test_user)
+    db.session.commit()
+    return test_user
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+编译题库测试：与JSON加载结果一致、按需解码、JSON更新后自动回退
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+
+from compile_question_bank import compile_question_bank
+from question_bank import CompiledQuestions, QuestionBank
+
+SOURCE = Path(__file__).resolve().parent.parent / "TOP_generated.json"
+
+
+def test_compiled_matches_json(tmp_path):
+    json_file = tmp_path / "bank.json"
+    shutil.copy(SOURCE, json_file)
+    from_json = QuestionBank(str(json_file)).snapshot()
+
+    output, count = compile_question_bank(json_file)
+    assert output == tmp_path / "bank.qbank"
+    assert count == len(from_json.questions)
+
+    snapshot = QuestionBank(str(json_file)).snapshot()
+    questions = snapshot.questions
+    assert isinstance(questions, CompiledQuestions)
+    # 只解析索引，题目尚未解码
+    assert questions.decoded_count() == 0
+    assert snapshot.version == from_json.version
+    assert snapshot.sorted_ids == from_json.sorted_ids
+    assert snapshot.sorted_valid_ids == from_json.sorted_valid_ids
+    assert snapshot.get_statistics() == from_json.get_statistics()
+
+    first_id = snapshot.sorted_valid_ids[0]
+    assert snapshot.get_question(first_id) == from_json.get_question(first_id)
+    assert questions.decoded_count() == 1
+    assert snapshot.get_question_list_response(
+        format_type="detailed"
+    ) == from_json.get_question_list_response(format_type="detailed")
+    assert dict(questions) == dict(from_json.questions)
+
+
+def test_falls_back_when_json_newer(tmp_path):
+    json_file = tmp_path / "bank.json"
+    shutil.copy(SOURCE, json_file)
+    compile_question_bank(json_file)
+
+    data = json.loads(json_file.read_text(encoding="utf-8"))[:1]
+    json_file.write_text(json.dumps(data), encoding="utf-8")
+    compiled = tmp_path / "bank.qbank"
+    stat = compiled.stat()
+    os.utime(json_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    snapshot = QuestionBank(str(json_file)).snapshot()
+    assert not isinstance(snapshot.questions, CompiledQuestions)
+    assert len(snapshot.questions) == 1
+
+
+def test_released_snapshot_closes_mmap(tmp_path):
+    json_file = tmp_path / "bank.json"
+    shutil.copy(SOURCE, json_file)
+    compile_question_bank(json_file)
+    bank = QuestionBank(str(json_file))
+
+    # 仍被请求持有的旧快照在重新加载后可以继续读取
+    held = bank.snapshot()
+    finalizer = held.questions._finalizer
+    bank.reload()
+    assert finalizer.alive
+    assert held.get_question(held.sorted_valid_ids[0]) is not None
+
+    # 最后一个引用释放后关闭映射
+    del held
+    assert not finalizer.alive
+
+    current = bank.snapshot().questions
+    current.close()
+    assert current.closed
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试历史记录全文检索
+"""
+
+from flask import Flask
+
+import history_search
+from user_models import db, History, User
+from history_search import LikeSearchBackend
+from history_service import (
+    save_history,
+    update_history,
+    delete_history,
+    search_histories,
+)
+
+
+def test_search_tracks_insert_update_delete(db_app, user):
+    """检索结果随保存、更新、删除同步变化"""
+    _, _, first = save_history(
+        user_id=user.id,
+        answer="Technology products are often bought on impulse.",
+        question="44",
+        comment="",
+        polished_answer="",
+    )
+    save_history(
+        user_id=user.id,
+        answer="Online classes help students manage their time.",
+        question="45",
+    )
+
+    result = search_histories(user.id, "impulse")
+    assert result["pagination"]["total"] == 1
+    assert result["results"][0]["global_id"] == first.global_id
+    assert "impulse" in result["results"][0]["snippets"]["answer"]
+
+    # 更新评语后可以检索到评语内容
+    assert search_histories(user.id, "persuasive")["pagination"]["total"] == 0
+    success, _ = update_history(
+        first, comment="STRENGTHS:\n1. A persuasive example.\nEND", score=4
+    )
+    assert success
+    result = search_histories(user.id, "persuasive")
+    assert result["pagination"]["total"] == 1
+    assert "comment" in result["results"][0]["snippets"]
+
+    # 前缀匹配最后一个词
+    assert search_histories(user.id, "manage ti")["pagination"]["total"] == 1
+
+    success, _ = delete_history(first.global_id, user.id)
+    assert success
+    assert search_histories(user.id, "impulse")["pagination"]["total"] == 0
+    assert search_histories(user.id, "persuasive")["pagination"]["total"] == 0
+
+
+def test_search_is_scoped_to_user(db_app, user):
+    """只能检索到自己的记录"""
+    other = User(username="other", email="other@example.com")
+    other.set_password("secret123")
+    db.session.add(other)
+    db.session.commit()
+
+    save_history(user_id=other.id, answer="Impulse purchases are common.", question="44")
+
+    assert search_histories(user.id, "impulse")["pagination"]["total"] == 0
+    assert search_histories(other.id, "impulse")["pagination"]["total"] == 1
+
+
+def test_search_ignores_query_syntax(db_app, user):
+    """用户输入中的FTS语法字符不会导致查询报错"""
+    save_history(user_id=user.id, answer="Near the end of the class.", question="44")
+
+    result = search_histories(user.id, 'NEAR("end" OR) * -class')
+    assert result["pagination"]["total"] == 0
+    assert search_histories(user.id, '"end"')["pagination"]["total"] == 1
+    assert search_histories(user.id, "!!!")["results"] == []
+
+
+def test_first_save_on_file_database(tmp_path):
+    """文件数据库上首次保存时创建索引表不会与本事务的写锁冲突"""
+    file_app = Flask(__name__)
+    file_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'app.db'}"
+    db.init_app(file_app)
+    with file_app.app_context():
+        db.create_all()
+        owner = User(username="file", email="file@example.com")
+        owner.set_password("secret123")
+        db.session.add(owner)
+        db.session.commit()
+
+        success, message, _ = save_history(
+            user_id=owner.id, answer="Impulse purchases.", question="44"
+        )
+        assert success, message
+        assert search_histories(owner.id, "impulse")["pagination"]["total"] == 1
+        db.session.remove()
+
+
+def test_clear_database_clears_index(tmp_path):
+    """清空脚本同时清空全文索引，复用的rowid不会命中旧内容"""
+    from clear_database import clear_database
+
+    db_file = tmp_path / "app.db"
+    file_app = Flask(__name__)
+    file_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_file}"
+    db.init_app(file_app)
+    with file_app.app_context():
+        db.create_all()
+        owner = User(username="file", email="file@example.com")
+        owner.set_password("secret123")
+        db.session.add(owner)
+        db.session.commit()
+        owner_id = owner.id
+        save_history(user_id=owner_id, answer="Impulse purchases.", question="44")
+        db.session.remove()
+
+        clear_database(str(db_file))
+        assert search_histories(owner_id, "impulse")["pagination"]["total"] == 0
+
+        save_history(user_id=owner_id, answer="Online classes.", question="45")
+        assert search_histories(owner_id, "impulse")["pagination"]["total"] == 0
+        assert search_histories(owner_id, "online")["pagination"]["total"] == 1
+        db.session.remove()
+
+
+def test_like_backend_matches_compressed_rows(db_app, user, monkeypatch):
+    """LIKE后端可以检索压缩存储的记录"""
+    monkeypatch.setenv("HISTORY_TEXT_COMPRESSION", "zlib")
+    long_answer = "Technology products are often bought on impulse. " * 10
+    save_history(user_id=user.id, answer=long_answer, question="44")
+    monkeypatch.setenv("HISTORY_TEXT_COMPRESSION", "none")
+    save_history(user_id=user.id, answer="Impulse buying is short.", question="45")
+    save_history(user_id=user.id, answer="Online classes.", question="46")
+
+    backend = LikeSearchBackend(db.engine)
+    rows, total = backend.search(db.session, user.id, ["impulse"], 0, 10)
+    assert total == 2
+    rows, total = backend.search(db.session, user.id, ["impulse", "technology"], 0, 10)
+    assert total == 1
+    assert backend.search(db.session, user.id, ["online"], 0, 10)[1] == 1
+    # 明文与压缩记录按时间倒序合并分页：第二页是较早保存的压缩记录
+    compressed_id = History.query.filter_by(question="44").one().id
+    assert backend.search(db.session, user.id, ["impulse"], 1, 1) == ([(compressed_id, None)], 2)
+
+
+def test_like_backend_without_compressed_rows(db_app, user, monkeypatch):
+    """没有压缩记录时完全在SQL中匹配和分页，不逐条解压"""
+    for i in range(3):
+        save_history(user_id=user.id, answer=f"Impulse purchases {i}.", question="44")
+    save_history(user_id=user.id, answer="Online classes.", question="45")
+
+    def fail(value):
+        raise AssertionError("不应解压")
+
+    monkeypatch.setattr(history_search, "decompress_value", fail)
+    backend = LikeSearchBackend(db.engine)
+    rows, total = backend.search(db.session, user.id, ["impulse"], 1, 1)
+    assert total == 3 and len(rows) == 1
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试历史记录后台写入器
+"""
+
+import json
+import uuid
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+from user_models import db, History
+from history_writer import HistoryWriter
+from stats_service import get_user_stats
+
+
+def test_writer_commits_insert_then_update(db_app, user):
+    """预分配global_id后先插入再更新，Future在提交后完成"""
+    writer = HistoryWriter(db_app)
+    global_id = str(uuid.uuid4())
+    created = writer.save_history_async(
+        user_id=user.id,
+        answer="An essay.",
+        question="44",
+        global_id=global_id,
+        comment="",
+        polished_answer="",
+    )
+    saved = writer.update_history_async(
+        global_id, user.id, comment="SCORE:\n[4]", polished_answer="Better.", score=4
+    )
+    assert created.result(timeout=5) == global_id
+    assert saved.result(timeout=5) == global_id
+    writer.close()
+
+    db.session.expire_all()
+    history = History.query.filter_by(global_id=global_id).one()
+    assert history.user_sequence == 1
+    assert history.polished_answer == "Better."
+    assert get_user_stats(user.id)["summary"]["scored_count"] == 1
+
+
+def test_writer_isolates_failed_operation(db_app, user):
+    """同一批次中失败的操作不影响其他操作"""
+    writer = HistoryWriter(db_app)
+    missing = writer.update_history_async(str(uuid.uuid4()), user.id, comment="x")
+    ok = writer.save_history_async(
+        user_id=user.id, answer="b", question="44", global_id=str(uuid.uuid4())
+    )
+    with pytest.raises(LookupError):
+        missing.result(timeout=5)
+    assert ok.result(timeout=5)
+    writer.close()
+
+
+def test_writer_drains_queue_on_close(db_app, user):
+    """关闭时处理完队列中已有的写操作"""
+    writer = HistoryWriter(db_app, max_batch_size=3)
+    futures = [
+        writer.save_history_async(
+            user_id=user.id,
+            answer=f"essay {i}",
+            question="44",
+            global_id=str(uuid.uuid4()),
+        )
+        for i in range(10)
+    ]
+    writer.close()
+    assert all(f.done() and f.exception() is None for f in futures)
+    assert History.query.filter_by(user_id=user.id).count() == 10
+    with pytest.raises(RuntimeError):
+        writer.save_history_async(
+            user_id=user.id, answer="late", question="44", global_id=str(uuid.uuid4())
+        )
+
+
+def test_writer_restarts_after_fork(db_app, user):
+    """fork后的子进程丢弃父进程的队列，首次提交时重新启动写线程"""
+    writer = HistoryWriter(db_app)
+    writer.save_history_async(
+        user_id=user.id, answer="parent", question="44", global_id=str(uuid.uuid4())
+    ).result(timeout=5)
+    parent_thread = writer._thread
+    assert parent_thread is not None
+
+    writer._after_fork()
+    assert writer._thread is None and writer.qsize() == 0
+    created = writer.save_history_async(
+        user_id=user.id, answer="child", question="44", global_id=str(uuid.uuid4())
+    )
+    assert created.result(timeout=5)
+    assert writer._thread is not parent_thread
+    writer.close()
+
+
+def test_stream_starts_before_insert_commits(monkeypatch):
+    """流式接口立即返回history_id并开始评估，只在发送history_saved前等待插入提交"""
+    import app as app_module
+
+    inserted, updated, order = Future(), Future(), []
+
+    class FakeWriter:
+        def save_history_async(self, **kwargs):
+            return inserted
+
+        def update_history_async(self, global_id, user_id, **kwargs):
+            order.append("update")
+            updated.set_result(global_id)
+            return updated
+
+    def chunks(*texts):
+        return iter(
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=t))])
+            for t in texts
+        )
+
+    class FakeEvaluator:
+        def __init__(self, question):
+            pass
+
+        def generate_response(self, answer, stream=True):
+            order.append("evaluate")
+            inserted.set_result("inserted")  # 插入在评估开始之后才提交
+            return chunks("SCORE:\n[4]")
+
+    class FakePolisher:
+        def __init__(self, answer, comment):
+            pass
+
+        def generate_response(self, stream=True):
+            return chunks("Better.")
+
+    monkeypatch.setattr(app_module, "history_writer", FakeWriter())
+    monkeypatch.setattr(app_module, "Evaluator", FakeEvaluator)
+    monkeypatch.setattr(app_module, "Polisher", FakePolisher)
+    monkeypatch.setattr(app_module, "verify_jwt_in_request", lambda optional=False: None)
+    monkeypatch.setattr(app_module, "get_current_user", lambda: SimpleNamespace(id=1))
+
+    response = app_module.app.test_client().post(
+        "/grade_and_polish", json={"answer": "An essay.", "question": "44"}
+    )
+    events = [
+        json.loads(line[len("data: "):])
+        for line in response.get_data(as_text=True).splitlines()
+        if line.startswith("data: ")
+    ]
+    types = [e["type"] for e in events]
+    assert types[0] == "history_id"
+    assert order == ["evaluate", "update"]
+    assert types.index("history_saved") > types.index("polished_complete")
+    assert events[types.index("history_saved")]["history_id"] == events[0]["history_id"]
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM流式调用统计测试：首字时间、块数、块间隔、卡顿和输出速度
+"""
+
+import time
+from types import SimpleNamespace
+
+import model
+from metrics import LLM_STREAM_STALLS, LLM_TIME_TO_FIRST_TOKEN
+
+
+def _chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+def _client(chunks, delays):
+    def stream():
+        for chunk, delay in zip(chunks, delays):
+            time.sleep(delay)
+            yield chunk
+
+    create = lambda **kwargs: stream()
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def test_stream_stats(monkeypatch):
+    events = []
+    monkeypatch.setattr(model, "log_event", lambda event, **kw: events.append((event, kw)))
+    monkeypatch.setattr(model, "LLM_STALL_SECONDS", 0.05)
+    labels = ("test-model", "evaluate")
+    stalls_before = LLM_STREAM_STALLS.samples().get(labels, 0)
+
+    chunks = [_chunk(None), _chunk("Hello"), _chunk(" world"), _chunk("!")]
+    stream = model._call_llm(
+        _client(chunks, [0.01, 0.02, 0.06, 0]), "test-model", [], stream=True, stage="evaluate"
+    )
+    received = []
+    for chunk in stream:
+        received.append(chunk)
+        time.sleep(0.03)  # 调用方处理时间不计入块间隔
+    assert received == chunks
+
+    success = [kw for event, kw in events if event == "llm.call.success"][0]
+    assert success["stage"] == "evaluate"
+    assert success["chunks"] == 4
+    assert success["output_chars"] == 12
+    assert success["stalls"] == 1
+    assert 25 <= success["ttft_ms"] < 120
+    assert success["gap_max_ms"] >= 55
+    assert success["gap_p50_ms"] < 30
+    assert success["chars_per_sec"] > 0
+
+    stall = [kw for event, kw in events if event == "llm.stream.stall"][0]
+    assert stall["chunk_index"] == 3
+    assert LLM_STREAM_STALLS.samples()[labels] == stalls_before + 1
+    assert LLM_TIME_TO_FIRST_TOKEN.samples()[labels][2] >= 1
+
+
+def test_stream_error_keeps_partial_stats(monkeypatch):
+    events = []
+    monkeypatch.setattr(model, "log_event", lambda event, **kw: events.append((event, kw)))
+
+    def broken():
+        yield _chunk("partial")
+        raise RuntimeError("upstream closed")
+
+    create = lambda **kwargs: broken()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    stream = model._call_llm(client, "test-model", [], stream=True, stage="polish")
+    try:
+        list(stream)
+    except RuntimeError:
+        pass
+    error = [kw for event, kw in events if event == "llm.call.error"][0]
+    assert error["stage"] == "polish"
+    assert error["chunks"] == 1
+    assert error["output_chars"] == 7
+
+
+def test_first_chunk_wait_is_not_stall(monkeypatch):
+    """第一个块之前的等待计入首字时间，不算卡顿"""
+    events = []
+    monkeypatch.setattr(model, "log_event", lambda event, **kw: events.append((event, kw)))
+    monkeypatch.setattr(model, "LLM_STALL_SECONDS", 0.05)
+    stream = model._call_llm(
+        _client([_chunk("Hi"), _chunk("!")], [0.06, 0]), "test-model", [], stream=True
+    )
+    list(stream)
+    success = [kw for event, kw in events if event == "llm.call.success"][0]
+    assert success["stalls"] == 0
+    assert not [event for event, _ in events if event == "llm.stream.stall"]
+
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 11)]
+    assert model._percentile(values, 0.5) == 5
+    assert model._percentile(values, 0.9) == 9
+    assert model._percentile(values, 0.99) == 10
+    assert model._percentile([1.0, 2.0], 0.5) == 1
+    assert model._percentile([3.0], 0.99) == 3
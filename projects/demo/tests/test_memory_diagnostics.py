@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存诊断测试：存活对象和流式生成器统计、tracemalloc快照比较以及RSS采样
+"""
+
+import tracemalloc
+from types import SimpleNamespace
+
+import pytest
+
+import app as app_module
+import memory_diagnostics
+import model
+from memory_diagnostics import MemoryDiagnostics, live_objects
+
+
+def test_live_objects(monkeypatch):
+    monkeypatch.setattr(model, "log_event", lambda event, **kw: None)
+    before = live_objects()
+
+    parser = model.CommentParser()
+    parser.feed_chunk("## Strengths\n- clear")
+    chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="x"))])] * 3
+    client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kw: iter(chunks)))
+    )
+    stream = model._call_llm(client, "m", [], stream=True)
+    next(stream)  # 未结束的流
+
+    after = live_objects()
+    assert after["objects"]["CommentParser"] == before["objects"]["CommentParser"] + 1
+    assert after["parser_buffer_chars"] > before["parser_buffer_chars"]
+    assert after["streams"].get("_stream_wrapper", 0) == before["streams"].get("_stream_wrapper", 0) + 1
+
+    stream.close()
+    assert live_objects()["streams"].get("_stream_wrapper", 0) == before["streams"].get(
+        "_stream_wrapper", 0
+    )
+
+
+def test_snapshot_diff():
+    diagnostics = MemoryDiagnostics(sample_interval=0)
+    with pytest.raises(ValueError):
+        diagnostics.take_snapshot()
+    was_tracing = tracemalloc.is_tracing()
+    diagnostics.start_tracing(frames=5)
+    try:
+        first = diagnostics.take_snapshot("before")
+        leaked = [bytearray(1024) for _ in range(2000)]
+        second = diagnostics.take_snapshot("after")
+        assert [s["label"] for s in diagnostics.snapshots()] == ["before", "after"]
+
+        diff = diagnostics.compare(first["id"], against=second["id"], limit=5)
+        top = diff["top"][0]
+        assert top["location"][0].startswith("tests/test_memory_diagnostics.py:")
+        assert top["size_diff_bytes"] >= 2000 * 1024 and top["count_diff"] >= 2000
+        assert diff["total_diff_bytes"] >= 2000 * 1024
+
+        assert diagnostics.compare(first["id"])["to"] == "now"
+        allocations = diagnostics.top_allocations(limit=3, key_type="filename")
+        assert any("test_memory_diagnostics.py" in a["location"][0] for a in allocations)
+
+        with pytest.raises(LookupError):
+            diagnostics.compare(999)
+        with pytest.raises(ValueError):
+            diagnostics.compare(first["id"], key_type="bad")
+        del leaked
+    finally:
+        if not was_tracing:
+            diagnostics.stop_tracing()
+    assert diagnostics.snapshots() == [] or was_tracing
+
+
+def test_sample_and_admin_only(monkeypatch):
+    events = []
+    monkeypatch.setattr(
+        memory_diagnostics, "log_event", lambda event, **kw: events.append((event, kw))
+    )
+    fields = MemoryDiagnostics(sample_interval=0).sample()
+    assert fields["rss_bytes"] > 0 and fields["active_streams"] >= 0
+    assert "gc_objects" not in fields  # 定期采样不遍历堆
+    assert events[0][0] == "memory.sample"
+
+    response = app_module.app.test_client().get("/admin/memory")
+    assert response.status_code == 401
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+指标注册表测试：Prometheus文本格式、多进程数据合并以及 /metrics 接口
+"""
+
+import json
+import os
+
+from app import app
+from metrics import MetricsRegistry
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "请求数", ("route",))
+    requests.inc(route="/a")
+    requests.inc(2, route='/b"x')
+    depth = registry.gauge("queue_depth", "队列长度", ("queue",))
+    depth.set_function(lambda: 7, queue="history")
+    latency = registry.histogram("latency_seconds", "耗时", ("stage",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.7, 3):
+        latency.observe(value, stage="evaluate")
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/a"} 1' in text
+    assert 'requests_total{route="/b\\"x"} 2' in text
+    assert 'queue_depth{queue="history"} 7' in text
+    assert 'latency_seconds_bucket{stage="evaluate",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="evaluate",le="1"} 3' in text
+    assert 'latency_seconds_bucket{stage="evaluate",le="+Inf"} 4' in text
+    assert 'latency_seconds_sum{stage="evaluate"} 4.25' in text
+    assert 'latency_seconds_count{stage="evaluate"} 4' in text
+
+
+def test_multiprocess_merge(tmp_path):
+    """计数器和直方图累加所有进程（含已退出的），仪表只累加运行中的进程"""
+    registry = MetricsRegistry(multiproc_dir=str(tmp_path), flush_interval=3600)
+    registry.counter("jobs_total", "任务数").inc(1)
+    registry.gauge("in_flight", "进行中").set(2)
+    registry.histogram("save_seconds", "耗时", buckets=(1,)).observe(0.5)
+
+    other = MetricsRegistry()
+    other.counter("jobs_total", "任务数").inc(10)
+    other.gauge("in_flight", "进行中").set(5)
+    other.histogram("save_seconds", "耗时", buckets=(1,)).observe(2)
+    for pid in (os.getppid(), 2**22 + 12345):  # 运行中的父进程 / 不存在的进程
+        (tmp_path / f"metrics-{pid}.json").write_text(
+            json.dumps({"pid": pid, "metrics": other.collect()}), encoding="utf-8"
+        )
+
+    text = registry.render()
+    assert "jobs_total 21" in text
+    assert "in_flight 7" in text
+    assert 'save_seconds_bucket{le="1"} 1' in text
+    assert 'save_seconds_bucket{le="+Inf"} 3' in text
+
+    registry.flush()
+    saved = json.loads(registry._process_file().read_text())
+    assert saved["metrics"]["jobs_total"]["samples"] == [[[], 1]]
+
+
+def test_dead_processes_folded_into_totals(tmp_path):
+    """已退出进程（包括pid被复用的旧文件）的计数并入totals.json后删除，重复导出不会重复累加"""
+    registry = MetricsRegistry(multiproc_dir=str(tmp_path), flush_interval=3600)
+    registry.counter("jobs_total", "任务数").inc(1)
+
+    other = MetricsRegistry()
+    other.counter("jobs_total", "任务数").inc(10)
+    other.gauge("in_flight", "进行中").set(5)
+    dead_pid = 2**22 + 12345
+    files = {
+        "metrics-%d-1.json" % dead_pid: {"pid": dead_pid, "started": 1},
+        # 本进程的pid以前属于另一个已退出的进程
+        "metrics-%d-1.json" % os.getpid(): {"pid": os.getpid(), "started": 1},
+    }
+    for name, data in files.items():
+        data["metrics"] = other.collect()
+        (tmp_path / name).write_text(json.dumps(data), encoding="utf-8")
+
+    for _ in range(2):
+        text = registry.render()
+        assert "jobs_total 21" in text
+        assert "in_flight" not in text
+    assert not any((tmp_path / name).exists() for name in files)
+    totals = json.loads((tmp_path / "totals.json").read_text())
+    assert totals["metrics"]["jobs_total"]["samples"] == [[[], 20]]
+
+
+def test_metrics_endpoint():
+    client = app.test_client()
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    text = response.data.decode()
+    assert 'http_request_duration_seconds_count{route="/health",method="GET",status="200"}' in text
+    assert 'queue_depth{queue="history_writer"}' in text
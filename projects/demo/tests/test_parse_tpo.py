@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TPO解析测试：流式读取、增量更新、输出与全量生成一致
+"""
+
+import json
+from pathlib import Path
+
+from parse_tpo import iter_json_array, parse_tpo_data, process_item
+
+SOURCE = Path(__file__).resolve().parent.parent / "TPO.json"
+
+
+def _expected(items):
+    return json.dumps(
+        [process_item(item) for item in items], ensure_ascii=False, indent="\t"
+    )
+
+
+def test_iter_json_array_small_chunks():
+    items = json.loads(SOURCE.read_text(encoding="utf-8"))
+    streamed = [item for item, _ in iter_json_array(SOURCE, chunk_size=7)]
+    assert streamed == items
+
+
+def test_incremental_rebuild(tmp_path):
+    items = json.loads(SOURCE.read_text(encoding="utf-8"))[:6]
+    source = tmp_path / "TPO.json"
+    output = tmp_path / "TOP_generated.json"
+    source.write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+
+    report = parse_tpo_data(source, output, workers=1)
+    assert len(report["added"]) == 6
+    assert output.read_text(encoding="utf-8") == _expected(items)
+
+    # 没有变化时不改写输出文件
+    mtime = output.stat().st_mtime_ns
+    report = parse_tpo_data(source, output, workers=1)
+    assert report["written"] is False
+    assert report["unchanged"] == 6
+    assert output.stat().st_mtime_ns == mtime
+
+    # 修改、删除、新增各一条
+    items[1] = dict(items[1], instruction="**Changed** instruction")
+    removed = items.pop(2)
+    items.append(dict(items[0], id=999))
+    source.write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+
+    report = parse_tpo_data(source, output, workers=2)
+    assert report["changed"] == [str(items[1]["id"])]
+    assert report["removed"] == [str(removed["id"])]
+    assert report["added"] == ["999"]
+    assert report["unchanged"] == 4
+    assert output.read_text(encoding="utf-8") == _expected(items)
+
+
+def test_duplicate_ids_keep_last(tmp_path):
+    items = json.loads(SOURCE.read_text(encoding="utf-8"))[:3]
+    source = tmp_path / "TPO.json"
+    output = tmp_path / "TOP_generated.json"
+    duplicate = dict(items[2], id=items[0]["id"])
+    source.write_text(
+        json.dumps(items + [duplicate], ensure_ascii=False), encoding="utf-8"
+    )
+
+    report = parse_tpo_data(source, output, workers=1, batch_size=2)
+    assert report["duplicates"] == [str(items[0]["id"])]
+    # 位置按第一次出现，内容为最后出现的条目
+    assert output.read_text(encoding="utf-8") == _expected([duplicate] + items[1:])
+
+    report = parse_tpo_data(source, output, workers=1, batch_size=2)
+    assert report["written"] is False
+    assert report["unchanged"] == 3
+
+
+def test_stale_output_falls_back_to_full_rebuild(tmp_path):
+    items = json.loads(SOURCE.read_text(encoding="utf-8"))[:3]
+    source = tmp_path / "TPO.json"
+    output = tmp_path / "TOP_generated.json"
+    source.write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+    parse_tpo_data(source, output, workers=1)
+
+    # 输出文件被手工删掉一条，哈希记录仍认为它未变化
+    generated = json.loads(output.read_text(encoding="utf-8"))
+    output.write_text(json.dumps(generated[:1], ensure_ascii=False), encoding="utf-8")
+    items[0] = dict(items[0], instruction="**Changed** instruction")
+    source.write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+
+    report = parse_tpo_data(source, output, workers=1)
+    assert report["written"] is True
+    assert output.read_text(encoding="utf-8") == _expected(items)
+    assert not (tmp_path / "TOP_generated.json.tmp").exists()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按需性能分析测试：触发条件、视图函数和流式生成器的分析结果
+"""
+
+import pstats
+from types import SimpleNamespace
+
+import pytest
+
+import app as app_module
+import profiling
+
+
+@pytest.fixture
+def profiled(tmp_path, monkeypatch):
+    events = []
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+    monkeypatch.setattr(profiling, "PROFILE_DEBUG_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "log_event", lambda event, **kw: events.append((event, kw)))
+    return SimpleNamespace(dir=tmp_path, events=events)
+
+
+def _functions(path):
+    return {name for _, _, name in pstats.Stats(str(path)).stats}
+
+
+def test_profile_reason(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DEBUG_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0)
+    assert profiling.profile_reason("/question", "secret") == "header"
+    assert profiling.profile_reason("/question", "wrong") is None
+    assert profiling.profile_reason("/question", None) is None
+
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1)
+    assert profiling.profile_reason("/question", None) == "sampled"
+    monkeypatch.setattr(profiling, "PROFILE_ROUTES", ("/grade_and_polish",))
+    assert profiling.profile_reason("/question", "secret") is None
+    assert profiling.profile_reason("/grade_and_polish/abc", None) == "sampled"
+
+    monkeypatch.setattr(profiling, "PROFILE_DEBUG_TOKEN", "")
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0)
+    assert profiling.profile_reason("/grade_and_polish", "") is None
+
+
+def test_profile_view(profiled, monkeypatch):
+    monkeypatch.setattr(app_module, "new_request_id", lambda: "12" * 16)
+    client = app_module.app.test_client()
+    response = client.get("/question?question=44", headers={profiling.DEBUG_HEADER: "secret"})
+    assert response.headers["X-Profile-Id"] == "12" * 16
+
+    (path,) = profiled.dir.glob("*.pstats")
+    assert path.name.endswith("-" + "12" * 16 + ".pstats")
+    assert "get_question" in _functions(path)
+    ((_, fields),) = [e for e in profiled.events if e[0] == "profile.saved"]
+    assert fields["reason"] == "header" and fields["file"] == path.name
+    assert fields["top"] and fields["calls"] > 0
+
+    response = client.get("/question?question=44", headers={profiling.DEBUG_HEADER: "wrong"})
+    assert "X-Profile-Id" not in response.headers
+    assert len(list(profiled.dir.glob("*.pstats"))) == 1
+
+
+def test_profile_stream(profiled):
+    closed = []
+
+    def render_chunk(i):
+        return sum(range(20000)) + i
+
+    def stream():
+        try:
+            for i in range(5):
+                yield render_chunk(i)
+        finally:
+            closed.append(True)
+
+    def consumer_work():
+        return sum(range(20000))
+
+    profiler = profiling.RequestProfiler("34" * 16, "/grade_and_polish", "sampled")
+    wrapped = profiler.wrap(stream())
+    for i, _ in enumerate(wrapped):
+        consumer_work()  # 生成器之外（等待客户端）的时间不计入
+        if i == 2:
+            break
+    wrapped.close()
+    assert closed == [True]
+    path = profiler.finish()
+    assert profiler.finish() is None
+
+    functions = _functions(path)
+    assert "render_chunk" in functions
+    assert "consumer_work" not in functions
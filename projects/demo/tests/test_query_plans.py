@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试历史记录相关查询的执行计划：
+记录服务层实际发出的每条SELECT，用EXPLAIN QUERY PLAN检查不会全表扫描histories
+"""
+
+import re
+from contextlib import contextmanager
+from sqlalchemy import event
+
+from user_models import db
+from history_service import (
+    save_history,
+    update_history,
+    get_user_histories,
+    get_history_by_id,
+    delete_history,
+    search_histories,
+)
+from stats_service import get_user_stats
+from migrate_add_score import upgrade_existing_records
+
+# "SCAN histories" / "SCAN histories USING INDEX ..." 都表示扫描整张表或整个索引
+FULL_SCAN = re.compile(r"^SCAN histories(\s|$)")
+
+
+@contextmanager
+def captured_selects():
+    """记录期间执行的所有涉及histories表的SELECT语句"""
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and re.search(
+            r"\bhistories\b", statement
+        ):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", _record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _record)
+
+
+def explain(statement, parameters):
+    rows = (
+        db.session.connection()
+        .exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+        .fetchall()
+    )
+    return [row[-1] for row in rows]
+
+
+def test_history_queries_use_indexes(db_app, user):
+    """服务层的每条histories查询都走索引，排序不需要临时B树"""
+    with captured_selects() as statements:
+        _, _, first = save_history(
+            user_id=user.id, answer="first essay", question="44", score=3
+        )
+        save_history(
+            user_id=user.id,
+            answer="second essay",
+            question="44",
+            comment="SCORE:\n[4]",
+            polished_answer="",
+        )
+        get_user_histories(user.id, page=1, per_page=20)
+        get_history_by_id(first.global_id, user.id)
+        history = get_history_by_id(str(first.user_sequence), user.id)
+        update_history(history, comment="SCORE:\n[2]", score=2)
+        search_histories(user.id, "essay")
+        get_user_stats(user.id)
+        upgrade_existing_records()
+        delete_history(first.global_id, user.id)
+
+    assert statements, "没有记录到任何查询"
+    problems = []
+    for statement, parameters in statements:
+        for detail in explain(statement, parameters):
+            if FULL_SCAN.match(detail) or "TEMP B-TREE FOR ORDER BY" in detail:
+                problems.append(f"{detail}\n    {statement}")
+    assert not problems, "以下查询没有使用合适的索引:\n" + "\n".join(problems)
+
+
+def test_user_sequence_not_reused_after_delete(db_app, user):
+    """删除记录后新记录的user_sequence不会与已有记录重复"""
+    _, _, first = save_history(user_id=user.id, answer="a", question="44")
+    _, _, second = save_history(user_id=user.id, answer="b", question="44")
+    delete_history(first.global_id, user.id)
+
+    _, _, third = save_history(user_id=user.id, answer="c", question="44")
+    assert third.user_sequence == second.user_sequence + 1
+    assert get_history_by_id(str(second.user_sequence), user.id).global_id == (
+        second.global_id
+    )
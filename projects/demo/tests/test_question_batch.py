@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量获取题目接口测试：字段投影、缺失ID、与单题接口一致、ETag
+"""
+
+from app import app
+
+
+def test_batch_projection_and_missing():
+    client = app.test_client()
+    response = client.get(
+        "/question/batch?ids=45,44,missing,44&fields=instruction,professor"
+    )
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [q["id"] for q in data["questions"]] == ["45", "44"]
+    assert set(data["questions"][0]) == {"id", "instruction", "professor"}
+    assert data["missing"] == ["missing"]
+
+    etag = response.headers["ETag"]
+    cached = client.get(
+        "/question/batch?ids=45,44,missing,44&fields=instruction,professor",
+        headers={"If-None-Match": etag},
+    )
+    assert cached.status_code == 304
+
+
+def test_batch_matches_single_question():
+    client = app.test_client()
+    single = client.get("/question?question=44").get_json()
+    batch = client.get("/question/batch?ids=44").get_json()["questions"][0]
+    for key, value in single.items():
+        assert batch[key] == value
+    assert batch["markdown"] == client.get("/question/markdown?question=44").get_json()
+
+
+def test_batch_validation():
+    client = app.test_client()
+    assert client.get("/question/batch").status_code == 400
+    assert client.get("/question/batch?ids=44&fields=secret").status_code == 400
+    too_many = ",".join(str(i) for i in range(101))
+    assert client.get(f"/question/batch?ids={too_many}").status_code == 400
+
+
+def test_record_cache_is_bounded(monkeypatch):
+    import question_bank
+    from question_bank import QuestionBank
+
+    monkeypatch.setattr(question_bank, "RECORD_CACHE_SIZE", 2)
+    snapshot = QuestionBank().snapshot()
+    first, second, third = snapshot.sorted_valid_ids[:3]
+    record = snapshot.get_question_record(first)
+    snapshot.get_question_record(second)
+    snapshot.get_question_record(first)
+    snapshot.get_question_record(third)
+
+    # 最近访问过的first保留，second被淘汰
+    assert list(snapshot._records) == [first, third]
+    assert snapshot.get_question_record(first) is record
+    assert snapshot.get_question_record(second) == snapshot.get_question_record(second)
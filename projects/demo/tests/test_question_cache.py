@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题目接口HTTP条件缓存测试（ETag / If-None-Match）
+"""
+
+from app import app
+from question_bank import DEFAULT_BANK, get_question_bank
+
+
+def test_etag_and_not_modified():
+    """同一题库版本返回相同ETag，携带If-None-Match时返回304"""
+    client = app.test_client()
+    etag = f'"qb-{DEFAULT_BANK}-{get_question_bank().version}"'
+
+    for url in (
+        "/question?question=44",
+        "/question/markdown?question=44",
+        "/question/list?format=detailed",
+        "/question/statistics",
+    ):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.headers["ETag"] == etag
+        assert "max-age" in response.headers["Cache-Control"]
+
+        cached = client.get(url, headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.data == b""
+
+    # 旧版本的ETag不命中
+    stale = client.get("/question/statistics", headers={"If-None-Match": '"qb-old"'})
+    assert stale.status_code == 200
+    # 错误响应不带缓存头
+    missing = client.get("/question?question=does-not-exist")
+    assert missing.status_code == 404
+    assert "ETag" not in missing.headers
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题目列表测试：预先排序的索引、分页以及响应缓存的失效
+"""
+
+import json
+
+import pytest
+
+from question_bank import QuestionBank
+
+
+def _question(qid, valid=True):
+    return {
+        "id": qid,
+        "instruction": f"Instruction {qid} " + "x" * 120,
+        "teacher": "Doctor Diaz",
+        "teacher_content": "Teacher content" if valid else "",
+        "students": [{"name": "Claire", "content": "Student content"}],
+    }
+
+
+@pytest.fixture
+def bank_file(tmp_path):
+    path = tmp_path / "bank.json"
+    data = [_question(10), _question(2), _question(7, valid=False), _question(1)]
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return path
+
+
+def test_sorted_pagination(bank_file):
+    """按id数值排序，分页结果与总数正确"""
+    bank = QuestionBank(str(bank_file))
+
+    page, total = bank.get_question_list(only_valid=True, offset=1, limit=2)
+    assert total == 3
+    assert [q["id"] for q in page] == ["2", "10"]
+    assert page[0]["instruction"].endswith("...")
+    assert page[0]["student_count"] == 1
+
+    everything, total = bank.get_question_list(only_valid=False)
+    assert total == 4
+    assert [q["id"] for q in everything] == ["1", "2", "7", "10"]
+
+    # 返回的条目是副本，修改不影响后续请求
+    page[0]["id"] = "changed"
+    assert bank.get_question_list(offset=1, limit=1)[0][0]["id"] == "2"
+
+
+def test_response_cache_invalidated_on_reload(bank_file):
+    """缓存的响应在重新加载题库后失效"""
+    bank = QuestionBank(str(bank_file))
+
+    simple = bank.get_question_list_response(only_valid=True)
+    assert json.loads(simple) == {"files": ["1", "2", "10"]}
+    assert bank.get_question_list_response(only_valid=True) is simple
+
+    detailed = json.loads(
+        bank.get_question_list_response(offset=0, limit=1, format_type="detailed")
+    )
+    assert detailed["total"] == 3
+    assert detailed["limit"] == 1
+    assert [q["id"] for q in detailed["questions"]] == ["1"]
+
+    bank_file.write_text(json.dumps([_question(3)]), encoding="utf-8")
+    bank.reload()
+    assert json.loads(bank.get_question_list_response()) == {"files": ["3"]}
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Question紧凑表示测试：不可变、元组学生记录、名字intern、渲染结果缓存
+"""
+
+import dataclasses
+
+import pytest
+
+from question_bank import QuestionBank, Student
+
+
+def _item(qid):
+    return {
+        "id": qid,
+        "instruction": "Instruction",
+        "teacher": "Doctor " + "Diaz",
+        "teacher_content": "Teacher content",
+        "students": [
+            {"name": "Cla" + "ire", "content": "First"},
+            {"name": "Paul", "content": "Second"},
+        ],
+    }
+
+
+def test_compact_question():
+    first = QuestionBank._build_question(_item(1))
+    second = QuestionBank._build_question(_item(2))
+
+    assert first.students == (Student("Claire", "First"), Student("Paul", "Second"))
+    # 相同名字只保存一份
+    assert first.teacher is second.teacher
+    assert first.students[0].name is second.students[0].name
+    assert not hasattr(first, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        first.instruction = "changed"
+
+    assert first.to_dict()["students"][0] == {"name": "Claire", "content": "First"}
+
+
+def test_renderings_cached():
+    question = QuestionBank._build_question(_item(1))
+
+    markdown = question.to_markdown_string()
+    assert markdown is question.to_markdown_string()
+    assert "**Student 2 (Paul):** Second" in markdown
+
+    evaluator = question.to_evaluator_format()
+    assert evaluator["teacher"] == "**Professor (Doctor Diaz):** Teacher content"
+    assert evaluator["students"] == [
+        "**Student (Claire):** First",
+        "**Student (Paul):** Second",
+    ]
+    # 返回的列表是副本，修改不影响缓存
+    evaluator["students"].append("extra")
+    assert len(question.to_evaluator_format()["students"]) == 2
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多题库注册表测试：延迟加载、题目引用前缀、内存预算淘汰、接口的bank参数
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from app import app
+from model import Evaluator
+from question_bank import (
+    QuestionBankRegistry,
+    get_question_bank,
+    get_question_registry,
+)
+
+SOURCE = Path(__file__).resolve().parent.parent / "TOP_generated.json"
+
+
+def _bank_file(tmp_path, name, ids):
+    items = json.loads(SOURCE.read_text(encoding="utf-8"))
+    data = []
+    for qid, item in zip(ids, items):
+        data.append(dict(item, id=qid))
+    path = tmp_path / f"{name}.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return str(path)
+
+
+def test_lazy_load_and_refs(tmp_path):
+    registry = QuestionBankRegistry(
+        {"toefl": _bank_file(tmp_path, "toefl", [1, 2]), "ielts": str(SOURCE)},
+        default_bank="toefl",
+    )
+    assert registry.loaded() == []
+
+    assert registry.split_ref("44") == ("toefl", "44")
+    assert registry.split_ref("ielts:44") == ("ielts", "44")
+    # 前缀不是题库名时整个字符串视为题目id
+    assert registry.split_ref("unit:1") == ("toefl", "unit:1")
+
+    bank, question_id = registry.resolve("ielts:44")
+    assert question_id == "44"
+    assert bank.get_question("44") is not None
+    assert registry.loaded() == ["ielts"]
+
+    with pytest.raises(KeyError):
+        registry.get("missing")
+
+
+def test_evicts_least_recently_used(tmp_path):
+    banks = {name: _bank_file(tmp_path, name, range(1, 20)) for name in "abc"}
+    probe = QuestionBankRegistry(banks, default_bank="a")
+    one_bank = probe.get("a").snapshot().memory_usage()
+
+    registry = QuestionBankRegistry(
+        banks, default_bank="a", memory_budget=int(one_bank * 2.5)
+    )
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")  # a变为最近使用
+    registry.get("c")
+    assert registry.loaded() == ["a", "c"]
+    assert set(registry.memory_usage()) == {"a", "c"}
+
+    # 被淘汰的题库再次使用时重新加载
+    assert registry.get("b").get_question("1") is not None
+
+
+def test_routes_and_evaluator_accept_bank(tmp_path):
+    registry = get_question_registry()
+    registry.register("practice", _bank_file(tmp_path, "practice", [900]))
+    try:
+        client = app.test_client()
+        response = client.get("/question?question=practice:900")
+        assert response.status_code == 200
+        assert response.get_json()["id"] == "900"
+        assert "practice" in response.headers["ETag"]
+
+        assert client.get("/question?question=900&bank=practice").status_code == 200
+        assert client.get("/question?question=900").status_code == 404
+        listing = client.get("/question/list?bank=practice").get_json()
+        assert listing == {"files": ["900"]}
+        assert client.get("/question/list?bank=nope").status_code == 404
+
+        evaluator = Evaluator(question="practice:900")
+        assert evaluator.question_markdown
+        assert Evaluator(question="900", bank="practice").instruction
+    finally:
+        registry.evict("practice")
+
+
+def test_batch_accepts_bank_prefixed_ids(tmp_path):
+    registry = get_question_registry()
+    registry.register("practice", _bank_file(tmp_path, "practice", [900, 44]))
+    try:
+        client = app.test_client()
+        response = client.get(
+            "/question/batch?ids=44,practice:900,practice:1&fields=subject"
+        )
+        assert response.status_code == 200
+        data = response.get_json()
+        assert [q["id"] for q in data["questions"]] == ["44", "practice:900"]
+        assert data["missing"] == ["practice:1"]
+        # 被引用的其他题库版本也计入ETag
+        assert "practice" in response.headers["ETag"]
+        plain = client.get("/question/batch?ids=44&fields=subject")
+        assert plain.headers["ETag"] != response.headers["ETag"]
+    finally:
+        registry.evict("practice")
+
+
+def test_path_reuses_registered_bank():
+    registry = get_question_registry()
+    default = registry.get()
+    assert get_question_bank(str(SOURCE)) is default
+    assert get_question_bank("TOP_generated.json") is default
+    assert "TOP_generated" not in registry.names()
+
+
+def test_memory_usage_counts_caches(tmp_path):
+    bank = QuestionBankRegistry({"a": _bank_file(tmp_path, "a", range(1, 20))}).get("a")
+    snapshot = bank.snapshot()
+    before = snapshot.memory_usage()
+    assert before > snapshot.search_index.memory_usage() > 0
+    for question_id in snapshot.sorted_valid_ids:
+        snapshot.get_question_record(question_id)
+    snapshot.get_question_list_response(format_type="detailed")
+    assert snapshot.memory_usage() > before
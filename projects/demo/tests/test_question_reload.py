@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题库热更新测试：快照原子替换、加载失败保留旧快照、文件轮询
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+from question_bank import QuestionBank
+
+
+def _write_bank(path, ids):
+    data = [
+        {
+            "id": qid,
+            "instruction": f"Instruction {qid}",
+            "teacher": "Doctor Diaz",
+            "teacher_content": "Teacher content",
+            "students": [{"name": "Claire", "content": "Student content"}],
+        }
+        for qid in ids
+    ]
+    path.write_text(json.dumps(data), encoding="utf-8")
+
+
+def test_reload_swaps_snapshot(tmp_path):
+    """重新加载生成新快照，已取得的旧快照保持不变"""
+    path = tmp_path / "bank.json"
+    _write_bank(path, [1, 2])
+    bank = QuestionBank(str(path))
+    old = bank.snapshot()
+
+    _write_bank(path, [1, 2, 3])
+    new = bank.reload()
+
+    assert bank.snapshot() is new
+    assert new.version != old.version
+    assert old.get_statistics()["total"] == 2
+    assert new.get_statistics()["total"] == 3
+    assert old.get_question("3") is None
+    assert bank.get_question("3") is not None
+
+
+def test_failed_reload_keeps_snapshot(tmp_path):
+    """文件损坏时reload抛出异常，继续使用原快照"""
+    path = tmp_path / "bank.json"
+    _write_bank(path, [1])
+    bank = QuestionBank(str(path))
+    old = bank.snapshot()
+
+    path.write_text("[{", encoding="utf-8")
+    with pytest.raises(ValueError):
+        bank.reload()
+    assert bank.snapshot() is old
+
+
+def test_watcher_reloads_on_change(tmp_path):
+    """轮询线程发现文件变化后自动重新加载"""
+    path = tmp_path / "bank.json"
+    _write_bank(path, [1])
+    bank = QuestionBank(str(path))
+    bank.start_watcher(interval=0.05)
+    try:
+        _write_bank(path, [1, 2])
+        # 保证mtime变化（部分文件系统时间精度较低）
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        deadline = time.time() + 5
+        while time.time() < deadline and len(bank.questions) != 2:
+            time.sleep(0.05)
+        assert len(bank.questions) == 2
+    finally:
+        bank.stop_watcher()
+
+
+def test_watcher_skips_unchanged_broken_file(tmp_path, monkeypatch):
+    """加载失败后，文件没有再次变化时不重复解析"""
+    path = tmp_path / "bank.json"
+    _write_bank(path, [1])
+    bank = QuestionBank(str(path))
+    attempts = []
+    reload = bank.reload
+    monkeypatch.setattr(bank, "reload", lambda: attempts.append(1) or reload())
+
+    path.write_text("[{", encoding="utf-8")
+    bank.start_watcher(interval=0.02)
+    try:
+        time.sleep(0.3)
+        assert len(attempts) == 1
+
+        # 先写临时文件再替换，轮询线程不会看到写了一半或修改时间尚未调整的文件
+        tmp_file = tmp_path / "bank.json.tmp"
+        _write_bank(tmp_file, [1, 2])
+        stat = path.stat()
+        os.utime(tmp_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        os.replace(tmp_file, path)
+        deadline = time.time() + 5
+        while time.time() < deadline and len(bank.questions) != 2:
+            time.sleep(0.02)
+        assert len(bank.questions) == 2
+        assert len(attempts) == 2
+    finally:
+        bank.stop_watcher()
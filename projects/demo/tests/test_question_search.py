@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题目检索测试：倒排索引、过滤、前缀匹配和科目分面
+"""
+
+import json
+
+from app import app
+from question_bank import QuestionBank
+
+
+def _question(qid, subject, teacher, student, content):
+    return {
+        "id": qid,
+        "instruction": f"Your professor is teaching a class on {subject}. Write a post.",
+        "teacher": teacher,
+        "teacher_content": content,
+        "students": [{"name": student, "content": "I agree with the idea."}],
+    }
+
+
+def _bank(tmp_path):
+    path = tmp_path / "bank.json"
+    data = [
+        _question(1, "economics", "Doctor Diaz", "Claire", "Should taxes on sugar rise?"),
+        _question(2, "sociology", "Doctor Achebe", "Paul", "Do cities need more parks?"),
+        _question(3, "economics", "Doctor Achebe", "Andrew", "Are taxes on cars fair?"),
+    ]
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return QuestionBank(str(path))
+
+
+def test_keyword_filters_and_facets(tmp_path):
+    bank = _bank(tmp_path)
+    assert bank.questions["1"].subject == "economics"
+
+    result = bank.search("taxes")
+    assert [r["id"] for r in result["results"]] == ["1", "3"]
+    assert result["facets"]["subject"] == [{"value": "economics", "count": 2}]
+
+    # 最后一个词按前缀匹配
+    assert [r["id"] for r in bank.search("parks cit")["results"]] == ["2"]
+
+    # 分面统计不受科目过滤影响
+    result = bank.search(professor="doctor achebe", subject="economics")
+    assert [r["id"] for r in result["results"]] == ["3"]
+    assert {f["value"]: f["count"] for f in result["facets"]["subject"]} == {
+        "economics": 1,
+        "sociology": 1,
+    }
+
+    assert bank.search(student="claire")["total"] == 1
+    assert bank.search("nothing matches")["total"] == 0
+
+
+def test_browse_without_query(tmp_path):
+    """没有检索词时按题目顺序分页，过滤和分面与检索时一致"""
+    bank = _bank(tmp_path)
+    result = bank.search(offset=1, limit=1)
+    assert result["total"] == 3
+    assert [r["id"] for r in result["results"]] == ["2"]
+    assert result["results"][0]["score"] is None
+    assert {f["value"]: f["count"] for f in result["facets"]["subject"]} == {
+        "economics": 2,
+        "sociology": 1,
+    }
+
+    result = bank.search(subject="Economics")
+    assert [r["id"] for r in result["results"]] == ["1", "3"]
+    assert bank.search(professor="doctor achebe", student="paul")["total"] == 1
+    assert bank.search(subject="history")["total"] == 0
+
+
+def test_query_without_searchable_terms(tmp_path):
+    """检索词全是停用词或单字母时没有结果，而不是返回全部题目"""
+    bank = _bank(tmp_path)
+    for query in ("the", "a b", "the of"):
+        result = bank.search(query=query)
+        assert result["total"] == 0 and result["results"] == []
+    assert bank.search(query="   ")["total"] == 3  # 空白仍视为浏览
+
+
+def test_search_endpoint():
+    client = app.test_client()
+    response = client.get("/question/search?q=educ&limit=2")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert len(data["results"]) <= 2
+    assert data["total"] >= len(data["results"])
+    assert all(r["subject"] for r in data["results"])
+    assert "ETag" in response.headers
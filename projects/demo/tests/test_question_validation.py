@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题库入库校验测试：校验报告、隔离文件、写回规范化结果、基线检查以及预校验数据的加载
+"""
+
+import json
+
+import pytest
+
+from question_bank import QuestionBank
+from question_validation import validate_bank
+
+
+def _question(qid, **overrides):
+    item = {
+        "id": qid,
+        "instruction": f" Instruction {qid} ",
+        "teacher": "Doctor Diaz",
+        "teacher_content": "Teacher content",
+        "students": [{"name": " Claire ", "content": "Student content"}],
+    }
+    item.update(overrides)
+    return item
+
+
+@pytest.fixture
+def bank_file(tmp_path):
+    path = tmp_path / "bank.json"
+    data = [
+        _question(1),
+        _question(2, teacher_content=""),
+        _question(3, students=["**Student 1 (Paul):** Legacy answer"]),
+        _question(4, students=[{"name": "", "content": "No name"}]),
+    ]
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return path
+
+
+def test_report_and_quarantine(bank_file, tmp_path):
+    """报告列出无效题目和错误代码，隔离文件保存原始题目"""
+    report = validate_bank(str(bank_file))
+
+    assert (report["total"], report["valid"], report["invalid"]) == (4, 2, 2)
+    assert report["invalid_questions"] == [
+        {"id": "2", "errors": ["missing_teacher_content"]},
+        {"id": "4", "errors": ["no_valid_student"]},
+    ]
+    assert report["new_invalid"] == ["2", "4"]
+    assert report["written"] is False
+
+    saved = json.loads((tmp_path / "bank.validation.json").read_text(encoding="utf-8"))
+    assert saved["invalid"] == 2
+    quarantine = json.loads(
+        (tmp_path / "bank.quarantine.json").read_text(encoding="utf-8")
+    )
+    assert [entry["id"] for entry in quarantine] == ["2", "4"]
+    assert quarantine[0]["question"]["teacher_content"] == ""
+
+
+def test_baseline_only_reports_new_invalid(bank_file, tmp_path):
+    """基线中已有的无效题目不算作新问题（基线可以是id列表或之前的报告）"""
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(["2"]), encoding="utf-8")
+    assert validate_bank(str(bank_file), baseline_file=str(baseline))["new_invalid"] == [
+        "4"
+    ]
+
+    validate_bank(str(bank_file))
+    report = validate_bank(
+        str(bank_file), baseline_file=str(tmp_path / "bank.validation.json")
+    )
+    assert report["new_invalid"] == []
+
+
+def test_write_normalizes_bank(bank_file):
+    """写回后题库带is_valid字段，再次校验不会改写文件"""
+    report = validate_bank(str(bank_file), write=True)
+    assert report["written"] is True
+
+    data = json.loads(bank_file.read_text(encoding="utf-8"))
+    assert [item["is_valid"] for item in data] == [True, False, True, False]
+    assert data[0]["instruction"] == "Instruction 1"
+    assert data[0]["students"] == [{"name": "Claire", "content": "Student content"}]
+    assert data[2]["students"] == [{"name": "Paul", "content": "Legacy answer"}]
+
+    assert validate_bank(str(bank_file), write=True)["written"] is False
+
+
+def test_bank_trusts_prevalidated_items(bank_file):
+    """预校验数据直接使用is_valid；未校验的旧数据加载结果与校验后一致"""
+    legacy = QuestionBank(str(bank_file)).questions
+    validate_bank(str(bank_file), write=True)
+    prepared = QuestionBank(str(bank_file)).questions
+    assert legacy == prepared
+
+    question = QuestionBank._build_question(
+        {
+            "id": 9,
+            "instruction": "Instruction",
+            "teacher": "Doctor Diaz",
+            "teacher_content": "",
+            "students": [],
+            "is_valid": True,
+        }
+    )
+    assert question.is_valid is True
+
+
+def test_bank_tolerates_malformed_items(tmp_path):
+    """id为0的题目正常加载；字段缺失或类型错误的条目不影响其他题目"""
+    path = tmp_path / "bank.json"
+    data = [
+        dict(_question(0), is_valid=True),
+        # 带is_valid但缺少students：按旧数据重新校验，标记为无效
+        {"id": 1, "instruction": "Instruction", "is_valid": True},
+        # 无法解析的条目被跳过
+        {"id": 2, "instruction": 5, "is_valid": True},
+        "not a question",
+        _question(3),
+    ]
+    path.write_text(json.dumps(data), encoding="utf-8")
+
+    questions = QuestionBank(str(path)).questions
+    assert sorted(questions) == ["0", "1", "3"]
+    assert questions["0"].is_valid
+    assert not questions["1"].is_valid
+    assert questions["3"].is_valid
+
+
+def test_malformed_items_are_quarantined(bank_file, tmp_path):
+    """非对象或字段类型错误的条目标记为malformed并隔离，写回时原样保留"""
+    data = json.loads(bank_file.read_text(encoding="utf-8"))
+    data[1:1] = ["garbage", {"id": 5, "instruction": 5}, {"id": 6, "students": "x"}]
+    bank_file.write_text(json.dumps(data), encoding="utf-8")
+
+    report = validate_bank(str(bank_file), write=True)
+    assert (report["total"], report["invalid"]) == (7, 5)
+    assert report["invalid_questions"][:3] == [
+        {"id": "None", "errors": ["malformed"]},
+        {"id": "5", "errors": ["malformed"]},
+        {"id": "6", "errors": ["malformed"]},
+    ]
+    quarantine = json.loads(
+        (tmp_path / "bank.quarantine.json").read_text(encoding="utf-8")
+    )
+    assert quarantine[0]["question"] == "garbage"
+
+    written = json.loads(bank_file.read_text(encoding="utf-8"))
+    assert written[1:4] == data[1:4]
+    assert [item["is_valid"] for item in written[4:]] == [False, True, False]
+    assert sorted(QuestionBank(str(bank_file)).questions) == ["1", "2", "3", "4"]
+
+
+def test_failed_run_keeps_bank(bank_file, monkeypatch):
+    """校验中途出错时题库保持原样，不留下临时文件"""
+    import question_validation
+
+    original = bank_file.read_text(encoding="utf-8")
+    prepare = question_validation.prepare_question
+    calls = []
+
+    def failing_prepare(item):
+        calls.append(item)
+        if len(calls) == 3:
+            raise RuntimeError("boom")
+        return prepare(item)
+
+    monkeypatch.setattr(question_validation, "prepare_question", failing_prepare)
+
+    with pytest.raises(RuntimeError):
+        validate_bank(str(bank_file), write=True)
+    assert bank_file.read_text(encoding="utf-8") == original
+    assert not (bank_file.parent / "bank.json.tmp").exists()
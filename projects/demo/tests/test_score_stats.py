@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试评分统计汇总表的增量维护
+"""
+
+from datetime import datetime
+
+from flask import Flask
+
+from user_models import db, History, User, UserScoreStats
+from history_service import save_history, update_history, delete_history
+from stats_service import get_user_stats, check_stats, rebuild_stats
+
+
+def test_stats_follow_score_writes(db_app, user):
+    """保存、更新、删除评分后汇总表与全量计算一致"""
+    save_history(user_id=user.id, answer="a", question="44", score=3)
+    _, _, pending = save_history(
+        user_id=user.id, answer="b", question="44", comment="", polished_answer=""
+    )
+    save_history(user_id=user.id, answer="c", question="45", score=2)
+
+    stats = get_user_stats(user.id)
+    assert stats["summary"]["scored_count"] == 2
+    assert stats["summary"]["best_score"] == 3
+
+    # 流式评分完成后写入评分
+    update_history(pending, comment="SCORE:\n[5]", polished_answer="p", score=5)
+    stats = get_user_stats(user.id)
+    assert stats["summary"]["scored_count"] == 3
+    assert stats["summary"]["average_score"] == round(10 / 3, 2)
+    assert stats["summary"]["best_score"] == 5
+    question_44 = next(q for q in stats["questions"] if q["question"] == "44")
+    assert question_44 == {
+        "question": "44",
+        "scored_count": 2,
+        "average_score": 4.0,
+        "best_score": 5,
+    }
+    assert len(stats["weekly"]) == 1
+    assert stats["weekly"][0]["scored_count"] == 3
+
+    # 删除最高分后重新计算最高分
+    delete_history(pending.global_id, user.id)
+    stats = get_user_stats(user.id)
+    assert stats["summary"]["best_score"] == 3
+    question_44 = next(q for q in stats["questions"] if q["question"] == "44")
+    assert question_44["best_score"] == 3
+    assert check_stats() == []
+
+
+def test_rebuild_repairs_drift(db_app, user):
+    """绕过服务层写入的数据可以通过重建修复"""
+    save_history(user_id=user.id, answer="a", question="44", score=4)
+    db.session.add(
+        History(
+            user_id=user.id,
+            global_id="00000000-0000-0000-0000-000000000001",
+            user_sequence=2,
+            answer="b",
+            question="46",
+            score=1,
+            created_at=datetime(2024, 1, 3),
+        )
+    )
+    db.session.commit()
+
+    assert check_stats() != []
+    assert rebuild_stats() == 1
+    assert check_stats() == []
+    stats = get_user_stats(user.id, weeks=52)
+    assert stats["summary"]["scored_count"] == 2
+    assert [w["week_start"] for w in stats["weekly"]][0] == "2024-01-01"
+
+
+def test_stats_increment_existing_rows_in_place(db_app, user):
+    """汇总行已存在时直接累加，不会重复插入或覆盖其他会话的写入"""
+    save_history(user_id=user.id, answer="a", question="44", score=3)
+    # 模拟另一个进程在本会话读取之后写入的评分
+    db.session.execute(
+        UserScoreStats.__table__.update()
+        .where(UserScoreStats.user_id == user.id)
+        .values(
+            scored_count=UserScoreStats.scored_count + 1,
+            score_sum=UserScoreStats.score_sum + 4,
+        )
+    )
+    save_history(user_id=user.id, answer="b", question="45", score=2)
+    summary = get_user_stats(user.id)["summary"]
+    assert summary["scored_count"] == 3
+    assert summary["average_score"] == 3.0
+
+
+def test_clear_database_clears_stats(tmp_path):
+    """清空脚本删除历史记录时同时清空评分汇总表"""
+    from clear_database import clear_database
+
+    db_file = tmp_path / "app.db"
+    file_app = Flask(__name__)
+    file_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_file}"
+    db.init_app(file_app)
+    with file_app.app_context():
+        db.create_all()
+        owner = User(username="file", email="file@example.com")
+        owner.set_password("secret123")
+        db.session.add(owner)
+        db.session.commit()
+        owner_id = owner.id
+        save_history(user_id=owner_id, answer="a", question="44", score=4)
+        db.session.remove()
+
+        clear_database(str(db_file))
+        assert get_user_stats(owner_id)["summary"]["scored_count"] == 0
+        assert check_stats() == []
+        db.session.remove()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+遥测后台写入器测试：批量写入、flush、队列满时按优先级丢弃
+"""
+
+import json
+
+from telemetry import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    TelemetryWriter,
+    event_priority,
+)
+
+
+def _read(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_event_priority():
+    assert event_priority("api.request.start") == PRIORITY_LOW
+    assert event_priority("api.request.done") == PRIORITY_NORMAL
+    assert event_priority("llm.call.error") == PRIORITY_HIGH
+
+
+def test_writer_flush_and_close(tmp_path):
+    """flush后事件已写入文件；关闭时写完剩余事件"""
+    log_file = tmp_path / "telemetry.log"
+    writer = TelemetryWriter(log_file, max_batch_size=2, console=False)
+    for index in range(5):
+        writer.submit({"event": "test", "index": index})
+    assert writer.flush(timeout=5)
+    assert [e["index"] for e in _read(log_file)] == [0, 1, 2, 3, 4]
+
+    writer.submit({"event": "last", "value": {1, 2}})  # 不能序列化的值转为字符串
+    writer.close()
+    assert _read(log_file)[-1]["event"] == "last"
+    assert writer.submit({"event": "closed"}) is False
+    assert writer.stats()["written"] == 6
+
+
+def test_writer_drops_low_priority_first(tmp_path):
+    """队列满时先丢弃低优先级事件，并记录丢弃数量"""
+    log_file = tmp_path / "telemetry.log"
+    writer = TelemetryWriter(log_file, max_queue_size=3, console=False)
+    writer._thread = object()  # 不启动写线程，让事件留在队列中
+
+    assert writer.submit({"event": "a.start"}, PRIORITY_LOW)
+    assert writer.submit({"event": "b.done"}, PRIORITY_NORMAL)
+    assert writer.submit({"event": "c.done"}, PRIORITY_NORMAL)
+    assert writer.submit({"event": "d.error"}, PRIORITY_HIGH)  # 挤掉 a.start
+    assert writer.submit({"event": "e.start"}, PRIORITY_LOW) is False
+    assert writer.submit({"event": "f.error"}, PRIORITY_HIGH)  # 挤掉 b.done
+
+    queued = writer._pop_batch(10)
+    assert [p["event"] for _, p in queued] == ["c.done", "d.error", "f.error"]
+    stats = writer.stats()
+    assert stats["dropped"] == 3
+    assert stats["dropped_by_priority"] == {"low": 2, "normal": 1, "high": 0}
+
+
+def test_writer_restarts_after_fork(tmp_path):
+    """fork后的子进程丢弃父进程的队列，重新启动写线程"""
+    log_file = tmp_path / "telemetry.log"
+    writer = TelemetryWriter(log_file, console=False)
+    writer.submit({"event": "parent"})
+    assert writer.flush(timeout=5)
+    parent_thread = writer._thread
+
+    writer._reset_state()  # os.register_at_fork 在子进程中调用
+    assert writer.qsize() == 0 and writer._thread is None
+    writer.submit({"event": "child"})
+    assert writer.flush(timeout=5)
+    assert writer._thread is not parent_thread
+    writer.close()
+    assert [e["event"] for e in _read(log_file)] == ["parent", "child"]
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+遥测日志离线分析测试：分位数精度、请求关联（含跨分段和跨分块）以及报告内容
+"""
+
+import gzip
+import json
+import random
+
+from analyze_telemetry import LogHistogram, analyze, normalize_route
+
+
+def _request_events(rid, ts, route, rule, duration_ms, llm_ms, stream_s=0.0, error=False):
+    events = [
+        {"ts": ts, "event": "api.request.start", "request_id": rid, "route": route, "method": "POST"},
+        {"ts": ts + duration_ms / 1000, "event": "api.request.done", "request_id": rid,
+         "route": route, "rule": rule, "method": "POST", "status": 200, "duration_ms": duration_ms},
+    ]
+    if llm_ms is not None:
+        events.append({
+            "ts": ts + stream_s, "event": "llm.call.error" if error else "llm.call.success",
+            "request_id": rid, "llm_model": "mimo", "stage": "evaluate",
+            "llm_latency_ms": llm_ms, "ttft_ms": 100,
+        })
+    return events
+
+
+def _write(path, events):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+        f.write('{"ts": 1, "event": "api.request.do')  # 未写完的行被忽略
+
+
+def test_histogram_percentiles():
+    rng = random.Random(7)
+    values = sorted(rng.uniform(1, 5000) for _ in range(5000))
+    hist, other = LogHistogram(), LogHistogram()
+    for i, value in enumerate(values):
+        (hist if i % 2 else other).add(value)
+    hist.merge(other)
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * len(values)) - 1]
+        assert abs(hist.percentile(q) - exact) / exact < 0.02
+    assert LogHistogram().percentile(0.5) is None
+
+
+def test_normalize_route():
+    assert normalize_route("/history/550e8400e29b41d4a716446655440000") == "/history/<id>"
+    assert normalize_route("/question/12") == "/question/<id>"
+    assert normalize_route("/question/list") == "/question/list"
+
+
+def test_analyze_joins_requests(tmp_path):
+    base = 1_800_000_000.0
+    old = []
+    for i in range(100):
+        old += _request_events(f"a{i}", base + i, f"/question/{i}", None, 10 + i, None)
+    # 流式请求：done 事件在分段末尾，LLM 调用结束时已轮转到当前文件
+    current = _request_events("slow", base + 200, "/grade_and_polish", "/grade_and_polish", 5, None)
+    current = current[:2]
+    tail = _request_events("slow", base + 200, "/grade_and_polish", "/grade_and_polish", 5, 8000,
+                           stream_s=8.0, error=True)[2:]
+    for i in range(20):
+        tail += _request_events(f"b{i}", base + 300 + i, "/grade_and_polish",
+                                "/grade_and_polish", 20, 1000 + i, stream_s=1.0)
+    segment = tmp_path / "telemetry-1.log.gz"
+    active = tmp_path / "telemetry.log"
+    _write(segment, old + current)
+    _write(active, tail)
+
+    # 按较小的分块切分当前文件，结果应与整体处理一致
+    reports = [
+        analyze([segment, active], workers=1),
+        analyze([segment, active], workers=2, chunk_bytes=2048),
+    ]
+    assert reports[1]["chunks"] > 2
+    for report in reports:
+        assert report["requests"] == 121
+        routes = {r["route"]: r for r in report["routes"]}
+        assert routes["POST /question/<id>"]["count"] == 100
+        assert abs(routes["POST /question/<id>"]["p50_ms"] - 59) <= 2
+        grade = routes["POST /grade_and_polish"]
+        assert grade["count"] == 21 and grade["errors"] == 1
+        assert abs(grade["p50_ms"] - 1000) <= 20  # 流式请求按最后一个事件计算
+
+        (llm,) = report["llm"]
+        assert (llm["model"], llm["stage"], llm["count"], llm["errors"]) == ("mimo", "evaluate", 21, 1)
+        assert llm["ttft_p50_ms"] is not None
+
+        slowest = report["slowest"][0]
+        assert slowest["request_id"] == "slow"
+        assert slowest["llm_calls"] == 1 and slowest["error"] and slowest["status"] == 200
+        assert abs(slowest["total_ms"] - 8000) < 1
+
+    since_report = analyze([segment, active], since=base + 250, workers=1)
+    assert since_report["requests"] == 20
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+遥测策略测试：事件级别、按请求采样、路由过滤以及请求上下文的记录
+"""
+
+import threading
+import time
+
+import pytest
+
+import app as app_module
+from telemetry import TelemetryPolicy
+
+
+@pytest.fixture
+def policy():
+    policy = TelemetryPolicy()
+    policy.configure(
+        min_level="info", event_levels={}, sample_rates={}, route_allow=[], route_deny=["/health"]
+    )
+    return policy
+
+
+def test_levels(policy):
+    assert policy.should_log("api.request.start")
+    policy.configure(event_levels={"api.request.*": "debug", "api.request.done": "info"})
+    assert not policy.should_log("api.request.start")
+    assert policy.should_log("api.request.done")  # 精确匹配优先
+    policy.configure(min_level="error")
+    assert not policy.should_log("llm.call.success")
+    assert policy.should_log("llm.call.error")
+
+
+def test_sampling_by_request(policy):
+    """同一请求的事件一起保留或丢弃，错误事件不受通配符采样影响"""
+    policy.configure(sample_rates={"api.request.*": 0.3})
+    request_ids = [f"{i:032x}" for i in range(2000)]
+    kept = [rid for rid in request_ids if policy.should_log("api.request.start", rid)]
+    assert 450 < len(kept) < 750
+    assert all(policy.should_log("api.request.done", rid) for rid in kept)
+    assert all(policy.should_log("api.request.error", rid) for rid in request_ids)
+    assert policy.snapshot()["sampled_out"] == len(request_ids) - len(kept)
+
+    policy.configure(sample_rates={"llm.call.success": 0})
+    assert not policy.should_log("llm.call.success", "abc")
+    assert policy.should_log("api.request.start", "abc")
+
+
+def test_configure_during_resolve(policy, monkeypatch):
+    """解析事件时另一个线程修改配置，旧配置的结果不会留在缓存中"""
+    lookup = TelemetryPolicy._lookup
+    started = []
+
+    def slow_lookup(mapping, event):
+        if not started:
+            started.append(threading.Thread(target=policy.configure, kwargs={
+                "min_level": "warning", "event_levels": {"demo.event": "error"},
+            }))
+            started[0].start()
+            time.sleep(0.05)
+        return lookup(mapping, event)
+
+    monkeypatch.setattr(policy, "_lookup", slow_lookup)
+    policy.should_log("demo.event")
+    started[0].join()
+    assert policy.should_log("demo.event")
+
+
+def test_routes_and_invalid_config(policy):
+    assert not policy.route_enabled("/health")
+    assert policy.route_enabled("/question/list")
+    policy.configure(route_allow=["/grade_and_polish"])
+    assert not policy.route_enabled("/question/list")
+    assert policy.route_enabled("/grade_and_polish/abc")
+
+    with pytest.raises(ValueError):
+        policy.configure(min_level="debug", sample_rates={"x": 2})
+    with pytest.raises(ValueError):
+        policy.configure(event_levels={"x": "verbose"})
+    with pytest.raises(ValueError):
+        policy.configure(route_deny="/health")
+    assert policy.snapshot()["min_level"] == "info"  # 校验失败时不部分生效
+
+
+def test_request_events(monkeypatch):
+    """健康检查不记录请求事件；题目参数只解析一次并写入完成事件"""
+    events = []
+    monkeypatch.setattr(app_module, "log_event", lambda event, **kw: events.append((event, kw)))
+    client = app_module.app.test_client()
+
+    client.get("/health")
+    assert events == []
+
+    client.get("/question?question=44")
+    assert [event for event, _ in events] == ["api.request.start", "api.request.done"]
+    assert events[1][1]["question"] == "44"
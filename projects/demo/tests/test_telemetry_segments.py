@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+遥测日志分段测试：按大小/时间轮转为压缩分段、清单、过滤读取和tail模式
+"""
+
+import gzip
+import json
+
+import pytest
+
+import app as app_module
+from telemetry import TelemetryWriter
+from telemetry_segments import parse_time
+
+
+def _fill(writer, count, start=1000.0, **fields):
+    for index in range(count):
+        writer.submit(
+            {
+                "ts": start + index,
+                "event": "api.request.done" if index % 2 else "llm.call.start",
+                "request_id": f"r{index}",
+                **fields,
+            }
+        )
+        writer.flush(timeout=5)  # 每条单独成批，轮转点确定
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = TelemetryWriter(
+        tmp_path / "telemetry.log", rotate_bytes=400, max_segments=3, console=False
+    )
+    yield writer
+    writer.close()
+
+
+def _events(lines):
+    return [json.loads(line) for line in lines]
+
+
+def test_rotation_and_manifest(writer):
+    """超过大小上限后压缩为分段，清单记录时间范围，超过保留数量删除旧分段"""
+    _fill(writer, 30)
+    segments = writer.segments.segments()
+    assert len(segments) == 3
+    files = sorted(p.name for p in writer.segments.directory.glob("*.log.gz"))
+    assert files == sorted(s["file"] for s in segments)
+
+    first = segments[0]
+    with gzip.open(writer.segments.directory / first["file"], "rt") as f:
+        stored = _events(f)
+    assert len(stored) == first["events"]
+    assert stored[0]["ts"] == first["start_ts"]
+    assert stored[-1]["ts"] == first["end_ts"]
+    # 分段和当前文件首尾相接
+    assert segments[1]["start_ts"] == first["end_ts"] + 1
+    current = _events(writer.log_file.read_text(encoding="utf-8").splitlines())
+    assert current[0]["ts"] == segments[-1]["end_ts"] + 1
+    assert current[-1]["ts"] == 1029
+
+
+def test_time_based_rotation(tmp_path):
+    writer = TelemetryWriter(tmp_path / "telemetry.log", rotate_seconds=10, console=False)
+    _fill(writer, 25)
+    writer.close()
+    assert [s["events"] for s in writer.segments.segments()] == [10, 10]
+
+
+def test_filtered_reads(writer):
+    """按时间范围、事件名、request_id过滤，tail只返回最后N条"""
+    _fill(writer, 30)
+    kept = [e["ts"] for e in _events(writer.segments.iter_lines())]
+    assert kept == sorted(kept) and kept[-1] == 1029
+
+    window = _events(writer.segments.iter_lines(since=1020, until=1024))
+    assert [e["ts"] for e in window] == [1020, 1021, 1022, 1023, 1024]
+
+    done = _events(writer.segments.iter_lines(since=1020, events=["api.request"]))
+    assert {e["event"] for e in done} == {"api.request.done"}
+    assert len(done) == 5
+
+    single = _events(writer.segments.iter_lines(request_id="r2"))
+    assert [e["ts"] for e in single] == []  # r2 所在的分段已被清理
+    single = _events(writer.segments.iter_lines(request_id="r27"))
+    assert [e["ts"] for e in single] == [1027]
+
+    tail = _events(writer.segments.iter_lines(tail=4))
+    assert [e["ts"] for e in tail] == [1026, 1027, 1028, 1029]
+    tail = _events(writer.segments.iter_lines(tail=2, events=["llm.call.start"]))
+    assert [e["ts"] for e in tail] == [1026, 1028]
+
+
+def test_parse_time():
+    assert parse_time(None) is None
+    assert parse_time("1700000000") == 1700000000.0
+    assert parse_time("1h", now=10000) == 6400
+    assert parse_time("30m", now=10000) == 8200
+    assert parse_time("2024-01-01T00:00:00Z") == 1704067200.0
+    with pytest.raises(ValueError):
+        parse_time("yesterday")
+
+
+def test_download_endpoint(writer, monkeypatch):
+    """下载接口流式返回过滤后的事件，参数错误时返回400"""
+    _fill(writer, 12)
+    monkeypatch.setattr(app_module, "get_telemetry_writer", lambda: writer)
+    client = app_module.app.test_client()
+
+    response = client.get("/logs/telemetry?since=1005&until=1008&event=api.request")
+    assert response.status_code == 200
+    assert [e["ts"] for e in _events(response.data.decode().splitlines())] == [
+        1005,
+        1007,
+    ]
+    response = client.get("/logs/telemetry?tail=3")
+    assert len(response.data.decode().splitlines()) == 3
+
+    assert client.get("/logs/telemetry?since=someday").status_code == 400
+    assert client.get("/logs/telemetry?tail=0").status_code == 400
+
+
+def test_processes_share_rotation(tmp_path):
+    """多个进程写同一个文件：只有一个进程轮转，其他进程发现文件被替换后重新打开"""
+    log_file = tmp_path / "telemetry.log"
+    writers = [
+        TelemetryWriter(log_file, rotate_bytes=2000, max_segments=100, console=False)
+        for _ in range(2)
+    ]
+    try:
+        for index in range(120):
+            writer = writers[index % 2]
+            writer.submit({"ts": 1000.0 + index, "event": "e", "index": index})
+            writer.flush(timeout=5)
+    finally:
+        for writer in writers:
+            writer.close()
+
+    store = writers[0].segments
+    segments = store.segments()
+    assert len(segments) >= 2
+    assert segments[0]["end_ts"] < segments[1]["start_ts"]
+    indexes = sorted(event["index"] for event in _events(store.iter_lines()))
+    assert indexes == list(range(120))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试历史记录文本字段的压缩存储
+"""
+
+from pathlib import Path
+from sqlalchemy import select
+
+from user_models import db, History
+from history_service import save_history, search_histories
+from text_compression import compress_text, decompress_value, is_compressed
+
+ESSAY = (Path(__file__).parent.parent / "test_essay.txt").read_text(encoding="utf-8")
+
+
+def _stored(history_id, column):
+    table = History.__table__
+    return db.session.execute(
+        select(table.c[column]).where(table.c.id == history_id)
+    ).scalar()
+
+
+def test_round_trip_formats():
+    """二进制与base85两种存储格式都能还原，短文本保持明文"""
+    for binary in (True, False):
+        stored = compress_text(ESSAY, mode="zlib", binary=binary)
+        assert is_compressed(stored)
+        assert len(stored) < len(ESSAY.encode("utf-8"))
+        assert decompress_value(stored) == ESSAY
+    assert compress_text("short", mode="zlib") == "short"
+    assert compress_text(ESSAY, mode="none") == ESSAY
+
+
+def test_history_columns_compressed_and_lazy(db_app, user, monkeypatch):
+    """开启压缩后存储值为压缩格式，属性访问时才解压，检索与过滤不受影响"""
+    monkeypatch.setenv("HISTORY_TEXT_COMPRESSION", "zlib")
+    _, _, history = save_history(
+        user_id=user.id, answer=ESSAY, question="44", comment="", polished_answer=""
+    )
+    history_id = history.id
+    assert is_compressed(_stored(history_id, "answer"))
+    assert _stored(history_id, "comment") == ""
+
+    db.session.expire_all()
+    loaded = db.session.get(History, history_id)
+    assert is_compressed(loaded._answer)
+    assert loaded.answer == ESSAY
+    assert History.query.filter(History.comment == "").count() == 1
+    assert search_histories(user.id, "technology")["pagination"]["total"] == 1
+
+    # 关闭压缩后旧数据仍可读取
+    monkeypatch.setenv("HISTORY_TEXT_COMPRESSION", "none")
+    db.session.expire_all()
+    assert db.session.get(History, history_id).to_dict()["answer"] == ESSAY
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+token用量统计测试：调用用量采集、汇总表累加、费用估算以及管理员权限
+"""
+
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from flask import jsonify
+from flask_jwt_extended import JWTManager
+
+import model
+from auth import admin_required, create_tokens
+from user_models import db, User
+from usage_service import estimate_cost, get_usage_summary, load_pricing, record_usage
+
+
+def _usage(prompt, completion):
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion)
+
+
+def test_call_llm_reports_usage(monkeypatch):
+    """非流式从响应读取usage，流式请求include_usage并从最后一个块读取"""
+    reported, requests = [], []
+    monkeypatch.setattr(model, "_usage_listeners", [lambda *args: reported.append(args)])
+    monkeypatch.setattr(model, "log_event", lambda *args, **kwargs: None)
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        if not kwargs["stream"]:
+            return SimpleNamespace(usage=_usage(120, 30))
+        delta = SimpleNamespace(delta=SimpleNamespace(content="Hi"))
+        return iter(
+            [
+                SimpleNamespace(choices=[delta], usage=None),
+                SimpleNamespace(choices=[], usage=_usage(200, 2)),
+            ]
+        )
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    model._call_llm(client, "m1", [], stream=False, stage="evaluate")
+    list(model._call_llm(client, "m1", [], stream=True, stage="polish"))
+
+    assert reported == [("m1", "evaluate", 120, 30), ("m1", "polish", 200, 2)]
+    assert "stream_options" not in requests[0]
+    assert requests[1]["stream_options"] == {"include_usage": True}
+
+
+def test_rollup_and_cost(db_app, user, monkeypatch):
+    monkeypatch.setenv("LLM_PRICING", "m1=1:2, bad=x")
+    day = date(2026, 10, 1)
+    record_usage(user.id, "44", "m1", "evaluate", 1000, 200, day=day)
+    record_usage(user.id, "44", "m1", "evaluate", 500, 100, day=day)
+    record_usage(user.id, "45", "m1", "polish", 800, 400, day=day)
+    record_usage(None, "44", "m2", "evaluate", 100, 10, day=date(2026, 10, 2))
+    db.session.commit()
+
+    assert load_pricing() == {"m1": (1.0, 2.0)}
+    assert estimate_cost("m1", 1_000_000, 500_000) == 2.0
+    assert estimate_cost("m2", 10, 10) is None
+
+    summary = get_usage_summary(group_by=("question",))
+    assert [(r["question"], r["calls"], r["total_tokens"]) for r in summary["rows"]] == [
+        ("44", 3, 1910),
+        ("45", 1, 1200),
+    ]
+    assert summary["rows"][0]["cost"] == round((1500 * 1 + 300 * 2) / 1_000_000, 6)
+    assert summary["totals"]["calls"] == 4
+
+    by_user = get_usage_summary(group_by=("user", "stage"), until=date(2026, 10, 1))
+    assert {(r["username"], r["stage"], r["prompt_tokens"]) for r in by_user["rows"]} == {
+        ("tester", "evaluate", 1500),
+        ("tester", "polish", 800),
+    }
+    anonymous = get_usage_summary(group_by=("model",), user_id=0)
+    assert [(r["model"], r["cost"]) for r in anonymous["rows"]] == [("m2", None)]
+
+
+@pytest.fixture
+def admin_client(db_app, user, monkeypatch):
+    db_app.config["JWT_SECRET_KEY"] = "test-secret-key-for-admin-required-check"
+    JWTManager(db_app)
+
+    @db_app.route("/admin/ping")
+    @admin_required
+    def ping():
+        return jsonify({"ok": True})
+
+    monkeypatch.setenv("ADMIN_USERNAMES", "root, boss")
+    boss = User(username="boss", email="boss@example.com")
+    boss.set_password("secret123")
+    db.session.add(boss)
+    db.session.commit()
+    return db_app.test_client(), user, boss
+
+
+def test_admin_required(admin_client):
+    client, user, boss = admin_client
+    assert client.get("/admin/ping").status_code == 401
+    for account, status in ((user, 403), (boss, 200)):
+        token = create_tokens(account)["access_token"]
+        response = client.get(
+            "/admin/ping", headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == status
+
+
+def test_admin_required_without_config(admin_client, monkeypatch):
+    """未配置ADMIN_USERNAMES时没有管理员（不默认信任名为admin的账号）"""
+    client, _, _ = admin_client
+    monkeypatch.delenv("ADMIN_USERNAMES")
+    admin = User(username="admin", email="admin@example.com")
+    admin.set_password("secret123")
+    db.session.add(admin)
+    db.session.commit()
+    token = create_tokens(admin)["access_token"]
+    response = client.get("/admin/ping", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
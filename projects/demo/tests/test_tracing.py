@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+链路追踪测试：嵌套span、OTLP导出、LLM流式调用的分段、请求根span以及瀑布图
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import app as app_module
+import model
+import tracing
+
+
+class _Collector:
+    """代替写入器，收集导出的OTLP数据"""
+
+    def __init__(self):
+        self.exported = []
+
+    def submit(self, payload):
+        self.exported.append(payload)
+
+    def spans(self):
+        return [
+            s
+            for payload in self.exported
+            for s in payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        ]
+
+    def flush(self, timeout=None):
+        return True
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    collector = _Collector()
+    monkeypatch.setattr(tracing, "_tracer", tracing.Tracer(enabled=True, writer=collector))
+    return collector
+
+
+def test_nested_spans_export(collector):
+    @tracing.traced("work")
+    def work():
+        with tracing.span("inner", step=1) as inner:
+            inner.set_attribute("ok", True)
+        raise ValueError("boom")
+
+    with tracing.span("root", parent=None) as root:
+        with pytest.raises(ValueError):
+            work()
+        assert collector.exported == []  # 根span结束前不导出
+
+    (payload,) = collector.exported
+    assert payload["ts"] == int(collector.spans()[-1]["endTimeUnixNano"]) / 1e9
+    spans = {s["name"]: s for s in collector.spans()}
+    assert set(spans) == {"root", "work", "inner"}
+    assert spans["inner"]["parentSpanId"] == spans["work"]["spanId"]
+    assert spans["work"]["parentSpanId"] == root.span_id
+    assert "parentSpanId" not in spans["root"]
+    assert {s["traceId"] for s in spans.values()} == {root.trace_id}
+    assert spans["work"]["status"] == {"code": tracing.STATUS_ERROR, "message": "boom"}
+    assert spans["work"]["events"][0]["name"] == "exception"
+    assert {a["key"]: a["value"] for a in spans["inner"]["attributes"]} == {
+        "step": {"intValue": "1"},
+        "ok": {"boolValue": True},
+    }
+    assert int(spans["root"]["endTimeUnixNano"]) >= int(spans["work"]["endTimeUnixNano"])
+    assert tracing.current_span() is None
+
+
+def test_llm_stream_spans(collector, monkeypatch):
+    monkeypatch.setattr(model, "log_event", lambda event, **kw: None)
+
+    def stream():
+        for content in (None, "Hello", " world"):
+            time.sleep(0.01)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+    client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kw: stream()))
+    )
+    with tracing.span("root", parent=None):
+        chunks = model._call_llm(client, "test-model", [], stream=True, stage="polish")
+    # 生成器在根span的with之外消费，span仍挂在调用时的父span下
+    assert len(list(chunks)) == 3
+
+    spans = {s["name"]: s for s in collector.spans()}
+    assert spans["llm.call"]["parentSpanId"] == spans["root"]["spanId"]
+    assert spans["llm.ttft"]["parentSpanId"] == spans["llm.call"]["spanId"]
+    assert spans["llm.stream"]["parentSpanId"] == spans["llm.call"]["spanId"]
+    assert spans["llm.ttft"]["startTimeUnixNano"] == spans["llm.call"]["startTimeUnixNano"]
+    assert spans["llm.ttft"]["endTimeUnixNano"] <= spans["llm.stream"]["startTimeUnixNano"]
+    attributes = {a["key"]: a["value"] for a in spans["llm.call"]["attributes"]}
+    assert attributes["llm.stage"] == {"stringValue": "polish"}
+    assert attributes["chunks"] == {"intValue": "3"}
+
+
+def test_request_root_span(collector, monkeypatch):
+    monkeypatch.setattr(app_module, "new_request_id", lambda: "ab" * 16)
+    response = app_module.app.test_client().get("/question?question=44")
+    assert response.status_code in (200, 404)
+
+    (root,) = [s for s in collector.spans() if s["name"] == "http.request"]
+    assert root["traceId"] == "ab" * 16
+    assert root["kind"] == tracing.KIND_SERVER
+    attributes = {a["key"]: a["value"] for a in root["attributes"]}
+    assert attributes["http.route"] == {"stringValue": "/question"}
+    assert attributes["http.status_code"] == {"intValue": str(response.status_code)}
+
+    app_module.app.test_client().get("/health")  # 不记录的路由没有span
+    assert len([s for s in collector.spans() if s["name"] == "http.request"]) == 1
+
+
+def test_load_and_render(tmp_path, monkeypatch):
+    log_file = tmp_path / "traces.log"
+    tracer = tracing.Tracer(log_file, enabled=True)
+    monkeypatch.setattr(tracing, "_tracer", tracer)
+
+    with tracing.span("http.request", parent=None, trace_id="cd" * 16):
+        with tracing.span("llm.call"):
+            time.sleep(0.01)
+        with tracing.span("history.save"):
+            pass
+    with tracing.span("other", parent=None):
+        pass
+    tracer.flush(timeout=5)
+    tracer.writer.close()
+
+    spans = tracing.load_trace("cd" * 16, log_file)
+    assert [s["name"] for s in spans] == ["http.request", "llm.call", "history.save"]
+    assert spans[1]["duration_ms"] >= 10
+
+    lines = tracing.render_waterfall(spans, width=20).splitlines()
+    assert lines[0].startswith("trace " + "cd" * 16)
+    assert lines[1].startswith("http.request")
+    assert lines[2].startswith("  llm.call")
+    assert "█" in lines[2]
+    assert tracing.load_trace("ef" * 16, log_file) == []
+    # 时间范围外导出的trace不读取
+    assert tracing.load_trace("cd" * 16, log_file, since=time.time() + 60) == []
+    assert len(tracing.load_trace("cd" * 16, log_file, since=time.time() - 60)) == 3
+
+
+def test_tracer_resets_after_fork(collector):
+    """fork后的子进程不继承父进程未结束的trace"""
+    tracer = tracing.get_tracer()
+    root = tracing.start_span("http.request", parent=None)
+    with tracing.span("child", parent=root):
+        pass
+    assert tracer._pending
+
+    tracer._reset_state()  # os.register_at_fork 在子进程中调用
+    assert not tracer._pending and not tracer._finished
+    with tracing.span("worker", parent=None):
+        pass
+    assert [s["name"] for s in collector.spans()] == ["worker"]
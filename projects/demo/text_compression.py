@@ -0,0 +1,245 @@
+"""
+历史记录大文本字段压缩模块
+
+answer / comment / polished_answer 可选压缩存储（环境变量 HISTORY_TEXT_COMPRESSION）：
+- none（默认）：明文存储
+- zlib：zlib + 预置字典（字典根据评语格式和示例评语训练，见 train_dictionary）
+- zstd：zstd + 同一份字典（需要安装 zstandard，未安装时退化为 zlib）
+
+存储格式：MAGIC + 编码(1字节) + 字典版本(1字节) + 压缩数据
+- SQLite 直接存二进制（TEXT列可以存BLOB值）
+- 其他数据库存 MAGIC + base85 文本，保持列类型不变
+短文本和已有明文数据保持原样，读取时按前缀识别，因此可以随时开关压缩。
+
+读取时不解压：CompressedText 返回存储形态，由 LazyText 描述符在访问属性时解压并缓存。
+"""
+
+import base64
+import os
+import re
+import sys
+import zlib
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+from sqlalchemy.types import Text, TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # zstd为可选依赖
+    zstandard = None
+
+DICT_DIR = Path(__file__).parent / "compression"
+DICT_VERSION = 1  # 新训练的字典需要递增版本号，旧版本字典文件必须保留
+DICT_SIZE = 16 * 1024
+
+MAGIC = b"\x01"
+TEXT_MAGIC = "\x01"
+CODEC_ZLIB = b"z"
+CODEC_ZSTD = b"s"
+
+# 小于该长度的文本不压缩（压缩收益小，也便于与空字符串等字面量比较）
+MIN_COMPRESS_LENGTH = 256
+
+# 评语固定结构，放在字典末尾（zlib优先匹配距离最近的内容）
+FORMAT_SKELETON = (
+    "STRENGTHS:\n\n1. \n\n2. \n\n3. \n\nEND\n\n"
+    "WEAKNESSES:\n\n1. \n\n2. \n\nEND\n\n"
+    "OPPORTUNITIES:\n\n1. \n\n2. \n\nEND\n\n"
+    "OVERVIEW:\n\nThis response earned a score of \n\nEND\n\n"
+    "SCORE:\n["
+)
+
+
+def get_compression_mode():
+    """当前配置的压缩模式：none / zlib / zstd"""
+    mode = os.getenv("HISTORY_TEXT_COMPRESSION", "none").lower()
+    if mode == "zstd" and zstandard is None:
+        return "zlib"
+    return mode if mode in ("zlib", "zstd") else "none"
+
+
+@lru_cache(maxsize=None)
+def load_dictionary(version=DICT_VERSION):
+    """读取指定版本的压缩字典"""
+    return (DICT_DIR / f"history_v{version}.dict").read_bytes()
+
+
+@lru_cache(maxsize=None)
+def _zstd_dictionary(version):
+    return zstandard.ZstdCompressionDict(
+        load_dictionary(version), dict_type=zstandard.DICT_TYPE_RAWCONTENT
+    )
+
+
+def is_compressed(value):
+    """判断存储值是否为压缩格式"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value[:1]) == MAGIC
+    return isinstance(value, str) and value.startswith(TEXT_MAGIC)
+
+
+def compress_text(value, mode=None, binary=True):
+    """
+    按模式压缩文本，返回存储值（不需要压缩时原样返回）
+    Args:
+        value: 明文
+        mode: 压缩模式，默认读取配置
+        binary: True返回bytes（SQLite），False返回base85文本
+    """
+    mode = mode or get_compression_mode()
+    if mode == "none" or value is None or len(value) < MIN_COMPRESS_LENGTH:
+        return value
+
+    data = value.encode("utf-8")
+    zdict = load_dictionary(DICT_VERSION)
+    if mode == "zstd":
+        codec = CODEC_ZSTD
+        payload = zstandard.ZstdCompressor(
+            level=10, dict_data=_zstd_dictionary(DICT_VERSION)
+        ).compress(data)
+    else:
+        codec = CODEC_ZLIB
+        compressor = zlib.compressobj(level=9, wbits=-15, zdict=zdict)
+        payload = compressor.compress(data) + compressor.flush()
+
+    body = codec + bytes([DICT_VERSION]) + payload
+    if len(body) + 1 >= len(data):
+        return value  # 压缩无收益
+    if binary:
+        return MAGIC + body
+    return TEXT_MAGIC + base64.b85encode(body).decode("ascii")
+
+
+def decompress_value(value):
+    """把存储值还原为明文（明文数据原样返回）"""
+    if not is_compressed(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return bytes(value).decode("utf-8")
+        return value
+
+    if isinstance(value, str):
+        body = base64.b85decode(value[len(TEXT_MAGIC) :])
+    else:
+        body = bytes(value)[len(MAGIC) :]
+    codec, version, payload = body[:1], body[1], body[2:]
+
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("读取zstd压缩数据需要安装 zstandard")
+        data = zstandard.ZstdDecompressor(
+            dict_data=_zstd_dictionary(version)
+        ).decompress(payload)
+    else:
+        decompressor = zlib.decompressobj(wbits=-15, zdict=load_dictionary(version))
+        data = decompressor.decompress(payload) + decompressor.flush()
+    return data.decode("utf-8")
+
+
+class CompressedText(TypeDecorator):
+    """
+    可压缩的文本列：写入时按配置压缩，读取时保持存储形态（由LazyText惰性解压）
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or is_compressed(value):
+            return value
+        return compress_text(value, binary=dialect.name == "sqlite")
+
+    def process_result_value(self, value, dialect):
+        return value
+
+    def coerce_compared_value(self, op, value):
+        # 查询条件中的字面量（如 comment != ''、LIKE模式）按普通文本处理，不压缩
+        return Text()
+
+
+class LazyText:
+    """
+    属性描述符：访问时才解压对应的存储列，并按存储值缓存解压结果
+    配合 sqlalchemy.orm.synonym 使用，查询表达式仍指向原列
+    """
+
+    def __init__(self, raw_attr):
+        self.raw_attr = raw_attr
+        self.cache_attr = f"{raw_attr}_text_cache"
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        raw = getattr(instance, self.raw_attr)
+        if not is_compressed(raw):
+            return raw
+        cached = instance.__dict__.get(self.cache_attr)
+        if cached is not None and cached[0] is raw:
+            return cached[1]
+        value = decompress_value(raw)
+        instance.__dict__[self.cache_attr] = (raw, value)
+        return value
+
+    def __set__(self, instance, value):
+        setattr(instance, self.raw_attr, value)
+
+
+def train_dictionary(samples, size=DICT_SIZE):
+    """
+    根据示例文本训练预置字典：统计重复出现的词组，按可节省的字节数挑选，
+    最常用的内容放在字典末尾，评语固定结构放在最后
+    """
+    counts = Counter()
+    for sample in samples:
+        words = re.split(r"(?<=\s)", sample)
+        for n in range(2, 12):
+            for i in range(len(words) - n + 1):
+                counts["".join(words[i : i + n])] += 1
+
+    candidates = sorted(
+        ((count * len(phrase), phrase) for phrase, count in counts.items() if count > 1),
+        reverse=True,
+    )
+    budget = size - len(FORMAT_SKELETON.encode("utf-8"))
+    chosen, used = [], 0
+    for _, phrase in candidates:
+        if any(phrase in existing for existing in chosen):
+            continue
+        length = len(phrase.encode("utf-8"))
+        if used + length > budget:
+            continue
+        chosen.append(phrase)
+        used += length
+    return "".join(reversed(chosen)).encode("utf-8") + FORMAT_SKELETON.encode("utf-8")
+
+
+def main():
+    """
+    训练字典：python text_compression.py train [样本文件...]
+    默认使用 prompt/ 下的示例评语、示例题目/作文和评分标准
+    """
+    if len(sys.argv) < 2 or sys.argv[1] != "train":
+        print("用法: python text_compression.py train [样本文件...]")
+        sys.exit(2)
+
+    prompt_dir = Path(__file__).parent / "prompt"
+    files = [Path(p) for p in sys.argv[2:]] or sorted(
+        list(prompt_dir.glob("assistant_prompt_*.txt"))
+        + list(prompt_dir.glob("user_prompt_*.txt"))
+        + [prompt_dir / "system_prompt_Evaluate.txt"]
+    )
+    samples = [f.read_text(encoding="utf-8") for f in files]
+    dictionary = train_dictionary(samples)
+
+    output = DICT_DIR / f"history_v{DICT_VERSION}.dict"
+    if output.exists():
+        print(f"✗ {output} 已存在：已有数据依赖该字典，请递增 DICT_VERSION 后再训练")
+        sys.exit(1)
+    DICT_DIR.mkdir(parents=True, exist_ok=True)
+    output.write_bytes(dictionary)
+    print(f"✓ 已根据 {len(files)} 个样本生成字典 {output}（{len(dictionary)} 字节）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+轻量级链路追踪（span）
+
+每个请求是一条 trace（trace_id 即 request_id），请求内的评估器构建、LLM 调用
+（首字等待和流式输出分开记录）、润色以及历史记录的数据库写入记录为嵌套的 span：
+
+    with span("evaluator.init", question=question) as s:
+        s.set_attribute("bank", bank)
+
+    @traced("history.save")
+    def save_history(...): ...
+
+当前 span 保存在 contextvars 中，找不到时使用 g.trace_span（请求的根 span），
+所以流式响应的生成器里创建的 span 也能挂到所属请求下。一条 trace 的根 span 结束后，
+整条 trace 以 OTLP JSON（ExportTraceServiceRequest）格式写成 log/traces.log 中的一行，
+由后台线程批量写入并轮转（复用遥测写入器，压缩分段在 log/traces/）。每行另有 ts 字段
+（最后一个 span 的结束时间），用于按时间轮转和按时间范围读取。
+
+查看单个请求的瀑布图：
+    python tracing.py <request_id> [--since 1d] [--until 1h] [--json]
+"""
+
+import argparse
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from telemetry import LOG_DIR, TelemetryWriter
+from telemetry_segments import SegmentStore, parse_time
+
+TRACE_FILE = LOG_DIR / "traces.log"
+SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "toefl-grader")
+
+# OTLP SpanKind
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+# OTLP StatusCode
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# 根 span 迟迟不结束时最多缓存的 trace 数量，超过后提前导出最旧的
+MAX_PENDING_TRACES = 1000
+# 单条 trace 缓存的 span 数量上限
+MAX_TRACE_SPANS = 1000
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_CURRENT = object()  # parent 参数的默认值：使用当前 span
+
+
+class Span:
+    """一个计时区间；结束后交给 Tracer 导出"""
+
+    __slots__ = (
+        "tracer",
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "kind",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "events",
+        "status",
+        "status_message",
+    )
+
+    def __init__(self, tracer, name, trace_id, parent_id, kind, start_ns, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = start_ns
+        self.end_ns = None
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.events = []
+        self.status = STATUS_OK
+        self.status_message = None
+
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def add_event(self, name: str, time_ns: Optional[int] = None, **attributes: Any):
+        """记录区间内的一个时间点（如首字到达）"""
+        self.events.append((time_ns or time.time_ns(), name, attributes))
+
+    def record_exception(self, exc: BaseException):
+        """标记为错误并记录异常"""
+        self.status = STATUS_ERROR
+        self.status_message = str(exc)
+        self.add_event(
+            "exception",
+            **{"exception.type": type(exc).__name__, "exception.message": str(exc)},
+        )
+
+    def end(self, end_ns: Optional[int] = None):
+        """结束计时（重复调用无效）"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        self.tracer.on_end(self)
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def to_otlp(spans: List[Span]) -> Dict[str, Any]:
+    """把一组 span 转为 OTLP JSON（ExportTraceServiceRequest）"""
+    otlp_spans = []
+    for s in spans:
+        item = {
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": s.kind,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": _otlp_attributes(s.attributes),
+            "status": {"code": s.status},
+        }
+        if s.parent_id:
+            item["parentSpanId"] = s.parent_id
+        if s.status_message:
+            item["status"]["message"] = s.status_message
+        if s.events:
+            item["events"] = [
+                {
+                    "timeUnixNano": str(ts),
+                    "name": name,
+                    "attributes": _otlp_attributes(attrs),
+                }
+                for ts, name, attrs in s.events
+            ]
+        otlp_spans.append(item)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": _otlp_attributes(
+                        {"service.name": SERVICE_NAME, "process.pid": os.getpid()}
+                    )
+                },
+                "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}],
+            }
+        ]
+    }
+
+
+class Tracer:
+    """缓存同一 trace 的 span，根 span 结束时整条导出"""
+
+    def __init__(self, log_file=TRACE_FILE, enabled: Optional[bool] = None, writer=None):
+        """
+        Args:
+            log_file: 导出文件路径
+            enabled: 是否导出，默认读取 TRACING_ENABLED（1）
+            writer: 写入器，默认为写 log_file 的 TelemetryWriter（不输出到控制台）
+        """
+        self.enabled = (
+            enabled if enabled is not None else os.getenv("TRACING_ENABLED", "1") != "0"
+        )
+        self.writer = writer or TelemetryWriter(log_file=log_file, console=False)
+        self._reset_state()
+        # fork 出的 worker 不继承父进程中未结束的 trace（写入器自己在 fork 后重建写线程）
+        os.register_at_fork(after_in_child=self._reset_state)
+
+    def _reset_state(self):
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[str, List[Span]]" = OrderedDict()
+        # 最近已导出的 trace，之后结束的 span（如请求结束后才提交的写操作）直接导出
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+
+    def on_end(self, span: Span):
+        if not self.enabled:
+            return
+        export = []
+        with self._lock:
+            if span.trace_id in self._finished:
+                export.append([span])
+            else:
+                spans = self._pending.setdefault(span.trace_id, [])
+                spans.append(span)
+                if span.parent_id is None or len(spans) >= MAX_TRACE_SPANS:
+                    export.append(self._pending.pop(span.trace_id))
+                    self._finished[span.trace_id] = None
+                    while len(self._finished) > MAX_PENDING_TRACES:
+                        self._finished.popitem(last=False)
+                while len(self._pending) > MAX_PENDING_TRACES:
+                    export.append(self._pending.popitem(last=False)[1])
+        for spans in export:
+            payload = to_otlp(spans)
+            payload["ts"] = max(s.end_ns for s in spans) / 1e9
+            self.writer.submit(payload)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已结束的 trace 写入文件"""
+        return self.writer.flush(timeout)
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """进程内共享的 Tracer。"""
+    return _tracer
+
+
+def current_span() -> Optional[Span]:
+    """当前 span；没有时返回请求的根 span（g.trace_span）"""
+    active = _current_span.get()
+    if active is not None:
+        return active
+    try:
+        from flask import g, has_app_context
+
+        if has_app_context():
+            return g.get("trace_span")
+    except ImportError:
+        pass
+    return None
+
+
+def start_span(
+    name: str,
+    parent=_CURRENT,
+    kind: int = KIND_INTERNAL,
+    trace_id: Optional[str] = None,
+    start_ns: Optional[int] = None,
+    **attributes: Any,
+) -> Span:
+    """
+    创建 span 但不设为当前 span（用于跨生成器/线程的区间），需要调用 end()
+
+    Args:
+        parent: 父 span，默认为当前 span；None 表示新的 trace
+        trace_id: 新 trace 的 id（默认随机生成；请求使用 request_id）
+    """
+    if parent is _CURRENT:
+        parent = current_span()
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = trace_id or uuid.uuid4().hex, None
+    return Span(
+        _tracer, name, trace_id, parent_id, kind, start_ns or time.time_ns(), attributes
+    )
+
+
+@contextmanager
+def use_span(active: Optional[Span]):
+    """把已有的 span 设为当前 span（不结束它），如在写线程中恢复请求的 span"""
+    token = _current_span.set(active)
+    try:
+        yield active
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, parent=_CURRENT, kind: int = KIND_INTERNAL, **attributes: Any):
+    """创建并进入一个 span，退出时结束；异常会记录到 span 上并继续抛出"""
+    current = start_span(name, parent=parent, kind=kind, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            current.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced(name: Optional[str] = None, **attributes: Any):
+    """装饰器：函数的每次调用记录为一个 span（默认以函数名命名）"""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **attributes):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ==================== 读取和瀑布图 ====================
+
+
+def _attribute_value(value: Dict[str, Any]) -> Any:
+    if "intValue" in value:
+        return int(value["intValue"])
+    for key in ("doubleValue", "boolValue", "stringValue"):
+        if key in value:
+            return value[key]
+    return None
+
+
+def load_trace(
+    trace_id: str,
+    log_file=TRACE_FILE,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    从导出文件（含压缩分段）中读取一条 trace 的所有 span
+    since/until: 只读取这段时间内导出的行（Unix时间戳），时间范围外的压缩分段直接跳过
+    Returns: [{trace_id, name, span_id, parent_id, start_ns, end_ns, duration_ms, attributes, status, events}]，按开始时间排序
+    """
+    spans = []
+    for line in SegmentStore(Path(log_file)).iter_lines(since=since, until=until):
+        if trace_id not in line:  # 先做子串预筛
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError:
+            continue
+        for resource in request.get("resourceSpans", []):
+            for scope in resource.get("scopeSpans", []):
+                for item in scope.get("spans", []):
+                    if item.get("traceId") != trace_id:
+                        continue
+                    start_ns = int(item["startTimeUnixNano"])
+                    end_ns = int(item["endTimeUnixNano"])
+                    spans.append(
+                        {
+                            "trace_id": trace_id,
+                            "name": item["name"],
+                            "span_id": item["spanId"],
+                            "parent_id": item.get("parentSpanId"),
+                            "start_ns": start_ns,
+                            "end_ns": end_ns,
+                            "duration_ms": round((end_ns - start_ns) / 1e6, 3),
+                            "attributes": {
+                                a["key"]: _attribute_value(a["value"])
+                                for a in item.get("attributes", [])
+                            },
+                            "status": "error"
+                            if item.get("status", {}).get("code") == STATUS_ERROR
+                            else "ok",
+                            "events": [
+                                {
+                                    "name": e["name"],
+                                    "offset_ms": round(
+                                        (int(e["timeUnixNano"]) - start_ns) / 1e6, 3
+                                    ),
+                                }
+                                for e in item.get("events", [])
+                            ],
+                        }
+                    )
+    return sorted(spans, key=lambda s: s["start_ns"])
+
+
+def render_waterfall(spans: List[Dict[str, Any]], width: int = 50) -> str:
+    """
+    把一条 trace 渲染为文本瀑布图：按父子关系缩进，条形表示在整条 trace 中的起止位置
+    """
+    if not spans:
+        return ""
+    by_id = {s["span_id"]: s for s in spans}
+    children: Dict[Optional[str], List[Dict]] = {}
+    for s in spans:
+        parent = s["parent_id"] if s["parent_id"] in by_id else None
+        children.setdefault(parent, []).append(s)
+
+    ordered = []
+
+    def visit(parent_id, depth):
+        for s in sorted(children.get(parent_id, []), key=lambda s: s["start_ns"]):
+            ordered.append((depth, s))
+            visit(s["span_id"], depth + 1)
+
+    visit(None, 0)
+    begin = min(s["start_ns"] for s in spans)
+    end = max(s["end_ns"] for s in spans)
+    total = max(end - begin, 1)
+
+    labels = [("  " * depth) + s["name"] for depth, s in ordered]
+    label_width = max(len(label) for label in labels)
+    lines = [f"trace {spans[0]['trace_id']}  总耗时 {total / 1e6:.1f} ms"]
+    for label, (_, s) in zip(labels, ordered):
+        left = int((s["start_ns"] - begin) / total * width)
+        right = max(int((s["end_ns"] - begin) / total * width), left + 1)
+        bar = " " * left + "█" * (right - left) + " " * (width - right)
+        marker = " ✗" if s["status"] == "error" else ""
+        lines.append(
+            f"{label.ljust(label_width)}  {(s['start_ns'] - begin) / 1e6:9.1f} "
+            f"{s['duration_ms']:9.1f} ms |{bar}|{marker}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="查看单个请求的链路瀑布图")
+    parser.add_argument("request_id", help="请求ID（即trace_id）")
+    parser.add_argument("--file", default=str(TRACE_FILE), help="trace 导出文件")
+    parser.add_argument("--since", help="只查找该时间之后导出的trace（如 1d、2026-10-19T08:00）")
+    parser.add_argument("--until", help="只查找该时间之前导出的trace")
+    parser.add_argument("--width", type=int, default=50, help="瀑布图宽度")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    try:
+        since, until = parse_time(args.since), parse_time(args.until)
+    except ValueError as e:
+        print(f"错误: 时间格式无效: {e}")
+        sys.exit(1)
+    spans = load_trace(args.request_id, args.file, since, until)
+    if not spans:
+        print(f"错误: 找不到 trace {args.request_id}")
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(spans, ensure_ascii=False, indent=2))
+    else:
+        print(render_waterfall(spans, args.width))
+
+
+if __name__ == "__main__":
+    main()
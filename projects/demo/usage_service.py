@@ -0,0 +1,159 @@
+"""
+LLM token 用量统计服务模块
+
+每次 LLM 调用返回的 usage（流式调用通过 stream_options.include_usage 获取）
+按 天 / 用户 / 题目 / 模型 / 阶段 累加到 token_usage 汇总表，由历史记录写线程批量提交。
+费用按 LLM_PRICING 配置的单价估算，例如：
+    LLM_PRICING="mimo-v2-flash=0.7:2.1,qwen-plus=0.8:2"   # 每百万 token 的输入价:输出价
+"""
+
+import os
+from datetime import date, datetime
+
+from sqlalchemy import func, update
+
+from user_models import db, insert_ignore, TokenUsage, User
+
+# 汇总查询支持的分组字段
+USAGE_GROUP_FIELDS = ("day", "user", "question", "model", "stage")
+
+
+def load_pricing(value=None):
+    """解析单价配置：model -> (输入单价, 输出单价)，单位为每百万 token"""
+    value = os.getenv("LLM_PRICING", "") if value is None else value
+    pricing = {}
+    for entry in value.split(","):
+        if "=" not in entry:
+            continue
+        model, prices = entry.split("=", 1)
+        try:
+            prompt_price, _, completion_price = prices.partition(":")
+            pricing[model.strip()] = (
+                float(prompt_price),
+                float(completion_price or prompt_price),
+            )
+        except ValueError:
+            continue
+    return pricing
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, pricing=None):
+    """估算费用；没有配置单价的模型返回None"""
+    pricing = load_pricing() if pricing is None else pricing
+    price = pricing.get(model)
+    if price is None:
+        return None
+    return round((prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000, 6)
+
+
+def record_usage(
+    user_id, question, model, stage, prompt_tokens, completion_tokens, day=None
+):
+    """
+    累加一次调用的用量（不提交，由调用方提交事务）
+    Returns: None（可作为历史记录写线程的写操作）
+    """
+    keys = {
+        "day": day or datetime.utcnow().date(),
+        "user_id": user_id or 0,
+        "question": str(question or "")[:255],
+        "model": model,
+        "stage": stage,
+    }
+    # 多个进程同时写同一行时，先读后写会丢失其中一方的累加，也可能同时插入导致主键冲突
+    insert_ignore(TokenUsage, calls=0, prompt_tokens=0, completion_tokens=0, **keys)
+    db.session.execute(
+        update(TokenUsage)
+        .filter_by(**keys)
+        .values(
+            calls=TokenUsage.calls + 1,
+            prompt_tokens=TokenUsage.prompt_tokens + (prompt_tokens or 0),
+            completion_tokens=TokenUsage.completion_tokens + (completion_tokens or 0),
+        )
+    )
+
+
+def get_usage_summary(
+    group_by=("model", "stage"),
+    since=None,
+    until=None,
+    user_id=None,
+    question=None,
+    limit=100,
+):
+    """
+    查询用量汇总
+
+    Args:
+        group_by: 分组字段（USAGE_GROUP_FIELDS的子集）
+        since/until: 日期范围（date，含边界）
+        user_id/question: 过滤条件
+        limit: 最多返回的分组数（按总token数降序）
+
+    Returns:
+        dict: { group_by, rows: [...], totals: {...} }
+    """
+    columns = {
+        "day": TokenUsage.day,
+        "user": TokenUsage.user_id,
+        "question": TokenUsage.question,
+        "model": TokenUsage.model,
+        "stage": TokenUsage.stage,
+    }
+    group_columns = [columns[name] for name in group_by]
+    # 费用按模型单价计算，分组不含模型时也需要按模型拆开再合并
+    query_columns = group_columns + ([] if "model" in group_by else [TokenUsage.model])
+    query = db.session.query(
+        *query_columns,
+        func.sum(TokenUsage.calls),
+        func.sum(TokenUsage.prompt_tokens),
+        func.sum(TokenUsage.completion_tokens),
+    )
+    if since:
+        query = query.filter(TokenUsage.day >= since)
+    if until:
+        query = query.filter(TokenUsage.day <= until)
+    if user_id is not None:
+        query = query.filter(TokenUsage.user_id == user_id)
+    if question is not None:
+        query = query.filter(TokenUsage.question == question)
+    query = query.group_by(*query_columns)
+
+    pricing = load_pricing()
+    groups = {}
+    totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": None}
+    for row in query:
+        key = tuple(row[: len(group_columns)])
+        model = row[group_by.index("model") if "model" in group_by else len(key)]
+        calls, prompt_tokens, completion_tokens = (int(v or 0) for v in row[-3:])
+        cost = estimate_cost(model, prompt_tokens, completion_tokens, pricing)
+
+        entry = groups.get(key)
+        if entry is None:
+            entry = groups[key] = dict(zip(group_by, key))
+            entry.update(calls=0, prompt_tokens=0, completion_tokens=0, cost=None)
+        for target in (entry, totals):
+            target["calls"] += calls
+            target["prompt_tokens"] += prompt_tokens
+            target["completion_tokens"] += completion_tokens
+            if cost is not None:
+                target["cost"] = round((target["cost"] or 0) + cost, 6)
+
+    rows = sorted(
+        groups.values(),
+        key=lambda e: -(e["prompt_tokens"] + e["completion_tokens"]),
+    )[:limit]
+    for entry in rows + [totals]:
+        entry["total_tokens"] = entry["prompt_tokens"] + entry["completion_tokens"]
+        if isinstance(entry.get("day"), date):
+            entry["day"] = entry["day"].isoformat()
+
+    if "user" in group_by:
+        user_ids = {entry["user"] for entry in rows}
+        names = dict(
+            db.session.query(User.id, User.username).filter(User.id.in_(user_ids))
+        )
+        for entry in rows:
+            entry["username"] = names.get(entry["user"])
+
+    return {"group_by": list(group_by), "rows": rows, "totals": totals}
@@ -5,11 +5,31 @@
 import uuid
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import insert
+from sqlalchemy.orm import synonym
 from werkzeug.security import generate_password_hash, check_password_hash
+from text_compression import CompressedText, LazyText
 
 db = SQLAlchemy()
 
 
+def insert_ignore(model, /, **values):
+    """
+    插入一行，主键已存在时忽略（INSERT ... ON CONFLICT DO NOTHING / INSERT IGNORE）
+    用于计数类汇总表：并发的首次写入不会因主键冲突而失败，之后用
+    UPDATE ... SET col = col + :n 原子地累加
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        db.session.execute(insert(model).values(**values).prefix_with("IGNORE"))
+        return
+    db.session.execute(dialect_insert(model).values(**values).on_conflict_do_nothing())
+
+
 class User(db.Model):
     """用户模型"""
 
@@ -56,33 +76,45 @@ class History(db.Model):
     """历史记录模型"""
 
     __tablename__ = "histories"
+    # 复合索引与实际访问路径一一对应（user_id 在前，可同时覆盖按用户过滤的查询）：
+    # - 按用户分页列表：user_id + created_at DESC
+    # - 按用户内部序号查询 / 计算下一个序号：user_id + user_sequence
+    # - 按用户查找缺失评分的记录、重算最高分：user_id + score
+    # 旧版本的单列索引由 migrate_add_indexes.py 清理
+    __table_args__ = (
+        db.Index("ix_histories_user_id_created_at", "user_id", "created_at"),
+        db.Index("ix_histories_user_id_user_sequence", "user_id", "user_sequence"),
+        db.Index("ix_histories_user_id_score", "user_id", "score"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(
-        db.Integer, db.ForeignKey("users.id"), nullable=False, index=True
-    )
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
 
     # ID系统：支持两种查询方式
     global_id = db.Column(
         db.String(36), unique=True, nullable=False, index=True
     )  # 全局唯一ID（UUID）
-    user_sequence = db.Column(
-        db.Integer, nullable=False, index=True
-    )  # 用户内部序号（从1开始）
+    user_sequence = db.Column(db.Integer, nullable=False)  # 用户内部序号（从1开始）
+
+    # 大文本字段可选压缩存储（见text_compression），_xxx为存储形态，
+    # 同名属性在访问时才解压；查询表达式（如History.comment.isnot(None)）仍指向原列
 
     # 请求相关字段
-    answer = db.Column(db.Text, nullable=False)  # 原始答案
+    _answer = db.Column("answer", CompressedText, nullable=False)
+    answer = synonym("_answer", descriptor=LazyText("_answer"))  # 原始答案
     question = db.Column(db.String(255), nullable=False)  # 题名（字符串）
 
     # 结果相关字段
-    comment = db.Column(db.Text)  # 评语
-    polished_answer = db.Column(db.Text)  # 润色后的答案
+    _comment = db.Column("comment", CompressedText)
+    comment = synonym("_comment", descriptor=LazyText("_comment"))  # 评语
+    _polished_answer = db.Column("polished_answer", CompressedText)
+    polished_answer = synonym(
+        "_polished_answer", descriptor=LazyText("_polished_answer")
+    )  # 润色后的答案
     score = db.Column(db.Integer)  # 总评分（从评语中解析得出）
 
     # 元数据
-    created_at = db.Column(
-        db.DateTime, default=datetime.utcnow, nullable=False, index=True
-    )
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     # 关联关系已在User模型中定义
 
@@ -110,3 +142,96 @@ class History(db.Model):
             result["parsed_comment"] = parsed_comment
 
         return result
+
+
+class UserScoreStats(db.Model):
+    """用户评分汇总（随评分写入增量维护，可通过 stats_service 重建）"""
+
+    __tablename__ = "user_score_stats"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    scored_count = db.Column(db.Integer, default=0, nullable=False)  # 有评分的记录数
+    score_sum = db.Column(db.Integer, default=0, nullable=False)  # 评分总和
+    best_score = db.Column(db.Integer)  # 最高分
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
+    )
+
+    def to_dict(self):
+        """转换为字典（用于JSON响应）"""
+        return {
+            "scored_count": self.scored_count,
+            "average_score": (
+                round(self.score_sum / self.scored_count, 2)
+                if self.scored_count
+                else None
+            ),
+            "best_score": self.best_score,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class UserWeeklyScore(db.Model):
+    """用户每周评分汇总（week_start为该周周一）"""
+
+    __tablename__ = "user_weekly_scores"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    week_start = db.Column(db.Date, primary_key=True)
+    scored_count = db.Column(db.Integer, default=0, nullable=False)
+    score_sum = db.Column(db.Integer, default=0, nullable=False)
+
+    def to_dict(self):
+        """转换为字典（用于JSON响应）"""
+        return {
+            "week_start": self.week_start.isoformat(),
+            "scored_count": self.scored_count,
+            "average_score": (
+                round(self.score_sum / self.scored_count, 2)
+                if self.scored_count
+                else None
+            ),
+        }
+
+
+class UserQuestionScore(db.Model):
+    """用户每道题的评分汇总"""
+
+    __tablename__ = "user_question_scores"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    question = db.Column(db.String(255), primary_key=True)
+    scored_count = db.Column(db.Integer, default=0, nullable=False)
+    score_sum = db.Column(db.Integer, default=0, nullable=False)
+    best_score = db.Column(db.Integer)
+
+    def to_dict(self):
+        """转换为字典（用于JSON响应）"""
+        return {
+            "question": self.question,
+            "scored_count": self.scored_count,
+            "average_score": (
+                round(self.score_sum / self.scored_count, 2)
+                if self.scored_count
+                else None
+            ),
+            "best_score": self.best_score,
+        }
+
+
+class TokenUsage(db.Model):
+    """LLM token用量汇总（按天、用户、题目、模型、阶段累加，由 usage_service 维护）"""
+
+    __tablename__ = "token_usage"
+
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)  # 未登录用户记为0
+    question = db.Column(db.String(255), primary_key=True)  # 没有题目时为空字符串
+    model = db.Column(db.String(100), primary_key=True)
+    stage = db.Column(db.String(20), primary_key=True)  # evaluate / polish
+    calls = db.Column(db.Integer, default=0, nullable=False)
+    prompt_tokens = db.Column(db.Integer, default=0, nullable=False)
+    completion_tokens = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
+    )